@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import time
 
@@ -9,9 +10,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from .routes_query import router as query_router
 from .routes_ingest import router as ingest_router
 from .routes_feedback import router as feedback_router
-from app.core.deps import init_db
+from app.core.deps import async_engine, init_db
+from app.core.executor import shutdown_executor
 from app.core.rate_limit import RateLimitMiddleware
 from app.core.config import settings
+from app.ingest.embed import is_embedder_warm, query_embedding_cache, warmup_embedder
+from app.rag.chunk_text import chunk_text_cache
+from app.rag.generate import close_gemini_client, start_gemini_client
+from app.rag.query_embedder import query_embedder
+from app.rag.scoring import rerank_score_cache
 
 
 app = FastAPI(title="Enterprise Knowledge Assistant")
@@ -29,7 +36,16 @@ app.add_middleware(RateLimitMiddleware)
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    # "ready" flips to true once the embedding model is loaded and its warmup encode has run
+    return {
+        "status": "ok",
+        "ready": is_embedder_warm(),
+        "embedding_model": settings.embedding_model,
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "query_batching": query_embedder.stats_snapshot(),
+        "rerank_score_cache": rerank_score_cache.stats(),
+        "chunk_text_cache": chunk_text_cache.stats(),
+    }
 
 
 @app.middleware("http")
@@ -56,9 +72,24 @@ app.include_router(ingest_router)
 app.include_router(feedback_router)
 
 
+def _warmup_embedder() -> None:
+    t0 = time.time()
+    try:
+        warmup_embedder()
+        print(json.dumps({"message": "embedder_ready", "model": settings.embedding_model, "latency_ms": int((time.time() - t0) * 1000)}))
+    except Exception as e:
+        print(json.dumps({"error": f"Embedding model warmup failed: {str(e)}"}))
+
+
 @app.on_event("startup")
 async def on_startup():
     init_db()
+    # One pooled Gemini client for the process (None without an API key)
+    await start_gemini_client()
+    # Load and warm up the embedding model in the background so /health can
+    # answer while it loads and the first query doesn't pay for it.
+    loop = asyncio.get_running_loop()
+    app.state.embedder_warmup = loop.run_in_executor(None, _warmup_embedder)
     # Diagnostic: Check if Gemini API key is loaded
     import os
     api_key = settings.gemini_api_key or os.getenv("GEMINI_API_KEY")
@@ -78,3 +109,9 @@ async def on_startup():
         }))
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    shutdown_executor()
+    await close_gemini_client()
+    if async_engine is not None:
+        await async_engine.dispose()
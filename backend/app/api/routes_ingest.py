@@ -5,13 +5,18 @@ import tempfile
 import shutil
 from pathlib import Path
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlalchemy import func
 
-from app.ingest.build_index import build, rebuild_from_database
-from app.core.deps import get_db
+from app.ingest.build_index import add_chunks_to_index, build, delete_document, rebuild_from_database
+from app.ingest.loaders import is_supported_file
+from app.ingest.jobs import IngestJob, JobQueueFull, ingest_jobs
+from app.core.deps import SessionLocal, get_db
 from app.db.models import Document, Chunk
+from .uploads import MalformedUpload, UploadBudgetExceeded, receive_uploads
 
 
 class IngestRequest(BaseModel):
@@ -23,106 +28,70 @@ class IngestRequest(BaseModel):
 router = APIRouter()
 
 
-@router.post("/ingest")
-async def post_ingest(req: IngestRequest):
-    # Process files from paths (adds to database)
-    build(req.paths, req.max_chunk_tokens, req.overlap)
-    # Rebuild index from ALL documents in database
-    rebuild_from_database(req.max_chunk_tokens, req.overlap)
+def _accepted(job: IngestJob) -> dict:
+    return {"status": "accepted", "job_id": job.id, "status_url": f"/ingest/jobs/{job.id}"}
+
+
+def _submit(kind: str, fn, *args, params: dict | None = None) -> IngestJob:
+    try:
+        return ingest_jobs.submit(kind, fn, *args, params=params)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+def _ingest_paths(paths: list[str], max_chunk_tokens: int, overlap: int) -> dict:
+    # Process changed files from paths (adds to database), then rebuild the
+    # index from ALL documents in database if anything changed
+    build(paths, max_chunk_tokens, overlap)
     return {"status": "ok", "message": "Index rebuilt from all documents in database"}
 
 
-@router.post("/ingest/upload")
-async def post_ingest_upload(
-    files: list[UploadFile] = File(...),
-    max_chunk_tokens: int = Form(512),
-    overlap: int = Form(64),
-):
-    """Upload files and ingest them."""
-    # Create temporary directory for uploaded files
-    temp_dir = Path(tempfile.mkdtemp(prefix="eka_upload_"))
-    file_paths = []
-    uploaded_filenames = []
-    
+@router.post("/ingest", status_code=202)
+async def post_ingest(req: IngestRequest):
+    """Queue an ingest of paths; poll GET /ingest/jobs/{job_id} for progress."""
+    job = _submit(
+        "ingest",
+        _ingest_paths,
+        req.paths,
+        req.max_chunk_tokens,
+        req.overlap,
+        params={"paths": req.paths, "max_chunk_tokens": req.max_chunk_tokens, "overlap": req.overlap},
+    )
+    return _accepted(job)
+
+
+def _ingest_uploaded_files(
+    temp_dir: Path,
+    file_paths: list[str],
+    uploaded_filenames: list[str],
+    max_chunk_tokens: int,
+    overlap: int,
+) -> dict:
+    """Ingest saved uploads (runs as a background job) and remove temp_dir afterwards."""
     try:
-        # Save uploaded files to temp directory in parallel
-        import asyncio
-        
-        async def save_file(file: UploadFile) -> tuple[str, str] | None:
-            try:
-                filename = file.filename or "unknown"
-                lower = filename.lower()
-                if not (lower.endswith((".md", ".markdown", ".pdf", ".html", ".htm"))):
-                    return None
-                
-                # Check file size (limit to 50MB per file)
-                content = await file.read()
-                if len(content) > 50 * 1024 * 1024:  # 50MB limit
-                    return None
-                
-                # Handle duplicate filenames by adding a counter
-                file_path = temp_dir / filename
-                counter = 1
-                while file_path.exists():
-                    name_parts = filename.rsplit('.', 1)
-                    if len(name_parts) == 2:
-                        file_path = temp_dir / f"{name_parts[0]}_{counter}.{name_parts[1]}"
-                    else:
-                        file_path = temp_dir / f"{filename}_{counter}"
-                    counter += 1
-                
-                file_path.write_bytes(content)
-                return (str(file_path), file_path.name)
-            except Exception as e:
-                # Log error but don't fail entire upload
-                print(json.dumps({"error": f"Failed to save file {file.filename}: {str(e)}"}))
-                return None
-        
-        # Process files in parallel (continue even if some fail)
-        results = await asyncio.gather(*[save_file(file) for file in files], return_exceptions=True)
-        for result in results:
-            # Skip exceptions and None results
-            if isinstance(result, Exception):
-                continue
-            if result:
-                file_path, filename = result
-                file_paths.append(file_path)
-                uploaded_filenames.append(filename)
-        
-        if not file_paths:
-            return {"status": "error", "message": "No supported files uploaded"}
-        
         # Get document count before processing
-        from app.core.deps import SessionLocal
         db_before = SessionLocal()
         doc_count_before = db_before.query(func.count(Document.id)).scalar()
         chunk_count_before = db_before.query(func.count(Chunk.id)).scalar()
         db_before.close()
         
         # Process files through ingest pipeline (adds to database, skips index building)
-        from app.ingest.build_index import add_chunks_to_index
-        try:
-            new_chunk_ids = build(file_paths, max_chunk_tokens, overlap, skip_index=True)
-        except Exception as e:
-            import traceback
-            return {"status": "error", "message": f"Error processing files: {str(e)}", "traceback": traceback.format_exc()}
+        removed_chunk_ids: list[int] = []
+        new_chunk_ids = build(file_paths, max_chunk_tokens, overlap, skip_index=True, removed_chunk_ids=removed_chunk_ids)
         
-        # Incrementally add only NEW chunks to index (much faster than full rebuild)
+        # Incrementally add only NEW chunks to index and drop the vectors of
+        # chunks they replaced (much faster than full rebuild)
         try:
-            if new_chunk_ids:
+            if new_chunk_ids or removed_chunk_ids:
                 db_for_index = SessionLocal()
                 try:
-                    add_chunks_to_index(new_chunk_ids, db_for_index)
+                    add_chunks_to_index(new_chunk_ids, db_for_index, removed_chunk_ids)
                 finally:
                     db_for_index.close()
         except Exception as e:
-            import traceback
             # If incremental update fails, fall back to full rebuild
             print(json.dumps({"warning": f"Incremental update failed, falling back to full rebuild: {str(e)}"}))
-            try:
-                rebuild_from_database(max_chunk_tokens, overlap)
-            except Exception as rebuild_error:
-                return {"status": "error", "message": f"Error updating index: {str(rebuild_error)}", "traceback": traceback.format_exc()}
+            rebuild_from_database(max_chunk_tokens, overlap)
         
         # Get document count after processing
         db_after = SessionLocal()
@@ -152,23 +121,98 @@ async def post_ingest_upload(
             "total_chunks": chunk_count_after,
             "recent_documents": recent_doc_info,
         }
-    except Exception as e:
-        import traceback
-        return {"status": "error", "message": str(e), "traceback": traceback.format_exc()}
     finally:
         # Clean up temporary directory
         if temp_dir.exists():
             shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-@router.post("/ingest/rebuild")
-async def post_rebuild_index():
-    """Rebuild the FAISS index from all documents in the database."""
+def _form_int(fields: dict, name: str, default: int) -> int:
+    try:
+        return int(fields.get(name, default))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be an integer")
+
+
+@router.post("/ingest/upload", status_code=202)
+async def post_ingest_upload(request: Request):
+    """Stream uploaded files to disk and queue them for ingestion; poll GET /ingest/jobs/{job_id}.
+
+    Multipart form: files (repeated), max_chunk_tokens (default 512), overlap (default 64).
+    Returns 400 with the skipped files if none of them can be ingested.
+    """
+    # Create temporary directory for uploaded files
+    temp_dir = Path(tempfile.mkdtemp(prefix="eka_upload_"))
+    submitted = False
+    
     try:
-        rebuild_from_database()
-        return {"status": "ok", "message": "Index rebuilt from all documents in database"}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+        try:
+            upload = await receive_uploads(request, temp_dir, accept=lambda name: is_supported_file(Path(name)))
+        except UploadBudgetExceeded as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except MalformedUpload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        max_chunk_tokens = _form_int(upload.fields, "max_chunk_tokens", 512)
+        overlap = _form_int(upload.fields, "overlap", 64)
+        file_paths = [str(path) for path, _ in upload.files]
+        uploaded_filenames = [name for _, name in upload.files]
+        if upload.skipped:
+            print(json.dumps({"warning": "Skipped uploaded files", "files": upload.skipped}))
+        
+        if not file_paths:
+            # Nothing to queue: a client error, with the reason each file was skipped
+            return JSONResponse(
+                {"status": "error", "message": "No supported files uploaded", "skipped": upload.skipped},
+                status_code=400,
+            )
+        
+        # The job owns temp_dir from here on and removes it when done
+        job = _submit(
+            "upload",
+            _ingest_uploaded_files,
+            temp_dir,
+            file_paths,
+            uploaded_filenames,
+            max_chunk_tokens,
+            overlap,
+            params={"filenames": uploaded_filenames, "max_chunk_tokens": max_chunk_tokens, "overlap": overlap},
+        )
+        submitted = True
+        return {
+            **_accepted(job),
+            "files_processed": len(file_paths),
+            "filenames": uploaded_filenames,
+            "skipped": upload.skipped,
+        }
+    finally:
+        if not submitted and temp_dir.exists():
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _rebuild_index() -> dict:
+    rebuild_from_database()
+    return {"status": "ok", "message": "Index rebuilt from all documents in database"}
+
+
+@router.post("/ingest/rebuild", status_code=202)
+async def post_rebuild_index():
+    """Queue a rebuild of the FAISS index from all documents in the database."""
+    return _accepted(_submit("rebuild", _rebuild_index))
+
+
+@router.get("/ingest/jobs")
+async def list_ingest_jobs():
+    """Recent ingest jobs, newest first."""
+    return {"status": "ok", "jobs": [job.to_dict() for job in ingest_jobs.list()]}
+
+
+@router.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Status, progress counters and per-stage timings of an ingest job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 
 @router.get("/ingest/status")
@@ -201,3 +245,31 @@ async def get_ingest_status(db = Depends(get_db)):
     }
 
 
+def _document_exists(doc_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(Document.id).filter(Document.id == doc_id).first() is not None
+    finally:
+        db.close()
+
+
+def _delete_document(doc_id: int) -> dict:
+    removed = delete_document(doc_id)
+    if removed is None:
+        # Deleted by an earlier job queued for the same document
+        raise LookupError(f"Document {doc_id} not found")
+    return {"status": "ok", "document_id": doc_id, "chunks_removed": removed}
+
+
+@router.delete("/documents/{doc_id}", status_code=202)
+async def delete_document_by_id(doc_id: int):
+    """Queue deletion of a document, its chunks and their vectors; poll GET /ingest/jobs/{job_id}.
+
+    Runs on the ingest queue like every other index write: it can wait
+    behind a running ingest, or rebuild the index for types that can't
+    delete in place.
+    """
+    if not await run_in_threadpool(_document_exists, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    job = _submit("delete", _delete_document, doc_id, params={"document_id": doc_id})
+    return _accepted(job)
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Dict, List
+
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
+from app.rag.query_embedder import query_embedder
 from app.rag.retriever import retrieve
 from app.rag.prompt_builder import build_prompt
 from app.rag.generate import call_gemini_json
 from sqlalchemy.orm import Session
-from app.core.deps import get_db
+from app.core.deps import AsyncSessionLocal, SessionLocal
 from app.core.config import settings
+from app.core.executor import run_blocking
 from app.db.crud import create_interaction, create_citation
 from app.rag.guardrails import assess_confidence, enforce_min_similarity
 from app.safety.classifier import classify
@@ -18,13 +22,55 @@ class QueryRequest(BaseModel):
     query: str = Field(min_length=3, max_length=2000)
     top_k: int = 20
     k_final: int = 5
+    # ANN search knobs; None uses settings.ivf_nprobe / settings.hnsw_ef_search
+    nprobe: int | None = Field(default=None, ge=1, le=65536)
+    ef_search: int | None = Field(default=None, ge=1, le=65536)
 
 
 router = APIRouter()
 
 
+def _record_interaction(db: Session, query: str, gen: Dict, results: List[Dict]) -> None:
+    telemetry = gen.get("telemetry", {})
+    interaction = create_interaction(
+        db,
+        query=query,
+        llm_model=settings.llm_model,
+        embed_model=settings.embedding_model,
+        latency_ms=int(telemetry.get("latency_ms", 0) or 0),
+        tokens_prompt=int(telemetry.get("tokens_prompt", 0) or 0),
+        tokens_completion=int(telemetry.get("tokens_completion", 0) or 0),
+        cost_usd=float(telemetry.get("cost_usd", 0) or 0.0),
+        confidence=float(gen.get("confidence", 0.0) or 0.0),
+    )
+    for r in results:
+        chunk_id = r.get("chunk_id")
+        if chunk_id:
+            create_citation(db, interaction.id, int(chunk_id), int(r.get("rank", 0)), float(r.get("score", 0.0)))
+
+
+def _persist_sync(query: str, gen: Dict, results: List[Dict]) -> None:
+    db = SessionLocal()
+    try:
+        _record_interaction(db, query, gen, results)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _persist(query: str, gen: Dict, results: List[Dict]) -> None:
+    """Store the interaction and its citations without blocking the event loop."""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(_record_interaction, query, gen, results)
+            await db.commit()
+    else:
+        # No async driver installed: same writes on the query executor
+        await run_blocking(_persist_sync, query, gen, results)
+
+
 @router.post("/query")
-async def post_query(req: QueryRequest, db: Session = Depends(get_db)):
+async def post_query(req: QueryRequest):
     if classify(req.query) == 'unsafe':
         return {
             "answer": "I’m not sure I can help with that.",
@@ -34,7 +80,12 @@ async def post_query(req: QueryRequest, db: Session = Depends(get_db)):
             "snippets": [],
         }
     try:
-        results = retrieve(req.query, req.top_k, req.k_final)
+        # Embedded together with concurrent queries (micro-batching)
+        query_vector = await query_embedder.embed(req.query)
+        # FAISS search and SQLite reads run on the query executor, off the event loop
+        results = await run_blocking(
+            retrieve, req.query, req.top_k, req.k_final, nprobe=req.nprobe, ef_search=req.ef_search, query_vector=query_vector
+        )
     except FileNotFoundError as e:
         return {
             "answer": f"I'm not sure. The search index is not available. {str(e)} Please ingest some documents first.",
@@ -67,23 +118,5 @@ async def post_query(req: QueryRequest, db: Session = Depends(get_db)):
     if "confidence" not in gen or not isinstance(gen["confidence"], (int, float)):
         gen["confidence"] = assess_confidence(results)
     # persist interaction and citations if possible
-    telemetry = gen.get("telemetry", {})
-    interaction = create_interaction(
-        db,
-        query=req.query,
-        llm_model=settings.llm_model,
-        embed_model=settings.embedding_model,
-        latency_ms=int(telemetry.get("latency_ms", 0) or 0),
-        tokens_prompt=int(telemetry.get("tokens_prompt", 0) or 0),
-        tokens_completion=int(telemetry.get("tokens_completion", 0) or 0),
-        cost_usd=float(telemetry.get("cost_usd", 0) or 0.0),
-        confidence=float(gen.get("confidence", 0.0) or 0.0),
-    )
-    for r in results:
-        chunk_id = r.get("chunk_id")
-        if chunk_id:
-            create_citation(db, interaction.id, int(chunk_id), int(r.get("rank", 0)), float(r.get("score", 0.0)))
-    db.commit()
+    await _persist(req.query, gen, results)
     return gen
-
-
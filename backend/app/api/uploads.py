@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+from app.core.config import settings
+
+
+# Streaming multipart uploads.
+#
+# The request body is parsed as it arrives and each file part is written
+# straight to the upload directory, so a worker holds one network chunk per
+# upload in memory instead of whole files. Each chunk is parsed in the
+# threadpool, since the part callbacks open, write and close files. The
+# per-file size limit is checked on every chunk, and every body byte being
+# received counts against a per-process budget until the request has been
+# handed off.
+
+MAX_FIELD_BYTES = 1024  # plain form fields are small numbers
+
+
+class UploadBudgetExceeded(Exception):
+    """Raised when concurrent uploads would exceed settings.upload_max_inflight_bytes."""
+
+
+class MalformedUpload(ValueError):
+    """Raised for a request body that is not valid multipart/form-data."""
+
+
+class UploadBudget:
+    """Thread-safe count of upload bytes in flight in this process."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int) -> None:
+        with self._lock:
+            if self.used + n > self.limit:
+                raise UploadBudgetExceeded(f"Upload capacity exhausted ({self.used} of {self.limit} bytes in flight)")
+            self.used += n
+
+    def release(self, n: int) -> None:
+        with self._lock:
+            self.used = max(self.used - n, 0)
+
+
+upload_budget = UploadBudget(settings.upload_max_inflight_bytes)
+
+
+def unique_path(directory: Path, filename: str) -> Path:
+    """directory/filename, adding a counter if the name is taken (never leaves directory)."""
+    filename = Path(filename.replace("\\", "/")).name or "unknown"
+    file_path = directory / filename
+    counter = 1
+    while file_path.exists():
+        name_parts = filename.rsplit('.', 1)
+        if len(name_parts) == 2:
+            file_path = directory / f"{name_parts[0]}_{counter}.{name_parts[1]}"
+        else:
+            file_path = directory / f"{filename}_{counter}"
+        counter += 1
+    return file_path
+
+
+class StreamedUploads:
+    """Result of receive_uploads: saved files, small form fields and skipped files."""
+
+    def __init__(self) -> None:
+        self.files: List[Tuple[Path, str]] = []  # (saved path, saved file name)
+        self.fields: Dict[str, str] = {}
+        self.skipped: List[Dict[str, str]] = []  # {"filename", "reason"}
+
+
+class _PartWriter:
+    """python-multipart callbacks that route each part to a file or a form field."""
+
+    def __init__(self, dest_dir: Path, file_field: str, accept: Callable[[str], bool], max_file_bytes: int) -> None:
+        self.dest_dir = dest_dir
+        self.file_field = file_field
+        self.accept = accept
+        self.max_file_bytes = max_file_bytes
+        self.result = StreamedUploads()
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._reset_part()
+
+    def _reset_part(self) -> None:
+        self._name = ""
+        self._filename: str | None = None
+        self._out: BinaryIO | None = None
+        self._path: Path | None = None
+        self._size = 0
+        self._field = bytearray()
+        self._discard = False
+
+    def callbacks(self) -> Dict[str, Callable]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._reset_part()
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if filename is None:
+            return
+        self._filename = filename.decode("utf-8", "replace") or "unknown"
+        if self._name != self.file_field or not self.accept(self._filename):
+            self._discard = True
+            return
+        self._path = unique_path(self.dest_dir, self._filename)
+        # Buffered so the disk sees fixed-size writes whatever the network chunking
+        self._out = self._path.open("wb", buffering=settings.upload_write_buffer_bytes)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._discard:
+            return
+        if self._filename is None:
+            self._field += data[start:end]
+            if len(self._field) > MAX_FIELD_BYTES:
+                raise MalformedUpload(f"Form field {self._name!r} is too large")
+            return
+        self._size += end - start
+        if self._size > self.max_file_bytes:
+            # Over the limit: drop what was written and ignore the rest of this part
+            self._abort_file()
+            self.result.skipped.append({"filename": self._filename, "reason": "too_large"})
+            self._discard = True
+            return
+        if self._out is not None:
+            self._out.write(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._filename is None:
+            if self._name:
+                self.result.fields[self._name] = self._field.decode("utf-8", "replace")
+        elif self._out is not None:
+            self._out.close()
+            self.result.files.append((self._path, self._path.name))
+        elif self._discard and not any(s["filename"] == self._filename for s in self.result.skipped):
+            self.result.skipped.append({"filename": self._filename, "reason": "unsupported"})
+        self._reset_part()
+
+    def _abort_file(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if self._path is not None:
+            self._path.unlink(missing_ok=True)
+            self._path = None
+
+    def close(self) -> None:
+        self._abort_file()
+
+
+async def receive_uploads(
+    request: Request,
+    dest_dir: Path,
+    accept: Callable[[str], bool],
+    file_field: str = "files",
+    max_file_bytes: int | None = None,
+    budget: UploadBudget | None = None,
+) -> StreamedUploads:
+    """Stream a multipart/form-data body to dest_dir, enforcing size limits as bytes arrive.
+
+    Files whose name fails accept() or that exceed max_file_bytes are skipped
+    (and listed in .skipped). Raises UploadBudgetExceeded when the process
+    upload budget is exhausted and MalformedUpload for a bad body; files
+    already completed are left in dest_dir for the caller to remove.
+    """
+    max_file_bytes = settings.upload_max_file_bytes if max_file_bytes is None else max_file_bytes
+    budget = budget or upload_budget
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MalformedUpload("Expected a multipart/form-data body")
+
+    writer = _PartWriter(dest_dir, file_field, accept, max_file_bytes)
+    parser = MultipartParser(boundary, writer.callbacks())
+    reserved = 0
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            budget.acquire(len(chunk))
+            reserved += len(chunk)
+            try:
+                await run_in_threadpool(parser.write, chunk)
+            except MalformedUpload:
+                raise
+            except Exception as e:
+                raise MalformedUpload(str(e))
+        await run_in_threadpool(parser.finalize)
+    finally:
+        await run_in_threadpool(writer.close)
+        budget.release(reserved)
+    return writer.result
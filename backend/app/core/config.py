@@ -7,14 +7,83 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     gemini_api_key: str | None = None
     embedding_model: str = "BAAI/bge-large-en-v1.5"
+    embedding_device: str | None = None
+    embedding_backend: str = "torch"  # torch | onnx (ONNX Runtime on CPU, see app.ingest.onnx_backend)
+    embedding_batch_tokens: int = 16384  # padded tokens per forward pass (batch size x longest text)
+    embedding_max_batch_size: int = 256
+    enable_embedding_cache: bool = True  # reuse stored chunk vectors across rebuilds
+    query_embedding_cache_size: int = 2048
+    query_embedding_cache_ttl_seconds: float = 3600.0
+    query_batch_window_ms: float = 0.0  # extra wait to collect concurrent /query embeddings when a worker is idle
+    query_batch_max_size: int = 64
+    query_batch_workers: int = 1  # threads running batched query encodes
     llm_model: str = "gemini-1.5-pro"
-    vector_store: str = "faiss"
+    gemini_base_url: str = "https://generativelanguage.googleapis.com"
+    gemini_timeout_seconds: float = 30.0  # deadline per generation call, queueing and retries included
+    gemini_connect_timeout_seconds: float = 5.0
+    gemini_max_retries: int = 2  # on connection errors, timeouts, 429 and 5xx
+    gemini_backoff_base_seconds: float = 0.5  # full-jitter exponential backoff between retries
+    gemini_backoff_max_seconds: float = 8.0
+    gemini_max_concurrency: int = 16  # generation calls in flight per process
+    gemini_max_connections: int = 16  # pooled keep-alive connections
+    gemini_keepalive_seconds: float = 60.0
+    vector_store: str = "faiss"  # faiss (exact flat) | hnsw | ivf_flat | ivf_pq
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 4096
+    ivf_nprobe: int = 16
+    pq_m: int = 64
+    pq_nbits: int = 8
+    vector_codec: str = "none"  # none | fp16 | sq8 | pq - compressed vector storage for the base index
+    rescore_candidates: int = 4  # compressed bases: fetch k x this many candidates, re-score exactly (<= 1 = off)
+    index_train_size: int = 200000
+    index_mmap: bool = False  # memory-map the index read-only instead of loading it into each worker
+    ivf_on_disk: bool = False  # keep IVF inverted lists in a separate mmapped .ivfdata file
+    segment_compact_threshold: int = 50000  # delta-segment vectors (or tombstones) before compaction
+    segment_max_count: int = 32
     index_path: str = "backend/data/indices/faiss.index"
-    doc_meta_path: str = "backend/data/indices/meta.jsonl"
+    doc_meta_path: str = "backend/data/indices/meta.bin"  # a .jsonl path keeps the legacy format
+    index_reload_interval_seconds: float = 2.0
+    ingest_workers: int = 1  # background ingest jobs run concurrently (index writes are serialized)
+    ingest_max_pending_jobs: int = 16
+    ingest_job_history: int = 100
+    ingest_batch_chunks: int = 1024  # chunks embedded + indexed per batch when rebuilding
+    ingest_commit_docs: int = 50  # documents per DB commit (checkpoint) in build()
+    ingest_parse_workers: int = 0  # >1 parses files in a process pool (0/1 = in-process)
+    ingest_parse_max_in_flight: int = 0  # files submitted ahead of the consumer (0 = 2 x workers)
+    ingest_pipeline: bool = False  # overlap parse, DB writes, embedding and indexing on separate threads
+    ingest_pipeline_queue_size: int = 4  # batches buffered between pipeline stages
+    ingest_segment_vectors: int = 20000  # the pipeline publishes a delta segment about every this many vectors
+    upload_max_file_bytes: int = 50 * 1024 * 1024
+    upload_max_inflight_bytes: int = 512 * 1024 * 1024  # request bytes being received at once, per process
+    upload_write_buffer_bytes: int = 1024 * 1024
     db_url: str = "sqlite:///./eka.db"
+    async_db_url: str = ""  # async driver URL for the /query path ("" = derived from db_url, sqlite+aiosqlite)
+    query_executor_workers: int = 4  # threads running retrieval (FAISS, SQLite reads) off the event loop
     enable_reranker: bool = False
+    reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    reranker_backend: str = "torch"  # torch | onnx
+    reranker_max_length: int = 512  # tokens per (query, chunk text) pair, truncated beyond
+    reranker_batch_size: int = 32
+    reranker_max_pairs: int = 50  # candidates reranked per request (the rest keep retrieval order)
+    rerank_cache_size: int = 20000  # (query, chunk) scores kept across requests
+    rerank_cache_ttl_seconds: float = 3600.0
+    chunk_text_cache_size: int = 50000  # chunk texts kept in memory for retrieval (0 = off)
+    chunk_text_cache_ttl_seconds: float = 600.0  # bounds staleness after ingest in another process
+    onnx_quantization: str = "none"  # none | arm64 | avx2 | avx512 | avx512_vnni (dynamic int8)
+    onnx_threads: int = 0  # ONNX Runtime intra-op threads (0 = one per core)
+    onnx_model_dir: str = "backend/data/onnx"
     enable_langfuse: bool = False
     enable_query_expansion: bool = False
+    query_expansion_mode: str = "titles"  # titles (re-encode query + top titles) | vector (Rocchio, no model call)
+    rocchio_alpha: float = 1.0  # weight of the original query vector
+    rocchio_beta: float = 0.5  # weight of the mean of the top hits' vectors
+    rocchio_top_n: int = 3  # top hits mixed into the query vector
+    retrieval_mode: str = "dense"  # dense | hybrid (dense + SQLite FTS5 BM25, fused by reciprocal rank)
+    rrf_k: int = 60  # reciprocal-rank fusion constant: score = sum 1 / (rrf_k + rank)
+    lexical_top_k: int = 0  # BM25 candidates fused per query (0 = same as top_k)
+    lexical_search_workers: int = 4  # threads running BM25 searches alongside the dense search
     rate_limit_per_minute: int = 60
     citation_sim_threshold: float = 0.30
     citation_coverage_threshold: float = 0.70
@@ -2,11 +2,12 @@ from __future__ import annotations
 
 from typing import Generator
 
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 
 from app.core.config import settings
 from app.db.base import Base
+from app.db.fts import ensure_fts
 
 
 # Optimize SQLite for better performance
@@ -44,8 +45,54 @@ if settings.db_url.startswith("sqlite"):
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _async_db_url(url: str) -> str | None:
+    """Async driver URL for db_url (settings.async_db_url wins), None if there is no known one."""
+    if settings.async_db_url:
+        return settings.async_db_url
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return None
+
+
+# Async engine for the /query path, so DB round-trips don't block the event
+# loop. Needs aiosqlite and greenlet (SQLAlchemy[asyncio]); without them
+# AsyncSessionLocal is None and callers run the sync session in a thread.
+async_engine = None
+AsyncSessionLocal = None
+_async_url = _async_db_url(settings.db_url)
+if _async_url is not None:
+    try:
+        import greenlet  # noqa: F401  (SQLAlchemy's asyncio layer runs on it)
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        # Raises ImportError if the async driver (aiosqlite) is missing
+        async_engine = create_async_engine(_async_url, connect_args=sqlite_connect_args, pool_pre_ping=True, echo=False)
+    except ImportError:
+        async_engine = None
+    if async_engine is not None:
+        if _async_url.startswith("sqlite") and settings.db_url.startswith("sqlite"):
+            event.listen(async_engine.sync_engine, "connect", set_sqlite_pragma)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
 def init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    ensure_fts(engine)
+
+
+def _add_missing_columns() -> None:
+    """create_all() never alters existing tables; add columns introduced since the DB was created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
 
 
 def get_db() -> Generator[Session, None, None]:
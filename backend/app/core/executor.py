@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+# Threads for the blocking parts of request handling (FAISS search, SQLite
+# reads, NumPy), so async endpoints never run them on the event loop. The
+# pool is sized by settings.query_executor_workers: enough to overlap
+# queries, few enough that they don't thrash the cores FAISS already uses.
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def query_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.query_executor_workers, thread_name_prefix="eka-query"
+                )
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run fn(*args, **kwargs) on the query executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(query_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
@@ -8,8 +8,12 @@ from sqlalchemy.orm import Session
 from .models import Document, Chunk, Interaction, Citation, Feedback
 
 
+def find_document(db: Session, source: str, title: str) -> Optional[Document]:
+    return db.query(Document).filter(Document.source == source, Document.title == title).first()
+
+
 def get_or_create_document(db: Session, source: str, title: str, url: str = "", revision_date: str = "") -> Document:
-    doc = db.query(Document).filter(Document.source == source, Document.title == title).first()
+    doc = find_document(db, source, title)
     if doc:
         return doc
     doc = Document(source=source, title=title, url=url, revision_date=revision_date)
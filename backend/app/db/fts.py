@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import re
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+# BM25 full-text index over chunks.text (SQLite FTS5).
+#
+# chunks_fts is an external-content table: it stores only the inverted
+# index and reads the text from chunks. Triggers update it in the same
+# transaction as every chunk insert/update/delete, so build(),
+# add_chunks_to_index(), the pipeline and delete_document() keep it in
+# sync without any extra code. Creating it on an existing database
+# indexes the chunks already there.
+
+FTS_TABLE = "chunks_fts"
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE OF text ON chunks BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+
+def ensure_fts(engine: Engine) -> None:
+    """Create the FTS table and its triggers if missing (SQLite only), indexing existing chunks once."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        for stmt in _DDL:
+            conn.execute(text(stmt))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def match_expression(query: str) -> str:
+    """FTS5 query matching any of the query's terms.
+
+    Each whitespace-separated term is quoted as a phrase, so identifiers like
+    ERR-1234 or sku_42.b match their exact token sequence and user input never
+    hits FTS5 query syntax.
+    """
+    terms = []
+    for term in query.split():
+        if not re.search(r"\w", term):
+            continue
+        phrase = '"' + term.replace('"', '""') + '"'
+        if phrase not in terms:
+            terms.append(phrase)
+    return " OR ".join(terms)
+
+
+def search_fts(db: Session, query: str, k: int) -> List[Tuple[int, float]]:
+    """Top-k (chunk id, bm25 score) for query, best first (higher is better)."""
+    expr = match_expression(query)
+    if not expr or k <= 0:
+        return []
+    rows = db.execute(
+        text(f"SELECT rowid, bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q ORDER BY rank LIMIT :k"),
+        {"q": expr, "k": k},
+    ).all()
+    # bm25() is lower-is-better; flip it so scores sort like similarities
+    return [(int(cid), -float(score)) for cid, score in rows]
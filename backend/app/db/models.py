@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, LargeBinary
 from sqlalchemy.orm import relationship
 
 from .base import Base
@@ -14,6 +14,8 @@ class Document(Base):
     title = Column(String)
     url = Column(String)
     revision_date = Column(String)
+    content_hash = Column(String(64))  # sha256 of source bytes + chunking params at last ingest
+    revision = Column(Integer, default=0)  # bumped every time the content changes
     created_at = Column(DateTime, default=datetime.utcnow)
     chunks = relationship('Chunk', back_populates='document')
 
@@ -61,3 +63,11 @@ class Feedback(Base):
     comment = Column(Text)
 
 
+class EmbeddingCache(Base):
+    __tablename__ = 'embedding_cache'
+    key = Column(String(64), primary_key=True)  # sha256(embedder fingerprint + chunk text)
+    model = Column(String)
+    dim = Column(Integer)
+    vector = Column(LargeBinary)  # float32 bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    used_at = Column(DateTime, default=datetime.utcnow)  # last encode_with_cache() that read or wrote it
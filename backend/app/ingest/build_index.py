@@ -2,295 +2,753 @@ from __future__ import annotations
 
 import argparse
 import faiss  # type: ignore
+import hashlib
+import heapq
 import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 
 import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
 
 from app.core.config import settings
 from app.core.deps import SessionLocal, init_db
-from app.db.crud import get_or_create_document, create_chunk
+from app.db.crud import find_document, get_or_create_document, create_chunk
 from app.db.models import Chunk, Document
-from .loaders import iter_documents
-from .clean import normalize_text
-from .chunk import iter_chunk_records
-from .embed import BGEEmbedder
+from .loaders import is_supported_file, iter_document_paths
+from .parallel import iter_parsed
+from .embed import get_embedder, is_embedder_loaded
+from .embedding_cache import encode_with_cache, prune_embedding_cache
+from .jobs import record_stage, report_progress
+from .index_factory import (
+    create_index,
+    describe,
+    is_id_mapped,
+    is_lossy,
+    new_index,
+    prepare_for_update,
+    read_index,
+    remove_ids,
+    train_index,
+    write_index,
+)
+from app.rag.chunk_text import invalidate_chunk_texts
+from app.rag.meta_store import migrate_legacy_meta, open_meta_store, write_meta_store
+from app.rag.segments import (
+    empty_manifest,
+    hidden_ids,
+    needs_compaction,
+    read_manifest,
+    remove_stale_segments,
+    segment_paths,
+    tombstones,
+    write_manifest,
+)
+from app.rag.vector_file import VectorFile, VectorFileWriter, vectors_path
+from app.rag.vector_store import file_stamp, invalidate_store
 
 
-def build(paths: list[str], max_chunk_tokens: int, overlap: int, skip_index: bool = False) -> List[int]:
-    init_db()
-    db = SessionLocal()
-    
-    # Collect documents from both files and directories
-    docs: List[dict] = []
+# Serializes every writer of the index files (rebuilds, delta segments, compaction)
+_index_write_lock = threading.RLock()
+_compaction_lock = threading.Lock()
+_checkpoint_lock = threading.Lock()
+_compaction_thread: threading.Thread | None = None
+# Rebuilds in progress in this process; compaction waits for them (see compact_segments)
+_rebuilds_running = 0
+_rebuilds_lock = threading.Lock()
+
+
+def embed_batch_stats() -> Dict | None:
+    """Batching stats of the shared model since it loaded (None if nothing loaded it)."""
+    return get_embedder().padding_stats() if is_embedder_loaded() else None
+
+
+def _chunk_meta(chunk: Chunk) -> dict:
+    return {
+        "title": chunk.document.title or "",
+        "source": chunk.document.source or "",
+        "url": chunk.document.url or "",
+        "section": chunk.section or "",
+        "position": chunk.position or 0,
+        "chunk_id": chunk.id,
+        "text": chunk.text[:700] if chunk.text else "",  # Preview for UI
+    }
+
+
+def _meta_sort_key(meta: dict) -> int:
+    chunk_id = meta.get("chunk_id")
+    return chunk_id if chunk_id is not None else -1
+
+
+def _write_metas(metas: Iterable[dict], path: Path) -> None:
+    """Write the meta file atomically.
+
+    A .jsonl path keeps the legacy JSON-lines format; anything else gets the
+    columnar, memory-mapped format from app.rag.meta_store.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix != ".jsonl":
+        write_meta_store(path, metas)
+        return
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for m in metas:
+            f.write(json.dumps(m) + "\n")
+    os.replace(tmp, path)
+
+
+def _merged_metas(path: Path, new_metas: List[dict], drop_ids: Set[int]) -> Iterator[dict]:
+    """Existing metas minus drop_ids merged with new_metas, kept sorted by chunk_id."""
+    existing = (m for m in open_meta_store(path) if m.get("chunk_id") not in drop_ids)
+    return heapq.merge(existing, sorted(new_metas, key=_meta_sort_key), key=_meta_sort_key)
+
+
+def _commit_base(
+    index,
+    metas: Iterable[dict] | Path,
+    index_path: Path,
+    meta_path: Path,
+    previous: dict | None,
+    vectors: Path | None = None,
+    carry_from: int | None = None,
+) -> None:
+    """Write a new base index + metas and a manifest pointing at them.
+
+    metas may be an already written meta file, which is moved into place.
+    vectors is a written vector file with the exact vectors of a compressed
+    index (see app.rag.vector_file); without one any old file is removed.
+    The new manifest keeps the segments and tombstones of previous with a
+    seq >= carry_from (writes the new base may predate); with carry_from
+    None the base covers them all and the manifest has none.
+    """
+    write_index(index, index_path)
+    if isinstance(metas, Path):
+        os.replace(metas, meta_path)
+    else:
+        _write_metas(metas, meta_path)
+    exact_path = vectors_path(index_path)
+    if vectors is not None:
+        os.replace(vectors, exact_path)
+    else:
+        exact_path.unlink(missing_ok=True)
+    manifest = empty_manifest(next_seq=(previous or {}).get("next_seq", 1))
+    if previous and carry_from is not None:
+        manifest["segments"] = [seg for seg in previous["segments"] if seg["seq"] >= carry_from]
+        manifest["tombstones"] = {cid: seq for cid, seq in previous["tombstones"].items() if seq >= carry_from}
+    manifest["base"] = {"index": list(file_stamp(index_path)), "meta": list(file_stamp(meta_path))}
+    if vectors is not None:
+        manifest["base"]["vectors"] = list(file_stamp(exact_path))
+    write_manifest(index_path, manifest)
+    remove_stale_segments(index_path, manifest)
+    invalidate_store()
+
+
+def _building_vectors_path(index_path: Path) -> Path:
+    return vectors_path(index_path).with_name(vectors_path(index_path).name + ".building")
+
+
+# Ingest checkpoint: DB changes that are committed but not yet in the index.
+#
+#   {"rebuild": bool, "added": [chunk ids], "removed": [chunk ids]}
+#
+# build() records each batch before committing it; the index update that
+# covers the batch (rebuild_from_database / add_chunks_to_index) clears it.
+# After an interrupted run the next build() resumes from here: committed
+# documents are skipped by content hash and the pending index work is redone.
+
+def _checkpoint_path() -> Path:
+    index_path = Path(settings.index_path)
+    return index_path.with_name(index_path.name + ".checkpoint.json")
+
+
+def read_checkpoint() -> dict:
+    try:
+        data = json.loads(_checkpoint_path().read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        data = {}
+    return {"rebuild": bool(data.get("rebuild")), "added": list(data.get("added", [])), "removed": list(data.get("removed", []))}
+
+
+def update_checkpoint(
+    rebuild: bool | None = None,
+    added: Iterable[int] = (),
+    removed: Iterable[int] = (),
+    clear_added: Iterable[int] = (),
+    clear_removed: Iterable[int] = (),
+) -> None:
+    with _checkpoint_lock:
+        cp = read_checkpoint()
+        if rebuild is not None:
+            cp["rebuild"] = rebuild
+        cp["added"] = sorted((set(cp["added"]) | set(added)) - set(clear_added))
+        cp["removed"] = sorted((set(cp["removed"]) | set(removed)) - set(clear_removed))
+        path = _checkpoint_path()
+        if not cp["rebuild"] and not cp["added"] and not cp["removed"]:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(cp), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _is_upload_path(path_str: str) -> bool:
+    path_lower = path_str.lower()
+    return ("eka_upload_" in path_lower or 
+            path_str.startswith("/tmp") or 
+            "\\temp\\" in path_lower or
+            "appdata\\local\\temp" in path_lower)
+
+
+def collect_files(paths: list[str]) -> List[Tuple[Path, str, str]]:
+    """Expand paths into (file, source, title) without reading any file contents."""
+    files: List[Tuple[Path, str, str]] = []
     for path_str in paths:
         path = Path(path_str)
-        if path.is_file():
-            # Single file - use load_file_from_path
-            from .loaders import load_file_from_path
-            doc = load_file_from_path(path)
-            if doc:
+        if path.is_dir():
+            for p in iter_document_paths([path_str]):
+                files.append((p, str(p), p.stem))
+        elif is_supported_file(path):
+            if _is_upload_path(path_str):
                 # For uploaded files, use filename as source instead of temp path
-                path_lower = path_str.lower()
-                if ("eka_upload_" in path_lower or 
-                    path_str.startswith("/tmp") or 
-                    "\\temp\\" in path_lower or
-                    "appdata\\local\\temp" in path_lower):
-                    # Use filename as both source and ensure title is clean
-                    doc["source"] = f"uploaded:{path.name}"
-                    doc["title"] = path.stem  # Ensure title is filename without extension
-                docs.append(doc)
-        elif path.is_dir():
-            # Directory - use iter_documents
-            docs.extend(list(iter_documents([path_str])))
-        else:
-            # Try as file path even if it doesn't exist yet
-            from .loaders import load_file_from_path
-            doc = load_file_from_path(path)
-            if doc:
-                path_lower = path_str.lower()
-                if ("eka_upload_" in path_lower or 
-                    path_str.startswith("/tmp") or 
-                    "\\temp\\" in path_lower or
-                    "appdata\\local\\temp" in path_lower):
-                    doc["source"] = f"uploaded:{path.name}"
-                    doc["title"] = path.stem  # Ensure title is filename without extension
-                docs.append(doc)
+                files.append((path, f"uploaded:{path.name}", path.stem))
+            else:
+                files.append((path, str(path), path.stem))
+    return files
+
+
+def _content_hash(path: Path, max_chunk_tokens: int, overlap: int) -> str:
+    """sha256 of the file bytes plus the chunking params that shaped its chunks."""
+    h = hashlib.sha256(f"{max_chunk_tokens}:{overlap}\x00".encode("utf-8"))
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def changed_files(
+    db, files: List[Tuple[Path, str, str]], max_chunk_tokens: int, overlap: int, counts: Dict[str, int]
+) -> Iterator[Tuple[Path, str, str, str, int | None]]:
+    """(path, source, title, content_hash, doc_id) for files whose content changed since the last ingest."""
+    for path, source, title in files:
+        content_hash = _content_hash(path, max_chunk_tokens, overlap)
+        doc_row = find_document(db, source=source, title=title)
+        if doc_row is not None and doc_row.content_hash == content_hash:
+            # Byte-for-byte identical to the last ingest: nothing to do
+            counts["unchanged"] += 1
+            report_progress(docs_unchanged=1)
+            continue
+        yield path, source, title, content_hash, doc_row.id if doc_row is not None else None
+
+
+def store_document(db, task: Tuple[Path, str, str, str, int | None], parsed: dict) -> Tuple[List[Chunk], List[int]]:
+    """Replace a document's chunks with parsed ones (flushed, not committed). Returns (new chunks, old chunk ids)."""
+    path, source, title, content_hash, doc_id = task
+    d = parsed["doc"]
+    doc_row = db.get(Document, doc_id) if doc_id is not None else None
+    if doc_row is None:
+        doc_row = get_or_create_document(db, source=source, title=title, url=d.get("url", ""))
+    
+    # Delete existing chunks for this document to avoid duplicates
+    old_ids = [cid for (cid,) in db.query(Chunk.id).filter(Chunk.doc_id == doc_row.id)]
+    deleted_count = db.query(Chunk).filter(Chunk.doc_id == doc_row.id).delete()
+    if deleted_count > 0:
+        db.flush()  # Flush delete before adding new chunks
+    
+    doc_chunks = [
+        Chunk(
+            doc_id=doc_row.id,
+            text=ch["text"],
+            tokens=ch["tokens"],
+            section=ch["section"],
+            position=ch["position"],
+            meta_json=json.dumps(ch["meta"]),
+        )
+        for ch in parsed["chunks"]
+    ]
+    
+    # Bulk insert all chunks for this document
+    if doc_chunks:
+        db.add_all(doc_chunks)
+        db.flush()  # Get IDs without committing
+    
+    doc_row.content_hash = content_hash
+    doc_row.revision = (doc_row.revision or 0) + 1
+    doc_row.revision_date = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc).isoformat()
+    return doc_chunks, old_ids
+
+
+def log_parse_failure(path: Path, error: str) -> None:
+    # One bad file doesn't fail the whole ingest
+    report_progress(docs_failed=1)
+    print(json.dumps({"error": f"Failed to parse {path}: {error.splitlines()[0]}", "traceback": error}))
+
+
+def build(
+    paths: list[str],
+    max_chunk_tokens: int,
+    overlap: int,
+    skip_index: bool = False,
+    removed_chunk_ids: List[int] | None = None,
+) -> List[int]:
+    """Ingest files into the database, skipping files whose content hash is unchanged.
+
+    Changed files only replace their own chunks. Returns the new chunk ids
+    when skip_index is set (for add_chunks_to_index); the ids of the chunks
+    they replaced are appended to removed_chunk_ids if given. Otherwise
+    rebuilds the index from the database if anything changed.
+
+    Documents are committed every settings.ingest_commit_docs, so a run that
+    is interrupted can simply be repeated: committed documents are skipped
+    and the index work they still need is picked up from the checkpoint.
+
+    With settings.ingest_pipeline (and not skip_index) the run goes through
+    the threaded pipeline in app.ingest.pipeline instead, which updates the
+    index itself (as a delta segment). skip_index runs stay serial: their
+    caller indexes the returned ids itself.
+    """
+    if settings.ingest_pipeline and not skip_index:
+        from .pipeline import run_pipeline
+
+        run_pipeline(paths, max_chunk_tokens, overlap, removed_chunk_ids)
+        return []
+
+    init_db()
+    db = SessionLocal()
+    
+    # Index work owed by an earlier, interrupted run
+    cp = read_checkpoint()
+    leftover = cp["rebuild"] or bool(cp["added"]) or bool(cp["removed"])
+    
+    files = collect_files(paths)
+    report_progress(docs_total=len(files))
+    t_load = time.perf_counter()
     
     total_chunks = 0
-    chunk_texts: List[str] = []
-    metas: List[dict] = []
+    changed_docs = 0
+    failed_docs = 0
+    counts = {"unchanged": 0}
     new_chunk_ids: List[int] = []  # Collect all new chunk IDs across all documents
 
-    # Batch process all documents for better performance
+    # Uncommitted batch, recorded in the checkpoint before each commit
+    batch_docs = 0
+    batch_added: List[int] = []
+    batch_removed: List[int] = []
+
+    def commit_batch() -> None:
+        nonlocal batch_docs
+        if batch_docs == 0:
+            return
+        if skip_index:
+            update_checkpoint(added=batch_added, removed=batch_removed)
+        else:
+            update_checkpoint(rebuild=True)
+        db.commit()
+        # Drop committed rows from the session so memory stays flat
+        db.expunge_all()
+        batch_docs = 0
+        batch_added.clear()
+        batch_removed.clear()
+
     try:
-        for d in docs:
-            d["text"] = normalize_text(d["text"])  # type: ignore[index]
-            doc_row = get_or_create_document(db, source=d.get("source", ""), title=d.get("title", ""), url=d.get("url", ""))
-            
-            # Delete existing chunks for this document to avoid duplicates
-            from app.db.models import Chunk
-            deleted_count = db.query(Chunk).filter(Chunk.doc_id == doc_row.id).delete()
-            if deleted_count > 0:
-                db.flush()  # Flush delete before adding new chunks
-            
-            # Collect all chunks for this document
-            doc_chunks = []
-            for ch in iter_chunk_records(d, max_chunk_tokens, overlap):
-                chunk_texts.append(ch["text"])  # type: ignore[index]
-                preview = ch["text"][:700]
-                meta_with_id = {**ch["meta"], "text": preview}
-                metas.append(meta_with_id)  # type: ignore[index]
-                
-                # Create chunk object (not yet committed)
-                chunk_obj = Chunk(
-                    doc_id=doc_row.id,
-                    text=ch["text"],
-                    tokens=ch["tokens"],
-                    section=ch["section"],
-                    position=ch["position"],
-                    meta_json=json.dumps(ch["meta"]),
-                )
-                doc_chunks.append((chunk_obj, meta_with_id))
-                total_chunks += 1
-            
-            # Bulk insert all chunks for this document
-            if doc_chunks:
-                for chunk_obj, meta_with_id in doc_chunks:
-                    db.add(chunk_obj)
-                db.flush()  # Get IDs without committing
-                
-                # Update meta with chunk IDs and collect IDs for incremental update
-                for (chunk_obj, meta_with_id), idx in zip(doc_chunks, range(len(doc_chunks))):
-                    meta_idx = len(metas) - len(doc_chunks) + idx
-                    metas[meta_idx]["chunk_id"] = chunk_obj.id
-                    new_chunk_ids.append(chunk_obj.id)
+        # load -> normalize -> chunk, in a process pool if settings.ingest_parse_workers > 1
+        tasks = changed_files(db, files, max_chunk_tokens, overlap, counts)
+        for task, parsed, error in iter_parsed(tasks, max_chunk_tokens, overlap):
+            if error is not None:
+                failed_docs += 1
+                log_parse_failure(task[0], error)
+                continue
+            if parsed is None:
+                continue
+            doc_chunks, old_ids = store_document(db, task, parsed)
+            batch_removed.extend(old_ids)
+            if removed_chunk_ids is not None:
+                removed_chunk_ids.extend(old_ids)
+            new_chunk_ids.extend(chunk_obj.id for chunk_obj in doc_chunks)
+            batch_added.extend(chunk_obj.id for chunk_obj in doc_chunks)
+            total_chunks += len(doc_chunks)
+            changed_docs += 1
+            report_progress(docs_loaded=1)
+            batch_docs += 1
+            if batch_docs >= settings.ingest_commit_docs:
+                commit_batch()
         
-        # Single commit for all documents and chunks
-        db.commit()
+        commit_batch()
     except Exception as e:
         db.rollback()  # Rollback on error
         raise
+    finally:
+        db.close()
+        record_stage("load", t_load)
 
-    print(json.dumps({"docs": len(docs), "chunks": total_chunks}))
+    print(json.dumps({"docs": changed_docs, "unchanged_docs": counts["unchanged"], "failed_docs": failed_docs, "chunks": total_chunks}))
 
     if skip_index:
         # Only add to database, don't build index (will be updated incrementally)
-        db.close()
         return new_chunk_ids
 
-    if not chunk_texts:
-        print(json.dumps({"status": "error", "message": "No chunks to embed"}))
-        db.close()
+    if leftover and changed_docs == 0:
+        print(json.dumps({"message": "Resuming index update left over from an interrupted ingest"}))
+    elif changed_docs == 0 and Path(settings.index_path).exists() and Path(settings.doc_meta_path).exists():
+        print(json.dumps({"status": "ok", "message": "No changes, index is up to date"}))
         return []
 
-    embedder = BGEEmbedder(settings.embedding_model)
-    embs = embedder.encode(chunk_texts)
-    
-    # Ensure embs is 2D array
-    if len(embs.shape) == 1:
-        embs = embs.reshape(1, -1)
-    
-    if embs.shape[0] == 0:
-        print(json.dumps({"status": "error", "message": "Empty embeddings array"}))
-        db.close()
-        return
-        
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    # vectors already normalized
-    index.add(embs)
+    # The index covers every document in the database, not just this run's
+    rebuild_from_database(max_chunk_tokens, overlap)
+    return []  # Return empty list when building full index
 
-    out_index = Path(settings.index_path)
-    out_index.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(out_index))
 
-    meta_path = Path(settings.doc_meta_path)
-    with meta_path.open("w", encoding="utf-8") as f:
-        for m in metas:
-            f.write(json.dumps(m) + "\n")
+def iter_metas_for_ids(db, chunk_ids: Iterable[int]) -> Iterator[dict]:
+    """Metas for chunk_ids in id order, fetched in bounded batches."""
+    ids = sorted(set(chunk_ids))
+    for i in range(0, len(ids), 500):
+        chunks = (
+            db.query(Chunk)
+            .join(Document)
+            .options(contains_eager(Chunk.document))
+            .filter(Chunk.id.in_(ids[i : i + 500]))
+            .order_by(Chunk.id)
+            .all()
+        )
+        yield from (_chunk_meta(chunk) for chunk in chunks)
+        db.expunge_all()
 
-    print(json.dumps({"status": "ok", "index_path": str(out_index), "meta_path": str(meta_path)}))
-    db.close()
-    return []  # Return empty list when building full index
 
+def commit_delta(segment, metas: Iterable[dict], removed: Set[int], done_ids: Iterable[int] = ()) -> dict | None:
+    """Publish segment (IDMap2 index of new chunk vectors, or None) plus tombstones for removed.
 
-def add_chunks_to_index(chunk_ids: List[int], db) -> None:
-    """Incrementally add new chunks to existing FAISS index (much faster than full rebuild)."""
-    from app.db.models import Chunk
+    The segment and its metas are written as immutable files and committed
+    by atomically replacing the manifest; the base index is not rewritten.
+    Falls back to a full rebuild when there is no base index yet or it has no
+    chunk id mapping. done_ids are cleared from the ingest checkpoint.
+    Returns the new manifest, or None if it rebuilt instead.
+    """
+    index_path = Path(settings.index_path)
+    meta_path = Path(settings.doc_meta_path)
+    added = faiss.vector_to_array(segment.id_map).tolist() if segment is not None and segment.ntotal else []
+    with _index_write_lock:
+        migrate_legacy_meta(meta_path)
+        if not index_path.exists() or not meta_path.exists():
+            if not added:
+                return None
+            # No index yet: build the base from the database (new vectors are cached)
+            rebuild_from_database()
+            return None
+        
+        manifest = read_manifest(index_path)
+        if manifest is None:
+            # Index written before delta segments existed
+            if not is_id_mapped(read_index(index_path, mmap=True)):
+                print(json.dumps({"warning": "Index has no chunk id mapping, rebuilding from database"}))
+                rebuild_from_database()
+                return None
+            manifest = empty_manifest()
+            manifest["base"] = {"index": list(file_stamp(index_path)), "meta": list(file_stamp(meta_path))}
+        
+        seq = manifest["next_seq"]
+        manifest["next_seq"] = seq + 1
+        if added:
+            name = f"seg-{seq:06d}"
+            seg_index_path, seg_meta_path = segment_paths(index_path, name)
+            write_index(segment, seg_index_path)
+            _write_metas(metas, seg_meta_path)
+            manifest["segments"].append({"seq": seq, "name": name, "ntotal": int(segment.ntotal)})
+        # Hide older copies: removed chunks, plus ids SQLite reused for new chunks
+        for cid in set(removed) | set(added):
+            manifest["tombstones"][str(cid)] = seq
+        write_manifest(index_path, manifest)
+        invalidate_store()
+        invalidate_chunk_texts(set(removed) | set(added))
+        update_checkpoint(clear_added=done_ids, clear_removed=removed)
     
-    if not chunk_ids:
+    if needs_compaction(manifest):
+        schedule_compaction()
+    return manifest
+
+
+def add_chunks_to_index(chunk_ids: List[int], db, removed_chunk_ids: Iterable[int] | None = None) -> None:
+    """Incrementally update the FAISS index with a delta segment (much faster than full rebuild).
+
+    The new chunks are written as a small immutable segment and the ids of
+    removed_chunk_ids (e.g. the old chunks of an updated document) become
+    tombstones; both are committed by atomically replacing the manifest, so
+    the base index is never rewritten here. Segments are folded into the
+    base by compact_segments() once they pass settings.segment_compact_threshold.
+    """
+    # Also finish index work left over from an interrupted ingest
+    pending = read_checkpoint()
+    requested = list(chunk_ids)
+    chunk_ids = sorted(set(chunk_ids) | set(pending["added"]))
+    removed = set(removed_chunk_ids or []) | set(pending["removed"])
+    if not chunk_ids and not removed:
         return
     
     # Get chunks from database
-    chunks = db.query(Chunk).join(Document).filter(Chunk.id.in_(chunk_ids)).all()
-    if not chunks:
-        return
-    
-    chunk_texts: List[str] = []
-    metas: List[dict] = []
+    chunks = db.query(Chunk).join(Document).filter(Chunk.id.in_(chunk_ids)).order_by(Chunk.id).all() if chunk_ids else []
     
-    for chunk in chunks:
-        chunk_texts.append(chunk.text)
-        metas.append({
-            "title": chunk.document.title or "",
-            "source": chunk.document.source or "",
-            "url": chunk.document.url or "",
-            "section": chunk.section or "",
-            "position": chunk.position or 0,
-            "chunk_id": chunk.id,
-            "text": chunk.text[:700] if chunk.text else "",
-        })
+    chunk_texts = [chunk.text for chunk in chunks]
+    metas = [_chunk_meta(chunk) for chunk in chunks]
+    ids = np.asarray([chunk.id for chunk in chunks], dtype=np.int64)
+    # Pending ids not found may belong to a batch still being committed; leave those
+    done_ids = set(requested) | set(ids.tolist())
     
     # Generate embeddings only for new chunks
-    embedder = BGEEmbedder(settings.embedding_model)
-    embs = embedder.encode(chunk_texts)
+    t_embed = time.perf_counter()
+    embs = encode_with_cache(chunk_texts) if chunk_texts else np.zeros((0, 0), dtype=np.float32)
+    record_stage("embed", t_embed)
+    report_progress(chunks_embedded=len(chunk_texts))
     
     if len(embs.shape) == 1:
         embs = embs.reshape(1, -1)
     
-    if embs.shape[0] == 0:
-        return
+    t_index = time.perf_counter()
+    # Segments are small, so always exact
+    segment = create_index(embs, ids, index_type="flat") if embs.shape[0] else None
+    manifest = commit_delta(segment, metas, removed, done_ids)
+    record_stage("index", t_index)
+    report_progress(vectors_indexed=len(chunks))
     
-    # Load existing index
+    print(json.dumps({
+        "status": "incremental_update",
+        "chunks_added": len(chunks),
+        "chunks_removed": len(removed),
+        "segments": len(manifest["segments"]) if manifest else 0,
+        "embed_batches": embed_batch_stats(),
+    }))
+
+
+def compact_segments() -> None:
+    """Fold delta segments and tombstones into the base index (read-modify-write of the base)."""
     index_path = Path(settings.index_path)
     meta_path = Path(settings.doc_meta_path)
-    
-    if not index_path.exists() or not meta_path.exists():
-        # No existing index, create new one
-        dim = embs.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        index.add(embs)
-        faiss.write_index(index, str(index_path))
+    with _index_write_lock:
+        manifest = read_manifest(index_path)
+        if not manifest or (not manifest["segments"] and not manifest["tombstones"]):
+            return
+        if _rebuilds_running:
+            # A running rebuild keeps only the writes committed after it started;
+            # folding those into the base now would lose them. Compact next time.
+            return
+        tomb = tombstones(manifest)
+        base = read_index(index_path, mmap=False)
+        prepare_for_update(base, index_path)
+        # Every tombstone is newer than the base (seq 0)
+        if not remove_ids(base, tomb.keys()):
+            print(json.dumps({"warning": "Index type cannot delete vectors, compacting via full rebuild"}))
+            rebuild_from_database()
+            return
         
-        with meta_path.open("w", encoding="utf-8") as f:
-            for m in metas:
-                f.write(json.dumps(m) + "\n")
-    else:
-        # Add to existing index
-        index = faiss.read_index(str(index_path))
-        index.add(embs)
-        faiss.write_index(index, str(index_path))
+        # A compressed base keeps its exact vectors: carry the live ones over
+        exact = None
+        if is_lossy(base) and vectors_path(index_path).exists():
+            exact = VectorFileWriter(_building_vectors_path(index_path), base.d)
+            dropped = np.asarray(sorted(tomb), dtype=np.int64)
+            for ids, vecs in VectorFile(vectors_path(index_path)).iter_blocks():
+                keep = ~np.isin(ids, dropped)
+                exact.add(ids[keep], vecs[keep])
         
-        # Append to metadata file
-        with meta_path.open("a", encoding="utf-8") as f:
-            for m in metas:
-                f.write(json.dumps(m) + "\n")
-    
-    print(json.dumps({"status": "incremental_update", "chunks_added": len(chunks)}))
+        segment_metas: List[dict] = []
+        for seg in manifest["segments"]:
+            seg_index_path, seg_meta_path = segment_paths(index_path, seg["name"])
+            segment = read_index(seg_index_path, mmap=False)
+            hidden = set(hidden_ids(tomb, seg["seq"]))
+            seg_ids = faiss.vector_to_array(segment.id_map)
+            keep = np.asarray([cid not in hidden for cid in seg_ids.tolist()], dtype=bool)
+            if keep.any():
+                vecs = faiss.downcast_index(segment.index).reconstruct_n(0, segment.ntotal)
+                base.add_with_ids(vecs[keep], seg_ids[keep])
+                if exact is not None:
+                    exact.add(seg_ids[keep], vecs[keep])
+            segment_metas.extend(m for m in open_meta_store(seg_meta_path) if m.get("chunk_id") not in hidden)
+        
+        vectors = exact.close() if exact is not None else None
+        _commit_base(base, _merged_metas(meta_path, segment_metas, set(tomb)), index_path, meta_path, manifest, vectors)
+        print(json.dumps({"status": "compacted", "segments": len(manifest["segments"]), "tombstones": len(tomb), "total_vectors": int(base.ntotal)}))
+
+
+def _compact_in_background() -> None:
+    try:
+        compact_segments()
+    except Exception as e:
+        print(json.dumps({"error": f"Segment compaction failed: {str(e)}"}))
+
+
+def schedule_compaction() -> None:
+    """Start compact_segments() on a background thread unless one is already running."""
+    global _compaction_thread
+    with _compaction_lock:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return
+        _compaction_thread = threading.Thread(target=_compact_in_background, name="eka-compaction", daemon=True)
+        _compaction_thread.start()
+
+
+def remove_chunks_from_index(chunk_ids: Iterable[int]) -> None:
+    """Delete vectors for chunk_ids from the index without touching anything else."""
+    db = SessionLocal()
+    try:
+        add_chunks_to_index([], db, removed_chunk_ids=chunk_ids)
+    finally:
+        db.close()
+
+
+def delete_document(doc_id: int) -> int | None:
+    """Delete a document, its chunks and their vectors. Returns chunks removed, None if not found."""
+    init_db()
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if doc is None:
+            return None
+        chunk_ids = [cid for (cid,) in db.query(Chunk.id).filter(Chunk.doc_id == doc_id)]
+        db.query(Chunk).filter(Chunk.doc_id == doc_id).delete()
+        db.delete(doc)
+        update_checkpoint(removed=chunk_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if chunk_ids:
+        remove_chunks_from_index(chunk_ids)
+    return len(chunk_ids)
+
+
+def _iter_chunk_batches(db, batch_size: int) -> Iterator[List[Chunk]]:
+    """All chunks (with their document) in id order, one bounded batch at a time."""
+    last_id = 0
+    while True:
+        batch = (
+            db.query(Chunk)
+            .join(Document)
+            .options(contains_eager(Chunk.document))
+            .filter(Chunk.id > last_id)
+            .order_by(Chunk.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+        # Keep the session's identity map from growing with the corpus
+        db.expunge_all()
+
+
+def _training_vectors(db, sample_size: int) -> np.ndarray:
+    """Embeddings of a random sample of chunks for IVF/PQ training (cached, so the main pass reuses them)."""
+    ids = [cid for (cid,) in db.query(Chunk.id).order_by(func.random()).limit(sample_size)]
+    vecs = []
+    for i in range(0, len(ids), settings.ingest_batch_chunks):
+        texts = [t for (t,) in db.query(Chunk.text).filter(Chunk.id.in_(ids[i : i + settings.ingest_batch_chunks]))]
+        vecs.append(encode_with_cache(texts))
+    return np.vstack(vecs)
 
 
 def rebuild_from_database(max_chunk_tokens: int = 512, overlap: int = 64) -> None:
-    """Rebuild FAISS index from all chunks in the database."""
+    """Rebuild FAISS index from all chunks in the database.
+
+    Chunks are streamed in batches of settings.ingest_batch_chunks: each
+    batch is embedded (through the embedding cache, so an interrupted
+    rebuild resumes without re-encoding) and added to the index, and its
+    metas are streamed to disk, so memory doesn't grow with the corpus
+    beyond the index itself. The new index replaces the old one atomically
+    at the end.
+    """
+    global _rebuilds_running
     init_db()
+    out_index = Path(settings.index_path)
+    # Deletes and uploads committed from here on may be missed by the scan:
+    # their segments and tombstones stay on top of the new base
+    carry_from = (read_manifest(out_index) or {}).get("next_seq", 1)
     db = SessionLocal()
+    # Index work this rebuild covers (DB changes committed before it started)
+    pending = read_checkpoint()
+    meta_path = Path(settings.doc_meta_path)
+    # Same suffix, so _write_metas picks the same format
+    building_meta = meta_path.with_name(f"{meta_path.stem}.building{meta_path.suffix}")
+    exact = None  # exact vectors of a compressed index, for re-scoring
+    started = datetime.utcnow()
+    with _rebuilds_lock:
+        _rebuilds_running += 1
     
     try:
-        # Get all chunks from database with optimized query (eager loading)
-        chunks = db.query(Chunk).join(Document).order_by(Chunk.id).all()
-        
-        if not chunks:
+        total = db.query(func.count(Chunk.id)).join(Document).scalar() or 0
+        if not total:
             print(json.dumps({"status": "error", "message": "No chunks found in database"}))
             return
+        print(json.dumps({"chunks_from_db": total}))
         
-        # Pre-allocate lists for better performance (Python lists grow dynamically, but we know the size)
-        chunk_texts: List[str] = []
-        metas: List[dict] = []
-        
-        # Process chunks in a single pass
-        for chunk in chunks:
-            chunk_texts.append(chunk.text)
-            # Reconstruct meta from chunk data
-            metas.append({
-                "title": chunk.document.title or "",
-                "source": chunk.document.source or "",
-                "url": chunk.document.url or "",
-                "section": chunk.section or "",
-                "position": chunk.position or 0,
-                "chunk_id": chunk.id,
-                "text": chunk.text[:700] if chunk.text else "",  # Preview for UI
-            })
-        
-        print(json.dumps({"chunks_from_db": len(chunks)}))
-        
-        if not chunk_texts:
+        index = None
+        indexed = 0
+
+        def metas_while_indexing() -> Iterator[dict]:
+            # Embeds and indexes each batch as write_meta_store consumes its metas
+            nonlocal index, indexed, exact
+            for batch in _iter_chunk_batches(db, settings.ingest_batch_chunks):
+                metas = [_chunk_meta(chunk) for chunk in batch]
+                ids = np.asarray([chunk.id for chunk in batch], dtype=np.int64)
+                
+                t_embed = time.perf_counter()
+                embs = encode_with_cache([chunk.text for chunk in batch])
+                if len(embs.shape) == 1:
+                    embs = embs.reshape(1, -1)
+                record_stage("embed", t_embed)
+                report_progress(chunks_embedded=len(batch))
+                
+                t_index = time.perf_counter()
+                if index is None:
+                    # vectors already normalized - size the index for the whole corpus
+                    index = new_index(embs.shape[1], total, with_ids=True)
+                    if not index.is_trained:
+                        train_index(index, _training_vectors(db, min(total, settings.index_train_size)))
+                    if is_lossy(index):
+                        exact = VectorFileWriter(_building_vectors_path(out_index), embs.shape[1])
+                index.add_with_ids(embs, ids)
+                if exact is not None:
+                    exact.add(ids, embs)
+                indexed += len(batch)
+                record_stage("index", t_index)
+                report_progress(vectors_indexed=len(batch))
+                yield from metas
+
+        _write_metas(metas_while_indexing(), building_meta)
+        if index is None:
             print(json.dumps({"status": "error", "message": "No chunks to embed"}))
             return
-        
-        # Generate embeddings with optimized batch processing
-        embedder = BGEEmbedder(settings.embedding_model)
-        embs = embedder.encode(chunk_texts)
-        
-        # Ensure embs is 2D array
-        if len(embs.shape) == 1:
-            embs = embs.reshape(1, -1)
-        
-        if embs.shape[0] == 0:
-            print(json.dumps({"status": "error", "message": "Empty embeddings array"}))
-            return
-            
-        dim = embs.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        # vectors already normalized - add all at once
-        index.add(embs)
-
-        out_index = Path(settings.index_path)
-        out_index.parent.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(index, str(out_index))
-
-        # Write metadata file efficiently
-        meta_path = Path(settings.doc_meta_path)
-        with meta_path.open("w", encoding="utf-8") as f:
-            for m in metas:
-                f.write(json.dumps(m) + "\n")
-
-        print(json.dumps({"status": "ok", "index_path": str(out_index), "meta_path": str(meta_path), "total_chunks": len(chunks)}))
+        print(json.dumps({"message": "index_built", "type": describe(index), "vectors": int(index.ntotal)}))
+
+        t_index = time.perf_counter()
+        vectors = exact.close() if exact is not None else None
+        exact = None
+        with _index_write_lock:
+            # New base supersedes the delta segments committed before it started
+            _commit_base(index, building_meta, out_index, meta_path, read_manifest(out_index), vectors, carry_from)
+        # A rebuild follows rewrites that were never published one by one
+        invalidate_chunk_texts()
+        update_checkpoint(rebuild=False, clear_added=pending["added"], clear_removed=pending["removed"])
+        record_stage("index", t_index)
+        # The scan used the vector of every chunk; the rest belong to deleted or edited chunks
+        prune_embedding_cache(started)
+
+        print(json.dumps({"status": "ok", "index_path": str(out_index), "meta_path": str(meta_path), "total_chunks": indexed, "embed_batches": embed_batch_stats()}))
     except Exception as e:
         print(json.dumps({"status": "error", "message": f"Error rebuilding index: {str(e)}"}))
         raise
     finally:
+        with _rebuilds_lock:
+            _rebuilds_running -= 1
         db.close()
+        if exact is not None:
+            exact.abort()
+        building_meta.unlink(missing_ok=True)
+        _building_vectors_path(out_index).unlink(missing_ok=True)
 
 
 def main() -> None:
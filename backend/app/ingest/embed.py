@@ -1,25 +1,171 @@
 from __future__ import annotations
 
+import threading
+from typing import Dict, List, Tuple
+
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from app.core.cache import LRUCache
+from app.core.config import settings
+from .onnx_backend import backend_tag, load_model
+
 
 class BGEEmbedder:
-    def __init__(self, model_name: str) -> None:
-        self.model = SentenceTransformer(model_name)
-        # Enable batch processing for better performance
-        self.batch_size = 32  # Process in batches for better GPU/CPU utilization
+    def __init__(self, model_name: str, device: str | None = None, backend: str | None = None) -> None:
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend or settings.embedding_backend
+        self.model = load_model(SentenceTransformer, model_name, self.backend, settings.onnx_quantization, device=device)
+        # Batches are sized by padded tokens, not by count (see encode)
+        self.batch_tokens = settings.embedding_batch_tokens
+        self.max_batch_size = settings.embedding_max_batch_size
+        # Identifies everything that affects the output vectors (used as cache key prefix);
+        # ONNX/int8 vectors differ slightly from PyTorch ones, so they are cached separately
+        self.fingerprint = f"{model_name}|normalize=1"
+        if self.backend != "torch":
+            self.fingerprint += f"|{backend_tag(self.backend, settings.onnx_quantization)}"
+        # Cumulative batching stats since load (see padding_stats)
+        self.stats: Dict[str, int] = {"texts": 0, "batches": 0, "tokens": 0, "padded_tokens": 0}
+        self._stats_lock = threading.Lock()
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokenized length of each text as the model will see it (special tokens, truncation)."""
+        max_len = self.model.max_seq_length or 512
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [min(len(t.split()) + 2, max_len) for t in texts]
+        ids = tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=max_len,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )["input_ids"]
+        return [len(x) for x in ids]
+
+    def plan_batches(self, lengths: List[int]) -> List[List[int]]:
+        """Group text indices, longest first, so each batch's padded size stays within the token budget.
+
+        Each batch is padded to its longest text, so sorting by length keeps
+        similar lengths together and little of every batch is padding. A text
+        longer than the budget gets a batch of its own.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        for i in order:
+            # Sorted descending: the first text sets the padded length of the batch
+            padded_len = lengths[batch[0]] if batch else lengths[i]
+            if batch and ((len(batch) + 1) * padded_len > self.batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
 
     def encode(self, texts: list[str]) -> np.ndarray:
-        # Use batch processing for large lists
-        if len(texts) > self.batch_size:
+        if len(texts) <= 1:
+            vecs = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False, convert_to_numpy=True)
+            return np.asarray(vecs, dtype=np.float32)
+
+        lengths = self.token_lengths(texts)
+        batches = self.plan_batches(lengths)
+        out: np.ndarray | None = None
+        for batch in batches:
             vecs = self.model.encode(
-                texts, 
-                normalize_embeddings=True, 
+                [texts[i] for i in batch],
+                normalize_embeddings=True,
                 show_progress_bar=False,
-                batch_size=self.batch_size,
-                convert_to_numpy=True
+                batch_size=len(batch),  # one forward pass per planned batch
+                convert_to_numpy=True,
             )
-        else:
-            vecs = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
-        return np.asarray(vecs, dtype=np.float32)
\ No newline at end of file
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            out[batch] = vecs  # back to input order
+
+        tokens = sum(lengths)
+        padded = sum(lengths[b[0]] * len(b) for b in batches)
+        with self._stats_lock:
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += len(batches)
+            self.stats["tokens"] += tokens
+            self.stats["padded_tokens"] += padded
+        return out
+
+    def padding_stats(self) -> Dict[str, float]:
+        """Cumulative batching stats; padding_efficiency is real tokens / computed (padded) tokens."""
+        with self._stats_lock:
+            stats: Dict[str, float] = dict(self.stats)
+        stats["padding_efficiency"] = round(stats["tokens"] / stats["padded_tokens"], 3) if stats["padded_tokens"] else 1.0
+        return stats
+
+
+# Process-wide registry: one loaded model per (model name, device)
+_embedders: Dict[Tuple[str, str | None], BGEEmbedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str | None = None, device: str | None = None) -> BGEEmbedder:
+    """Return the shared embedder for (model_name, device), loading it on first use."""
+    key = _key(model_name, device)
+    embedder = _embedders.get(key)
+    if embedder is not None:
+        return embedder
+    with _embedders_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            embedder = BGEEmbedder(key[0], device=key[1])
+            _embedders[key] = embedder
+    return embedder
+
+
+# Keys whose model has finished warmup_embedder()'s encode
+_warmed: set[Tuple[str, str | None]] = set()
+
+
+def _key(model_name: str | None, device: str | None) -> Tuple[str, str | None]:
+    return (model_name or settings.embedding_model, device if device is not None else settings.embedding_device)
+
+
+def is_embedder_loaded(model_name: str | None = None, device: str | None = None) -> bool:
+    return _key(model_name, device) in _embedders
+
+
+def is_embedder_warm(model_name: str | None = None, device: str | None = None) -> bool:
+    """Whether warmup_embedder() has completed for this model (loaded is not enough to serve fast)."""
+    return _key(model_name, device) in _warmed
+
+
+def warmup_embedder(model_name: str | None = None, device: str | None = None) -> BGEEmbedder:
+    """Load the model and run one encode so the first real request doesn't pay for it."""
+    embedder = get_embedder(model_name, device)
+    embedder.encode(["warmup"])
+    _warmed.add(_key(model_name, device))
+    return embedder
+
+
+# Query vectors keyed by (model name, normalized query text)
+query_embedding_cache: LRUCache[np.ndarray] = LRUCache(
+    settings.query_embedding_cache_size,
+    settings.query_embedding_cache_ttl_seconds,
+)
+
+
+def normalize_query(query: str) -> str:
+    # Whitespace only: case can change the embedding for cased models
+    return " ".join(query.split())
+
+
+def encode_query(query: str, embedder: BGEEmbedder | None = None) -> np.ndarray:
+    """Encode a single query as a (1, dim) array, reusing cached vectors for repeat queries."""
+    embedder = embedder or get_embedder()
+    key = (embedder.model_name, normalize_query(query))
+    vec = query_embedding_cache.get(key)
+    if vec is None:
+        vec = embedder.encode([key[1]])
+        vec.setflags(write=False)
+        query_embedding_cache.put(key, vec)
+    return vec
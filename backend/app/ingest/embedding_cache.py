@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert
+
+from app.core.config import settings
+from app.core.deps import SessionLocal
+from app.db.models import EmbeddingCache
+from .embed import BGEEmbedder, get_embedder
+
+# Stay well under SQLite's bound-parameter limit
+_LOOKUP_BATCH = 500
+
+
+def cache_key(fingerprint: str, text: str) -> str:
+    return hashlib.sha256(f"{fingerprint}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def encode_with_cache(texts: Sequence[str], embedder: BGEEmbedder | None = None) -> np.ndarray:
+    """Embed texts, reusing vectors stored for identical (model, text) pairs.
+
+    Only cache misses go through the model; new vectors are written back so
+    the next rebuild can skip them.
+    """
+    embedder = embedder or get_embedder()
+    if not settings.enable_embedding_cache:
+        return embedder.encode(list(texts))
+
+    keys = [cache_key(embedder.fingerprint, t) for t in texts]
+    found: Dict[str, np.ndarray] = {}
+    db = SessionLocal()
+    try:
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), _LOOKUP_BATCH):
+            batch = unique_keys[i : i + _LOOKUP_BATCH]
+            rows = db.query(EmbeddingCache.key, EmbeddingCache.vector).filter(EmbeddingCache.key.in_(batch)).all()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        hit_keys = list(found)
+
+        # Encode each distinct missing text once
+        miss_keys: List[str] = []
+        miss_texts: List[str] = []
+        seen = set()
+        for key, text in zip(keys, texts):
+            if key not in found and key not in seen:
+                seen.add(key)
+                miss_keys.append(key)
+                miss_texts.append(text)
+
+        rows = []
+        if miss_texts:
+            vecs = embedder.encode(miss_texts)
+            if len(vecs.shape) == 1:
+                vecs = vecs.reshape(1, -1)
+            for key, vec in zip(miss_keys, vecs):
+                found[key] = vec
+                rows.append({"key": key, "model": embedder.model_name, "dim": int(vec.shape[0]), "vector": vec.tobytes()})
+
+        # One short write after encoding, so SQLite's write lock isn't held while the model runs
+        now = datetime.utcnow()
+        for i in range(0, len(hit_keys), _LOOKUP_BATCH):
+            batch = hit_keys[i : i + _LOOKUP_BATCH]
+            db.query(EmbeddingCache).filter(EmbeddingCache.key.in_(batch)).update(
+                {EmbeddingCache.used_at: now}, synchronize_session=False
+            )
+        if rows:
+            # Another ingest may have stored some of the same vectors first; keep the rest
+            db.execute(insert(EmbeddingCache).on_conflict_do_nothing(index_elements=["key"]), rows)
+        db.commit()
+    finally:
+        db.close()
+
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+
+def prune_embedding_cache(unused_since: datetime) -> int:
+    """Delete cached vectors no encode_with_cache() call has used since unused_since. Returns the rows deleted.
+
+    Run after a full rebuild with its start time: the rebuild looked up the
+    vector of every chunk in the database, so what it didn't touch belongs
+    to deleted or edited chunks or to earlier models. Concurrent ingests
+    touch their rows too, so they are kept.
+    """
+    if not settings.enable_embedding_cache:
+        return 0
+    db = SessionLocal()
+    try:
+        pruned = (
+            db.query(EmbeddingCache)
+            .filter(or_(EmbeddingCache.used_at.is_(None), EmbeddingCache.used_at < unused_since))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    print(json.dumps({"embedding_cache": {"pruned": pruned}}))
+    return pruned
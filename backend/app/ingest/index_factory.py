@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+import faiss  # type: ignore
+import numpy as np
+
+from app.core.config import settings
+
+
+# settings.vector_store values; "faiss" keeps the original exact IndexFlatIP
+INDEX_TYPES = {
+    "faiss": "flat",
+    "flat": "flat",
+    "hnsw": "hnsw",
+    "ivf_flat": "ivf_flat",
+    "ivf_pq": "ivf_pq",
+}
+
+
+def configured_index_type() -> str:
+    name = settings.vector_store.strip().lower().replace("-", "_")
+    if name.startswith("faiss_"):
+        name = name[len("faiss_"):]
+    if name not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector_store '{settings.vector_store}'. Expected one of: {', '.join(sorted(INDEX_TYPES))}")
+    return INDEX_TYPES[name]
+
+
+# settings.vector_codec values: how the base index stores each vector
+CODECS = ("none", "fp16", "sq8", "pq")
+
+
+def configured_codec() -> str:
+    codec = settings.vector_codec.strip().lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown vector_codec '{settings.vector_codec}'. Expected one of: {', '.join(CODECS)}")
+    return codec
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # PQ needs m to divide the dimension; pick the largest divisor <= pq_m
+    m = max(1, min(settings.pq_m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _storage(dim: int, num_vectors: int, codec: str) -> str:
+    """factory_string component that stores the vectors (float32 unless compressed)."""
+    if codec == "fp16":
+        return "SQfp16"
+    if codec == "sq8":
+        return "SQ8"
+    if codec == "pq":
+        # Too few vectors to train the PQ codebooks: SQ8 still compresses 4x
+        if num_vectors < 2 ** settings.pq_nbits:
+            return "SQ8"
+        return f"PQ{_pq_subquantizers(dim)}x{settings.pq_nbits}"
+    return "Flat"
+
+
+def factory_string(dim: int, num_vectors: int, index_type: str | None = None, codec: str | None = None) -> str:
+    """faiss.index_factory description for the configured index type.
+
+    Falls back to a flat index when there are too few vectors to train the
+    requested quantizer; the next rebuild with more data picks it up. The
+    configured vector_codec applies to the configured index type; an
+    explicit index_type (delta segments) stores exact float32 vectors
+    unless a codec is passed too.
+    """
+    if codec is None:
+        codec = configured_codec() if index_type is None else "none"
+    index_type = index_type or configured_index_type()
+    storage = _storage(dim, num_vectors, codec)
+    if index_type == "hnsw":
+        return f"HNSW{settings.hnsw_m},{storage}"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        # faiss wants ~39 training points per centroid
+        nlist = min(settings.ivf_nlist, num_vectors // 39)
+        if nlist < 1:
+            return storage
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},{storage}"
+        if num_vectors < 2 ** settings.pq_nbits:
+            return f"IVF{nlist},{storage}"
+        return f"IVF{nlist},PQ{_pq_subquantizers(dim)}x{settings.pq_nbits}"
+    return storage
+
+
+def new_index(
+    dim: int,
+    num_vectors: int,
+    with_ids: bool = False,
+    index_type: str | None = None,
+    codec: str | None = None,
+) -> faiss.Index:
+    """Empty inner-product index sized for num_vectors; call train_index() before adding if not trained."""
+    description = factory_string(dim, num_vectors, index_type, codec)
+    if with_ids:
+        description = "IDMap2," + description
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.efConstruction = settings.hnsw_ef_construction
+        hnsw.efSearch = settings.hnsw_ef_search
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = settings.ivf_nprobe
+    return index
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray) -> None:
+    """Train IVF/PQ quantizers on (a sample of at most settings.index_train_size) vectors."""
+    if index.is_trained:
+        return
+    num_vectors = vectors.shape[0]
+    if num_vectors > settings.index_train_size:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(num_vectors, settings.index_train_size, replace=False)]
+    index.train(vectors)
+
+
+def _codec_name(index: faiss.Index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "SQfp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "SQ8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "PQ"
+    return "Flat"
+
+
+def describe(index: faiss.Index) -> str:
+    """Short type description for logs, e.g. "IDMap2,IVF64,Flat"."""
+    parts = []
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        parts.append(type(index).__name__.replace("Index", ""))
+        index = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        parts.append(f"IVF{ivf.nlist}")
+        parts.append(_codec_name(ivf))
+    elif isinstance(index, faiss.IndexHNSW):
+        parts.append(f"HNSW{index.hnsw.nb_neighbors(1)}")
+        parts.append(_codec_name(index.storage))
+    else:
+        parts.append(_codec_name(index))
+    return ",".join(parts)
+
+
+def is_lossy(index: faiss.Index) -> bool:
+    """Whether index stores compressed codes, so its scores are approximate even for the candidates it finds."""
+    return describe(index).rsplit(",", 1)[-1] != "Flat"
+
+
+def create_index(vectors: np.ndarray, ids: np.ndarray | None = None, index_type: str | None = None) -> faiss.Index:
+    """Create, train (if needed) and fill an inner-product index with vectors.
+
+    With ids (chunk ids) the index is wrapped in IndexIDMap2, so searches
+    return chunk ids and vectors can later be removed/replaced by id.
+    """
+    num_vectors, dim = vectors.shape
+    index = new_index(dim, num_vectors, with_ids=ids is not None, index_type=index_type)
+    train_index(index, vectors)
+
+    if ids is not None:
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(vectors)
+    print(json.dumps({"message": "index_built", "type": describe(index), "vectors": int(index.ntotal)}))
+    return index
+
+
+def is_id_mapped(index: faiss.Index) -> bool:
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def _inner(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _hnsw(index: faiss.Index):
+    index = _inner(index)
+    return index.hnsw if isinstance(index, faiss.IndexHNSW) else None
+
+
+def remove_ids(index: faiss.Index, ids) -> bool:
+    """Remove vectors by id in place. Returns False if the index type can't delete (HNSW, IVF).
+
+    IVF is rebuilt instead: its direct map doesn't support removal, and
+    IndexIDMap2 would renumber its id map while the inverted lists keep
+    the old positions.
+    """
+    ids = np.asarray(sorted(ids), dtype=np.int64)
+    if not len(ids):
+        return True
+    if _hnsw(index) is not None or faiss.try_extract_index_ivf(index) is not None:
+        return False
+    index.remove_ids(faiss.IDSelectorBatch(ids))
+    return True
+
+
+def enable_reconstruct(index: faiss.Index) -> None:
+    """Give an IVF index a direct map so reconstruct() can look up stored vectors by id.
+
+    Other index types reconstruct without one. The map is saved with the
+    index, so this only costs a pass over the lists for files written
+    before it was added.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def search_params(index: faiss.Index, nprobe: int | None = None, ef_search: int | None = None, sel=None):
+    """Per-call search parameters for IVF/HNSW indices and id filters (None if not needed).
+
+    Passed to index.search() instead of mutating the shared index, so
+    concurrent requests can use different values.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe or settings.ivf_nprobe, sel=sel)
+    if _hnsw(index) is not None:
+        return faiss.SearchParametersHNSW(efSearch=ef_search or settings.hnsw_ef_search, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def read_index(path: Path | str, mmap: bool | None = None) -> faiss.Index:
+    """Load an index from disk.
+
+    With mmap (settings.index_mmap) the vectors/codes are memory-mapped
+    read-only instead of copied into the heap, so uvicorn workers share the
+    OS page cache and startup doesn't have to read the whole file. IVF
+    indices written with settings.ivf_on_disk keep their inverted lists in a
+    separate .ivfdata file that is always mmapped.
+    """
+    mmap = settings.index_mmap if mmap is None else mmap
+    if not mmap:
+        return faiss.read_index(str(path))
+    # IO_FLAG_MMAP_IFC also maps flat/HNSW storage; older faiss only maps IVF lists
+    flags = faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flags)
+
+
+def _ondisk_invlists(index: faiss.Index):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return None
+    invlists = faiss.downcast_InvertedLists(ivf.invlists)
+    return invlists if isinstance(invlists, faiss.OnDiskInvertedLists) else None
+
+
+def move_invlists_to_disk(index: faiss.Index, index_path: Path) -> None:
+    """Copy the IVF inverted lists of index into a fresh .ivfdata file next to index_path.
+
+    A new file name is used every time so processes still mapping the
+    previous file are unaffected.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return
+    index_path = Path(index_path).resolve()
+    ivfdata = index_path.with_name(f"{index_path.name}.{time.time_ns()}.ivfdata")
+    invlists = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, str(ivfdata))
+    src = faiss.InvertedListsPtrVector()
+    src.push_back(ivf.invlists)
+    invlists.merge_from_multiple(src.data(), src.size(), False)
+    ivf.replace_invlists(invlists, True)
+    invlists.this.disown()
+
+
+def prepare_for_update(index: faiss.Index, index_path: Path) -> None:
+    """Detach an index read from disk from its live .ivfdata file before adding to it."""
+    if _ondisk_invlists(index) is not None:
+        move_invlists_to_disk(index, index_path)
+
+
+def write_index(index: faiss.Index, path: Path) -> None:
+    """Write the index via a temp file + rename so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if settings.ivf_on_disk and faiss.try_extract_index_ivf(index) is not None and _ondisk_invlists(index) is None:
+        move_invlists_to_disk(index, path)
+    enable_reconstruct(index)
+    tmp = path.with_name(path.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, path)
+
+    # Drop .ivfdata files no longer referenced by the index on disk. Readers
+    # that still map an old file keep it alive until they reload.
+    ondisk = _ondisk_invlists(index)
+    current = Path(ondisk.filename).name if ondisk is not None else None
+    for stale in path.resolve().parent.glob(f"{path.name}.*.ivfdata"):
+        if stale.name != current:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List
+
+from app.core.config import settings
+
+
+# Background ingestion jobs.
+#
+# Ingest endpoints submit build()/rebuild_from_database() here and return a
+# job id immediately, so the event loop keeps serving /query while a large
+# rebuild runs. Jobs run on a small thread pool (index writes are serialized
+# anyway) and the ingest code reports progress and stage timings for the job
+# running on the current thread via report_progress() / record_stage(); both
+# are no-ops outside a job (CLI, tests).
+
+JOB_STATES = ("queued", "running", "succeeded", "failed")
+
+_current = threading.local()
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when settings.ingest_max_pending_jobs jobs are already queued or running."""
+
+
+def _isoformat(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts is not None else None
+
+
+class IngestJob:
+    def __init__(self, kind: str, params: Dict | None = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.progress: Dict[str, int] = {
+            "docs_total": 0,
+            "docs_loaded": 0,
+            "docs_unchanged": 0,
+            "docs_failed": 0,
+            "chunks_embedded": 0,
+            "vectors_indexed": 0,
+        }
+        self.stages: Dict[str, float] = {}  # stage -> seconds (summed if a stage repeats)
+        self.result: Any = None
+        self.error: str | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def add_progress(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.progress[key] = self.progress.get(key, 0) + int(value)
+
+    def add_stage_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            progress = dict(self.progress)
+            stages_ms = {stage: int(seconds * 1000) for stage, seconds in self.stages.items()}
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+            "latency_ms": int((end - self.started_at) * 1000) if self.started_at is not None else None,
+            "progress": progress,
+            "stages_ms": stages_ms,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded thread pool plus an in-memory registry of recent jobs."""
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+        history: int | None = None,
+    ) -> None:
+        self.max_workers = max_workers or settings.ingest_workers
+        self.max_pending = max_pending or settings.ingest_max_pending_jobs
+        self.history = history or settings.ingest_job_history
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="eka-ingest")
+        return self._executor
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args: Any, params: Dict | None = None, **kwargs: Any) -> IngestJob:
+        """Queue fn(*args, **kwargs) as a job. Raises JobQueueFull if the queue is at capacity."""
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.done)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} ingest jobs already queued or running")
+            job = IngestJob(kind, params)
+            self._jobs[job.id] = job
+            self._trim()
+            self._pool().submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: IngestJob, fn: Callable[..., Any], args: tuple, kwargs: Dict) -> None:
+        job.started_at = time.time()
+        job.status = "running"
+        _current.job = job
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            print(json.dumps({"error": f"Ingest job {job.id} failed: {str(e)}", "traceback": traceback.format_exc()}))
+        finally:
+            _current.job = None
+            job.finished_at = time.time()
+        summary = job.to_dict()
+        print(json.dumps({
+            "message": "ingest_job",
+            "job_id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "latency_ms": summary["latency_ms"],
+            "progress": summary["progress"],
+            "stages_ms": summary["stages_ms"],
+        }))
+
+    def _trim(self) -> None:
+        # Forget the oldest finished jobs beyond the history limit
+        excess = len(self._jobs) - self.history
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        """Known jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+
+def current_job() -> IngestJob | None:
+    """The job running on this thread, if any."""
+    return getattr(_current, "job", None)
+
+
+@contextmanager
+def job_context(job: IngestJob | None) -> Iterator[None]:
+    """Attribute progress reported on this thread to job (for helper threads of a job)."""
+    previous = current_job()
+    _current.job = job
+    try:
+        yield
+    finally:
+        _current.job = previous
+
+
+def report_progress(**deltas: int) -> None:
+    """Add to the progress counters of the current job (no-op outside a job)."""
+    job = current_job()
+    if job is not None:
+        job.add_progress(**deltas)
+
+
+def record_stage(stage: str, started: float) -> None:
+    """Add the time since started (a time.perf_counter() value) to a stage of the current job."""
+    job = current_job()
+    if job is not None:
+        job.add_stage_time(stage, time.perf_counter() - started)
+
+
+# Process-wide queue used by the ingest API
+ingest_jobs = JobQueue()
@@ -39,21 +39,28 @@ def load_html(path: Path) -> str:
     return soup.get_text("\n")
 
 
-def iter_documents(paths: Iterable[str]) -> Iterator[Dict[str, str]]:
+SUPPORTED_EXTENSIONS = (".md", ".markdown", ".pdf", ".html", ".htm")
+
+
+def is_supported_file(path: Path) -> bool:
+    return path.name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def iter_document_paths(paths: Iterable[str]) -> Iterator[Path]:
+    """Walk directories and yield supported files without reading them."""
     for root in paths:
         for dirpath, _, filenames in os.walk(root):
             for name in filenames:
                 p = Path(dirpath) / name
-                lower = name.lower()
-                if lower.endswith((".md", ".markdown")):
-                    text = load_markdown(p)
-                    yield {"source": str(p), "title": p.stem, "text": text}
-                elif lower.endswith(".pdf"):
-                    text = load_pdf(p)
-                    yield {"source": str(p), "title": p.stem, "text": text}
-                elif lower.endswith((".html", ".htm")):
-                    text = load_html(p)
-                    yield {"source": str(p), "title": p.stem, "text": text}
+                if is_supported_file(p):
+                    yield p
+
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Dict[str, str]]:
+    for p in iter_document_paths(paths):
+        doc = load_file_from_path(p)
+        if doc:
+            yield doc
 
 
 def load_file_from_path(path: Path) -> Dict[str, str] | None:
@@ -69,5 +76,3 @@ def load_file_from_path(path: Path) -> Dict[str, str] | None:
         text = load_html(path)
         return {"source": str(path), "title": path.stem, "text": text}
     return None
-
-
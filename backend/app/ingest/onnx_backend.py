@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+# ONNX Runtime backend for the sentence-transformers models (embedder and
+# cross-encoder).
+#
+# With settings.embedding_backend / reranker_backend = "onnx" the model is
+# exported to ONNX once under settings.onnx_model_dir, optionally quantized
+# to int8 with dynamic quantization (settings.onnx_quantization names the
+# CPU target: arm64, avx2, avx512 or avx512_vnni), and then run by ONNX
+# Runtime on the CPU with settings.onnx_threads intra-op threads.
+#
+#   python -m app.ingest.onnx_backend --export           # export/quantize ahead of deploys
+#   python -m app.ingest.onnx_backend --check            # cosine drift + speedup vs PyTorch
+#
+# Needs the optional extras: pip install "sentence-transformers[onnx]"
+
+BACKENDS = ("torch", "onnx")
+QUANTIZATIONS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+_export_lock = threading.Lock()
+
+
+def _quantization(value: str | None) -> str | None:
+    value = (value or "").strip().lower()
+    if value in ("", "none"):
+        return None
+    if value not in QUANTIZATIONS:
+        raise ValueError(f"Unknown ONNX quantization {value!r}, expected one of {', '.join(QUANTIZATIONS)} or none")
+    return value
+
+
+def backend_tag(backend: str, quantization: str | None = None) -> str:
+    """Short label of a backend for fingerprints and logs, e.g. "torch" or "onnx-qint8_avx2"."""
+    if backend == "torch":
+        return "torch"
+    quantization = _quantization(quantization)
+    return f"onnx-qint8_{quantization}" if quantization else "onnx"
+
+
+def export_dir(model_name: str) -> Path:
+    """Where the ONNX export of model_name is kept."""
+    return Path(settings.onnx_model_dir) / re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name.strip("/\\"))
+
+
+def onnx_file_name(quantization: str | None) -> str:
+    return f"onnx/model_qint8_{quantization}.onnx" if quantization else "onnx/model.onnx"
+
+
+def session_kwargs() -> Dict[str, Any]:
+    """model_kwargs that make sentence-transformers run ONNX Runtime on the CPU with our thread count."""
+    if ort is None:
+        raise ImportError('The onnx backend needs ONNX Runtime and Optimum: pip install "sentence-transformers[onnx]"')
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if settings.onnx_threads > 0:
+        options.intra_op_num_threads = settings.onnx_threads
+        options.inter_op_num_threads = 1
+    return {"provider": "CPUExecutionProvider", "session_options": options}
+
+
+def ensure_export(model_cls: type, model_name: str, quantization: str | None = None) -> Path:
+    """Export model_name (a SentenceTransformer or CrossEncoder) to ONNX once, quantizing if asked."""
+    quantization = _quantization(quantization)
+    out = export_dir(model_name)
+    with _export_lock:
+        if (out / onnx_file_name(quantization)).exists():
+            return out
+        t0 = time.perf_counter()
+        if not (out / onnx_file_name(None)).exists():
+            # Uses the repo's ONNX file if it ships one, else exports from the PyTorch weights
+            model = model_cls(model_name, backend="onnx", device="cpu", model_kwargs=session_kwargs())
+            model.save_pretrained(str(out))
+        if quantization:
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            model = model_cls(
+                str(out), backend="onnx", device="cpu", model_kwargs={**session_kwargs(), "file_name": onnx_file_name(None)}
+            )
+            export_dynamic_quantized_onnx_model(model, quantization, str(out))
+        print(json.dumps({
+            "message": "onnx_exported",
+            "model": model_name,
+            "path": str(out / onnx_file_name(quantization)),
+            "latency_ms": int((time.perf_counter() - t0) * 1000),
+        }))
+    return out
+
+
+def load_model(
+    model_cls: type,
+    model_name: str,
+    backend: str = "torch",
+    quantization: str | None = None,
+    device: str | None = None,
+    **kwargs: Any,
+):
+    """Load a SentenceTransformer/CrossEncoder on the given backend (exporting to ONNX on first use)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == "torch":
+        return model_cls(model_name, device=device, **kwargs)
+    quantization = _quantization(quantization)
+    path = ensure_export(model_cls, model_name, quantization)
+    return model_cls(
+        str(path),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={**session_kwargs(), "file_name": onnx_file_name(quantization)},
+        **kwargs,
+    )
+
+
+def _sample_texts(n: int) -> List[str]:
+    # Real chunks if an index has been built, else synthetic mixed-length text
+    try:
+        from app.core.deps import SessionLocal
+        from app.db.models import Chunk
+
+        db = SessionLocal()
+        try:
+            texts = [t for (t,) in db.query(Chunk.text).order_by(Chunk.id).limit(n)]
+        finally:
+            db.close()
+    except Exception:
+        texts = []
+    rng = np.random.default_rng(0)
+    words = "retrieval index vector query document embedding cluster latency answer source".split()
+    while len(texts) < n:
+        texts.append(" ".join(rng.choice(words, size=int(rng.integers(8, 400)))))
+    return texts
+
+
+def _timed(fn, repeat: int) -> tuple:
+    fn()  # warmup
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def check_embedder(texts: List[str], quantization: str | None, repeat: int) -> Dict:
+    """Cosine drift of the ONNX embedder against PyTorch on texts, and the speedup."""
+    from sentence_transformers import SentenceTransformer
+
+    model_name = settings.embedding_model
+    reference = load_model(SentenceTransformer, model_name, "torch", device="cpu")
+    candidate = load_model(SentenceTransformer, model_name, "onnx", quantization)
+    encode = dict(normalize_embeddings=True, show_progress_bar=False, convert_to_numpy=True, batch_size=32)
+    ref, ref_s = _timed(lambda: reference.encode(texts, **encode), repeat)
+    got, got_s = _timed(lambda: candidate.encode(texts, **encode), repeat)
+    cos = np.sum(np.asarray(ref, dtype=np.float32) * np.asarray(got, dtype=np.float32), axis=1)
+    return {
+        "model": model_name,
+        "backend": backend_tag("onnx", quantization),
+        "texts": len(texts),
+        "cosine_mean": round(float(cos.mean()), 5),
+        "cosine_min": round(float(cos.min()), 5),
+        "torch_texts_per_s": round(len(texts) / ref_s, 1),
+        "onnx_texts_per_s": round(len(texts) / got_s, 1),
+        "speedup": round(ref_s / got_s, 2),
+    }
+
+
+def check_reranker(texts: List[str], quantization: str | None, repeat: int) -> Dict:
+    """Score drift of the ONNX cross-encoder against PyTorch, and the speedup."""
+    from sentence_transformers import CrossEncoder
+
+    model_name = settings.reranker_model
+    reference = load_model(CrossEncoder, model_name, "torch", device="cpu")
+    candidate = load_model(CrossEncoder, model_name, "onnx", quantization)
+    pairs = [(texts[(i + 1) % len(texts)][:200], t) for i, t in enumerate(texts)]
+    ref, ref_s = _timed(lambda: np.asarray(reference.predict(pairs, batch_size=32, show_progress_bar=False)), repeat)
+    got, got_s = _timed(lambda: np.asarray(candidate.predict(pairs, batch_size=32, show_progress_bar=False)), repeat)
+    ref_rank = np.argsort(np.argsort(-ref))
+    got_rank = np.argsort(np.argsort(-got))
+    return {
+        "model": model_name,
+        "backend": backend_tag("onnx", quantization),
+        "pairs": len(pairs),
+        "max_abs_diff": round(float(np.max(np.abs(ref - got))), 5),
+        "spearman": round(float(np.corrcoef(ref_rank, got_rank)[0, 1]), 5),
+        "torch_pairs_per_s": round(len(pairs) / ref_s, 1),
+        "onnx_pairs_per_s": round(len(pairs) / got_s, 1),
+        "speedup": round(ref_s / got_s, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export models to ONNX and compare them with PyTorch")
+    parser.add_argument("--export", action="store_true", help="export (and quantize) the configured models")
+    parser.add_argument("--check", action="store_true", help="report drift and speedup against PyTorch")
+    parser.add_argument("--quantization", default=settings.onnx_quantization, help="none | " + " | ".join(QUANTIZATIONS))
+    parser.add_argument("--reranker", action="store_true", help="also handle the cross-encoder")
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.export:
+        from sentence_transformers import CrossEncoder, SentenceTransformer
+
+        ensure_export(SentenceTransformer, settings.embedding_model, args.quantization)
+        if args.reranker:
+            ensure_export(CrossEncoder, settings.reranker_model, args.quantization)
+    if args.check:
+        texts = _sample_texts(args.texts)
+        report = {"embedder": check_embedder(texts, args.quantization, args.repeat)}
+        if args.reranker:
+            report["reranker"] = check_reranker(texts, args.quantization, args.repeat)
+        print(json.dumps({"onnx_check": report}))
+    if not args.export and not args.check:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import multiprocessing
+import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, Tuple
+
+from app.core.config import settings
+from .chunk import iter_chunk_records
+from .clean import normalize_text
+from .loaders import load_file_from_path
+
+
+# Parallel load -> normalize -> chunk.
+#
+# PDF and HTML parsing is CPU-bound, so with settings.ingest_parse_workers > 1
+# files are parsed in a process pool. At most max_in_flight files are
+# submitted ahead of the consumer and results are yielded in input order, so
+# ingest stays deterministic and memory stays bounded. A file that fails to
+# parse (or kills its worker) is reported on its own and never aborts the rest.
+
+ParseTask = Tuple  # (file, source, title, ...extra fields passed through)
+
+
+def parse_file(path: Path, source: str, title: str, max_chunk_tokens: int, overlap: int) -> Dict | None:
+    """Load, normalize and chunk one file. Returns {"doc", "chunks"} or None if unsupported."""
+    d = load_file_from_path(path)
+    if d is None:
+        return None
+    d["source"] = source
+    d["title"] = title
+    d["text"] = normalize_text(d["text"])  # type: ignore[index]
+    return {"doc": d, "chunks": list(iter_chunk_records(d, max_chunk_tokens, overlap))}
+
+
+def _parse_task(task: ParseTask, max_chunk_tokens: int, overlap: int) -> Tuple[Dict | None, str | None]:
+    # Runs in the worker: exceptions come back as strings so they never break the pool
+    path, source, title = task[:3]
+    try:
+        return parse_file(path, source, title, max_chunk_tokens, overlap), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+
+
+def iter_parsed(
+    tasks: Iterable[ParseTask],
+    max_chunk_tokens: int,
+    overlap: int,
+    workers: int | None = None,
+    max_in_flight: int | None = None,
+) -> Iterator[Tuple[ParseTask, Dict | None, str | None]]:
+    """Yield (task, parsed, error) for each task, in input order.
+
+    parsed is parse_file()'s result (None for unsupported files or on
+    failure) and error a message if the file could not be parsed. With
+    workers <= 1 files are parsed lazily in this process.
+    """
+    workers = settings.ingest_parse_workers if workers is None else workers
+    if workers <= 1:
+        for task in tasks:
+            parsed, error = _parse_task(task, max_chunk_tokens, overlap)
+            yield task, parsed, error
+        return
+
+    max_in_flight = max_in_flight or settings.ingest_parse_max_in_flight or 2 * workers
+    # spawn: workers must not inherit the parent's torch/FAISS threads
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+    pending: Deque[Tuple[ParseTask, Future]] = deque()
+    it = iter(tasks)
+    exhausted = False
+
+    def restart() -> ProcessPoolExecutor:
+        pool.shutdown(wait=False, cancel_futures=True)
+        return ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    task = next(it)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((task, pool.submit(_parse_task, task, max_chunk_tokens, overlap)))
+            if not pending:
+                break
+            task, future = pending.popleft()
+            try:
+                parsed, error = future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. a parser segfault) and took every in-flight file
+                # with it. Re-run this file alone to find out whether it is the culprit,
+                # then resubmit the rest in order.
+                pool = restart()
+                try:
+                    parsed, error = pool.submit(_parse_task, task, max_chunk_tokens, overlap).result()
+                except BrokenProcessPool:
+                    pool = restart()
+                    parsed, error = None, "BrokenProcessPool: worker process died while parsing this file"
+                rest = [t for t, _ in pending]
+                pending.clear()
+                for t in rest:
+                    pending.append((t, pool.submit(_parse_task, t, max_chunk_tokens, overlap)))
+            yield task, parsed, error
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
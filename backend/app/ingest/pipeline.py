@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Set
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.deps import SessionLocal, init_db
+from .build_index import (
+    add_chunks_to_index,
+    changed_files,
+    collect_files,
+    commit_delta,
+    embed_batch_stats,
+    iter_metas_for_ids,
+    log_parse_failure,
+    read_checkpoint,
+    rebuild_from_database,
+    store_document,
+    update_checkpoint,
+)
+from .embedding_cache import encode_with_cache
+from .index_factory import new_index
+from .jobs import current_job, job_context, report_progress
+from .parallel import iter_parsed
+
+
+# Pipelined ingest: parse/chunk -> SQLite insert -> embed -> FAISS add.
+#
+# Each stage runs on its own thread and hands batches to the next through a
+# bounded queue, so the embedder works on batch N while batch N+1 is parsed
+# and written; a slow stage applies backpressure instead of letting work
+# pile up in memory. Per-stage busy/wait times and queue depths show which
+# stage is the bottleneck: a starved stage waits on its inbox, a stage ahead
+# of the bottleneck waits on a full outbox.
+#
+# The DB stage only hands chunks on after committing them (and recording
+# them in the ingest checkpoint). It never waits on either queue while it
+# holds a write transaction: it commits before blocking on an empty inbox
+# and before putting to its outbox. So the embedding cache's commits from
+# the embed stage only ever wait for the inserts of documents that are
+# already parsed, not for parsing.
+#
+# The index stage publishes what it has as a delta segment whenever it holds
+# settings.ingest_segment_vectors vectors, at a DB commit boundary so a
+# document's new chunks and the tombstones for its old ones go out together.
+# Memory stays bounded however many documents changed.
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Another stage failed; unwind quietly."""
+
+
+class StageStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.busy = 0.0  # seconds spent working
+        self.wait_in = 0.0  # seconds blocked on an empty inbox (starved)
+        self.wait_out = 0.0  # seconds blocked on a full outbox (backpressure)
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        elapsed = (self.finished or now) - (self.started or now)
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "wait_in_s": round(self.wait_in, 3),
+            "wait_out_s": round(self.wait_out, 3),
+            "items_per_busy_s": round(self.items / self.busy, 1) if self.busy > 0 else None,
+            "utilization": round(self.busy / elapsed, 3) if elapsed > 0 else None,
+        }
+
+
+class Channel:
+    """Bounded queue between two stages that samples its depth on every put."""
+
+    def __init__(self, name: str, maxsize: int, stop: threading.Event) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+        self._stop = stop
+        self.puts = 0
+        self.full_puts = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+
+    def put(self, item: Any, stats: StageStats) -> None:
+        depth = self._q.qsize()
+        self.puts += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+        if depth >= self.maxsize:
+            self.full_puts += 1
+        t0 = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                self._q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.wait_out += time.perf_counter() - t0
+
+    def get(self, stats: StageStats) -> Any:
+        t0 = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                item = self._q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats.wait_in += time.perf_counter() - t0
+        return item
+
+    def empty(self) -> bool:
+        return self._q.empty()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "maxsize": self.maxsize,
+            "mean_depth": round(self.depth_sum / self.puts, 2) if self.puts else 0,
+            "max_depth": self.max_depth,
+            "full_pct": round(100 * self.full_puts / self.puts, 1) if self.puts else 0,
+        }
+
+
+def run_pipeline(
+    paths: List[str],
+    max_chunk_tokens: int,
+    overlap: int,
+    removed_chunk_ids: List[int] | None = None,
+) -> Dict[str, Any]:
+    """Ingest paths through the threaded pipeline and publish the new vectors as delta segments.
+
+    The ids of the chunks that changed documents replaced are appended to
+    removed_chunk_ids if given (as build() does). Returns counts plus
+    per-stage and per-queue stats (also logged).
+    """
+    init_db()
+    leftover = read_checkpoint()
+    job = current_job()
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    depth = settings.ingest_pipeline_queue_size
+    parsed_q = Channel("parsed", depth, stop)
+    stored_q = Channel("stored", depth, stop)
+    embedded_q = Channel("embedded", depth, stop)
+    stats = {name: StageStats(name) for name in ("parse", "db", "embed", "index")}
+    counts = {"unchanged": 0, "docs": 0, "failed": 0, "chunks": 0}
+    removed_ids: Set[int] = set()
+    # Embedded but not yet published: the segment being filled, its chunk ids and the replaced ids
+    segment_box: List[Any] = [None]
+    unpublished_ids: List[int] = []
+    unpublished_removed: Set[int] = set()
+
+    def parse_stage(st: StageStats) -> None:
+        db = SessionLocal()
+        try:
+            files = collect_files(paths)
+            report_progress(docs_total=len(files))
+            tasks = changed_files(db, files, max_chunk_tokens, overlap, counts)
+            t0 = time.perf_counter()
+            for item in iter_parsed(tasks, max_chunk_tokens, overlap):
+                st.busy += time.perf_counter() - t0
+                st.items += 1
+                parsed_q.put(item, st)
+                t0 = time.perf_counter()
+            st.busy += time.perf_counter() - t0
+            parsed_q.put(_DONE, st)
+        finally:
+            db.close()
+
+    def db_stage(st: StageStats) -> None:
+        db = SessionLocal()
+        batch_docs = 0
+        batch_chunks: List[tuple] = []  # (chunk id, text)
+        batch_removed: List[int] = []
+
+        def commit_batch() -> None:
+            nonlocal batch_docs
+            if batch_docs == 0:
+                return
+            t0 = time.perf_counter()
+            update_checkpoint(added=[cid for cid, _ in batch_chunks], removed=batch_removed)
+            db.commit()
+            db.expunge_all()
+            st.busy += time.perf_counter() - t0
+            # Only committed rows go downstream, and never while holding a write transaction.
+            # The last part carries the ids the batch replaced (the index stage publishes at
+            # these boundaries); a batch of emptied documents still sends one.
+            step = settings.ingest_batch_chunks
+            starts = range(0, len(batch_chunks), step) or [0]
+            for i in starts:
+                part = batch_chunks[i : i + step]
+                last = i == starts[-1]
+                stored_q.put(([cid for cid, _ in part], [text for _, text in part], list(batch_removed) if last else None), st)
+            removed_ids.update(batch_removed)
+            batch_docs = 0
+            batch_chunks.clear()
+            batch_removed.clear()
+
+        try:
+            while True:
+                if batch_docs and parsed_q.empty():
+                    # Don't hold SQLite's write lock while waiting for the parser
+                    commit_batch()
+                item = parsed_q.get(st)
+                if item is _DONE:
+                    break
+                task, parsed, error = item
+                if error is not None:
+                    counts["failed"] += 1
+                    log_parse_failure(task[0], error)
+                    continue
+                if parsed is None:
+                    continue
+                t0 = time.perf_counter()
+                doc_chunks, old_ids = store_document(db, task, parsed)
+                st.busy += time.perf_counter() - t0
+                batch_chunks.extend((c.id, c.text) for c in doc_chunks)
+                batch_removed.extend(old_ids)
+                st.items += len(doc_chunks)
+                counts["docs"] += 1
+                counts["chunks"] += len(doc_chunks)
+                report_progress(docs_loaded=1)
+                batch_docs += 1
+                if batch_docs >= settings.ingest_commit_docs:
+                    commit_batch()
+            commit_batch()
+            stored_q.put(_DONE, st)
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def embed_stage(st: StageStats) -> None:
+        while True:
+            item = stored_q.get(st)
+            if item is _DONE:
+                break
+            ids, texts, removed = item
+            t0 = time.perf_counter()
+            vecs = encode_with_cache(texts) if texts else None
+            st.busy += time.perf_counter() - t0
+            st.items += len(ids)
+            report_progress(chunks_embedded=len(ids))
+            embedded_q.put((np.asarray(ids, dtype=np.int64), vecs, removed), st)
+        embedded_q.put(_DONE, st)
+
+    def index_stage(st: StageStats) -> None:
+        db = SessionLocal()
+        try:
+            while True:
+                item = embedded_q.get(st)
+                if item is _DONE:
+                    break
+                ids, vecs, removed = item
+                t0 = time.perf_counter()
+                # A rebuild is owed anyway and re-reads every vector from the embedding cache
+                if len(ids) and not leftover["rebuild"]:
+                    if segment_box[0] is None:
+                        segment_box[0] = new_index(vecs.shape[1], 0, with_ids=True, index_type="flat")
+                    segment_box[0].add_with_ids(vecs, ids)
+                    unpublished_ids.extend(ids.tolist())
+                if removed is not None:
+                    unpublished_removed.update(removed)
+                    if len(unpublished_ids) + len(unpublished_removed) >= settings.ingest_segment_vectors:
+                        publish(db)
+                st.busy += time.perf_counter() - t0
+                st.items += len(ids)
+                report_progress(vectors_indexed=len(ids))
+        finally:
+            db.close()
+
+    def publish(db) -> None:
+        if leftover["rebuild"] or not (unpublished_ids or unpublished_removed):
+            return
+        commit_delta(segment_box[0], iter_metas_for_ids(db, unpublished_ids), set(unpublished_removed), unpublished_ids)
+        segment_box[0] = None
+        unpublished_ids.clear()
+        unpublished_removed.clear()
+
+    def run(st: StageStats, fn: Callable[[StageStats], None]) -> None:
+        st.started = time.perf_counter()
+        try:
+            with job_context(job):
+                fn(st)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            st.finished = time.perf_counter()
+
+    stage_fns = {"parse": parse_stage, "db": db_stage, "embed": embed_stage, "index": index_stage}
+    threads = [
+        threading.Thread(target=run, args=(stats[name], fn), name=f"eka-ingest-{name}", daemon=True)
+        for name, fn in stage_fns.items()
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    if removed_chunk_ids is not None:
+        removed_chunk_ids.extend(sorted(removed_ids))
+
+    # Publish the rest: a last segment + tombstones, or a rebuild if an interrupted run still owes one
+    t0 = time.perf_counter()
+    if leftover["rebuild"]:
+        rebuild_from_database(max_chunk_tokens, overlap)
+    else:
+        db = SessionLocal()
+        try:
+            publish(db)
+            if leftover["added"] or leftover["removed"]:
+                add_chunks_to_index([], db)
+        finally:
+            db.close()
+    stats["index"].busy += time.perf_counter() - t0
+
+    if job is not None:
+        for st in stats.values():
+            job.add_stage_time(st.name, st.busy)
+    summary = {
+        "docs": counts["docs"],
+        "unchanged_docs": counts["unchanged"],
+        "failed_docs": counts["failed"],
+        "chunks": counts["chunks"],
+        "chunks_removed": len(removed_ids),
+        "stages": {name: st.to_dict() for name, st in stats.items()},
+        "queues": {ch.name: ch.to_dict() for ch in (parsed_q, stored_q, embedded_q)},
+        "bottleneck": max(stats.values(), key=lambda st: st.busy).name,
+        "embed_batches": embed_batch_stats(),
+    }
+    print(json.dumps({"ingest_pipeline": summary}))
+    return summary
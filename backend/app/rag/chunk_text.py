@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, List
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.deps import SessionLocal
+from app.db.models import Chunk
+
+
+# Read-through chunk_id -> text cache for retrieval.
+#
+# The index metas carry only a preview of each chunk; retrieve() needs the
+# full text of its hits. Hot chunks are served from memory and the misses of
+# a request are fetched with one query. Ingest invalidates the ids it
+# deletes or rewrites when it publishes them (see build_index.commit_delta)
+# and clears everything on a rebuild; the TTL bounds staleness when another
+# process (the ingest CLI) changes the database.
+
+chunk_text_cache: LRUCache[str] = LRUCache(settings.chunk_text_cache_size, settings.chunk_text_cache_ttl_seconds)
+
+# Bumped by every invalidation, so a fetch that raced with one doesn't cache what it read
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def get_chunk_texts(chunk_ids: Iterable[int]) -> Dict[int, str]:
+    """Full text of each chunk id that has one, from the cache or one DB round-trip for the misses."""
+    texts: Dict[int, str] = {}
+    missing: List[int] = []
+    for cid in dict.fromkeys(chunk_ids):
+        text = chunk_text_cache.get(cid)
+        if text is None:
+            missing.append(cid)
+        else:
+            texts[cid] = text
+    if not missing:
+        return texts
+    generation = _generation
+    db = SessionLocal()
+    try:
+        rows = db.query(Chunk.id, Chunk.text).filter(Chunk.id.in_(missing)).all()
+    finally:
+        db.close()
+    cacheable = generation == _generation
+    for cid, text in rows:
+        if text:
+            texts[cid] = text
+            if cacheable:
+                chunk_text_cache.put(cid, text)
+    return texts
+
+
+def invalidate_chunk_texts(chunk_ids: Iterable[int] | None = None) -> None:
+    """Drop cached text for chunk_ids (all chunks if None) after ingest deleted or rewrote them."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    if chunk_ids is None:
+        chunk_text_cache.clear()
+        return
+    for cid in chunk_ids:
+        chunk_text_cache.pop(cid)
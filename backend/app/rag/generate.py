@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import random
 import time
 import json
 from typing import Dict
@@ -10,55 +12,32 @@ import httpx
 from app.core.config import settings
 from app.rag.guardrails import assess_confidence, enforce_min_similarity
 
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
 
+# Gemini generation over one long-lived HTTP client.
+#
+# The client is created at startup (start_gemini_client) and shared by all
+# requests: its connection pool keeps connections to the API alive between
+# calls, a semaphore caps calls in flight, every call has a deadline
+# (queueing and retries included), and connection errors, timeouts, 429s
+# and 5xx responses are retried with full-jitter exponential backoff.
+# base_url and transport are injectable, so tests run it against a local
+# stand-in server.
 
-async def call_gemini_json(prompt: str) -> Dict:
-    """Call Google Gemini API with JSON response format."""
-    api_key = settings.gemini_api_key or os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        # Fallback local answer to allow running without key
-        return {
-            "answer": "I'm not sure. Provide a Gemini API key to enable generation. Add GEMINI_API_KEY=your-key to backend/.env and restart the server.",
-            "citations": [],
-            "confidence": 0.2,
-            "telemetry": {"latency_ms": 0, "tokens_prompt": 0, "tokens_completion": 0, "cost_usd": 0},
-        }
+# Map common variations to correct model names
+MODEL_MAP = {
+    "gemini 2.5 flash": "gemini-1.5-flash",
+    "gemini-2.5-flash": "gemini-1.5-flash",
+    "gemini 2.0 flash": "gemini-2.0-flash-exp",
+    "gemini-2.0-flash": "gemini-2.0-flash-exp",
+    "gemini flash": "gemini-1.5-flash",
+    "gemini pro": "gemini-1.5-pro",
+}
+KNOWN_MODELS = ("gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash-exp")
 
-    if genai is None:
-        return {
-            "answer": "I'm not sure. Please install google-generativeai: pip install google-generativeai",
-            "citations": [],
-            "confidence": 0.2,
-            "telemetry": {"latency_ms": 0, "tokens_prompt": 0, "tokens_completion": 0, "cost_usd": 0},
-        }
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
 
-    genai.configure(api_key=api_key)
-    
-    # Validate and normalize model name
-    model_name = settings.llm_model.strip().lower()
-    # Map common variations to correct model names
-    model_map = {
-        "gemini 2.5 flash": "gemini-1.5-flash",
-        "gemini-2.5-flash": "gemini-1.5-flash",
-        "gemini 2.0 flash": "gemini-2.0-flash-exp",
-        "gemini-2.0-flash": "gemini-2.0-flash-exp",
-        "gemini flash": "gemini-1.5-flash",
-        "gemini pro": "gemini-1.5-pro",
-    }
-    if model_name in model_map:
-        model_name = model_map[model_name]
-    elif model_name not in ["gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash-exp"]:
-        # If not a known model, try to use as-is but warn
-        print(f"Warning: Unknown model name '{settings.llm_model}', using as-is")
-    
-    model = genai.GenerativeModel(model_name)
-
-    # Gemini JSON response format via prompt engineering
-    system_instruction = """You are a helpful assistant. Always respond with valid JSON only, no markdown formatting.
+# Gemini JSON response format via prompt engineering
+SYSTEM_INSTRUCTION = """You are a helpful assistant. Always respond with valid JSON only, no markdown formatting.
 Your response must be a JSON object with this exact structure:
 {
   "answer": "string",
@@ -67,39 +46,149 @@ Your response must be a JSON object with this exact structure:
   "telemetry": {"latency_ms": 0, "tokens_prompt": 0, "tokens_completion": 0, "cost_usd": 0}
 }"""
 
-    full_prompt = f"{system_instruction}\n\nUser query: {prompt}\n\nRespond with JSON only:"
 
-    t0 = time.time()
-    try:
-        # Gemini 1.5 Pro supports JSON mode
-        generation_config = genai.GenerationConfig(
-            temperature=0.2,
-            response_mime_type="application/json",
-        )
-        response = model.generate_content(
-            full_prompt,
-            generation_config=generation_config,
+def resolve_model_name(name: str) -> str:
+    """Validate and normalize a configured model name."""
+    model_name = name.strip().lower()
+    if model_name in MODEL_MAP:
+        return MODEL_MAP[model_name]
+    if model_name not in KNOWN_MODELS:
+        # If not a known model, try to use as-is but warn
+        print(f"Warning: Unknown model name '{name}', using as-is")
+    return model_name
+
+
+def _fallback(answer: str, latency_ms: int = 0) -> Dict:
+    return {
+        "answer": answer,
+        "citations": [],
+        "confidence": 0.2,
+        "telemetry": {"latency_ms": latency_ms, "tokens_prompt": 0, "tokens_completion": 0, "cost_usd": 0},
+    }
+
+
+def _strip_code_fence(content: str) -> str:
+    # Remove markdown code blocks if present
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return content.strip()
+
+
+class GeminiError(Exception):
+    """Gemini API call failed (status is the HTTP status, None for transport errors)."""
+
+    def __init__(self, message: str, status: int | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        api_key: str,
+        model: str | None = None,
+        base_url: str | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        max_concurrency: int | None = None,
+    ) -> None:
+        self.model = resolve_model_name(model or settings.llm_model)
+        self._http = httpx.AsyncClient(
+            base_url=base_url or settings.gemini_base_url,
+            headers={"x-goog-api-key": api_key},
+            timeout=httpx.Timeout(settings.gemini_timeout_seconds, connect=settings.gemini_connect_timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=settings.gemini_max_connections,
+                max_keepalive_connections=settings.gemini_max_connections,
+                keepalive_expiry=settings.gemini_keepalive_seconds,
+            ),
+            transport=transport,
         )
-        latency_ms = int((time.time() - t0) * 1000)
-        
-        # Parse JSON response
-        content = response.text.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-        
+        self._slots = asyncio.Semaphore(max_concurrency or settings.gemini_max_concurrency)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0}
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: concurrent callers that failed together don't retry together
+        cap = min(settings.gemini_backoff_max_seconds, settings.gemini_backoff_base_seconds * 2**attempt)
+        return random.uniform(0, cap)
+
+    def _retry_after(self, response: httpx.Response) -> float | None:
+        try:
+            return min(float(response.headers["retry-after"]), settings.gemini_backoff_max_seconds)
+        except (KeyError, ValueError):
+            return None
+
+    async def _post(self, body: Dict) -> Dict:
+        path = f"/v1beta/models/{self.model}:generateContent"
+        attempt = 0
+        while True:
+            delay = None
+            try:
+                response = await self._http.post(path, json=body)
+            except httpx.TransportError as e:  # connect errors, resets, read timeouts
+                error = GeminiError(f"{type(e).__name__}: {e}")
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                error = GeminiError(f"Gemini API returned {response.status_code}: {response.text[:200]}", response.status_code)
+                if response.status_code not in RETRY_STATUS:
+                    raise error
+                delay = self._retry_after(response)
+            if attempt >= settings.gemini_max_retries:
+                raise error
+            delay = self._backoff(attempt) if delay is None else delay
+            attempt += 1
+            self.stats["retries"] += 1
+            print(json.dumps({"message": "gemini_retry", "attempt": attempt, "error": str(error)[:200], "sleep_s": round(delay, 3)}))
+            await asyncio.sleep(delay)
+
+    async def generate(self, text: str, timeout: float | None = None) -> Dict:
+        """Raw generateContent response for text, within timeout seconds (settings.gemini_timeout_seconds)."""
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "generationConfig": {"temperature": 0.2, "responseMimeType": "application/json"},
+        }
+        self.stats["calls"] += 1
+        try:
+            async with asyncio.timeout(timeout or settings.gemini_timeout_seconds):
+                async with self._slots:
+                    return await self._post(body)
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+
+    async def generate_json(self, prompt: str, timeout: float | None = None) -> Dict:
+        """Answer for prompt as the JSON object of SYSTEM_INSTRUCTION, with telemetry filled in."""
+        full_prompt = f"{SYSTEM_INSTRUCTION}\n\nUser query: {prompt}\n\nRespond with JSON only:"
+        t0 = time.perf_counter()
+        data = await self.generate(full_prompt, timeout)
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+
+        candidates = data.get("candidates") or []
+        parts = []
+        if candidates:
+            parts = (candidates[0].get("content") or {}).get("parts") or []
+        content = _strip_code_fence("".join(p.get("text", "") for p in parts))
+        if not content:
+            raise GeminiError(f"Empty response (finish reason: {candidates[0].get('finishReason') if candidates else None})")
         out = json.loads(content)
-        # Estimate tokens (rough approximation)
-        tokens_prompt = len(full_prompt.split()) * 1.3  # rough estimate
-        tokens_completion = len(content.split()) * 1.3
+
+        usage = data.get("usageMetadata") or {}
+        # Rough estimate when the API doesn't report usage
+        tokens_prompt = usage.get("promptTokenCount") or len(full_prompt.split()) * 1.3
+        tokens_completion = usage.get("candidatesTokenCount") or len(content.split()) * 1.3
         # Gemini pricing estimate (very rough, actual pricing may vary)
         cost_usd = (tokens_prompt * 0.0005 / 1000) + (tokens_completion * 0.0015 / 1000)
-        
         out["telemetry"] = {
             "latency_ms": latency_ms,
             "tokens_prompt": int(tokens_prompt),
@@ -107,14 +196,60 @@ Your response must be a JSON object with this exact structure:
             "cost_usd": round(cost_usd, 6),
         }
         return out
+
+
+_client: GeminiClient | None = None
+
+
+def _api_key() -> str | None:
+    return settings.gemini_api_key or os.getenv("GEMINI_API_KEY")
+
+
+async def start_gemini_client(**kwargs) -> GeminiClient | None:
+    """Create the process-wide client (called at startup). None without an API key."""
+    global _client
+    await close_gemini_client()
+    api_key = _api_key()
+    if api_key:
+        _client = GeminiClient(api_key, **kwargs)
+    return _client
+
+
+async def close_gemini_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
+def get_gemini_client() -> GeminiClient | None:
+    """The shared client, created on first use if startup didn't (None without an API key)."""
+    global _client
+    if _client is None:
+        api_key = _api_key()
+        if api_key:
+            _client = GeminiClient(api_key)
+    return _client
+
+
+async def call_gemini_json(prompt: str) -> Dict:
+    """Call Google Gemini API with JSON response format."""
+    client = get_gemini_client()
+    if client is None:
+        # Fallback local answer to allow running without key
+        return _fallback(
+            "I'm not sure. Provide a Gemini API key to enable generation. Add GEMINI_API_KEY=your-key to backend/.env and restart the server."
+        )
+
+    t0 = time.perf_counter()
+    try:
+        return await client.generate_json(prompt)
+    except TimeoutError:
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        return _fallback(f"I'm not sure. The language model did not answer within {settings.gemini_timeout_seconds:g}s.", latency_ms)
     except Exception as e:
-        latency_ms = int((time.time() - t0) * 1000)
-        return {
-            "answer": f"I'm not sure. Error: {str(e)}",
-            "citations": [],
-            "confidence": 0.2,
-            "telemetry": {"latency_ms": latency_ms, "tokens_prompt": 0, "tokens_completion": 0, "cost_usd": 0},
-        }
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        return _fallback(f"I'm not sure. Error: {str(e)}", latency_ms)
 
 
 # Keep old function name for backward compatibility during transition
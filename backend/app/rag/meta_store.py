@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+# Columnar chunk metadata sidecar.
+#
+# Layout (little endian):
+#   header     MAGIC, uint32 version, uint32 reserved, uint64 n
+#   chunk_id   int64[n]   (-1 when unknown)
+#   position   int64[n]
+#   start      uint64[n] per string field, in STRING_FIELDS order (heap offsets)
+#   length     uint32[n] per string field
+#   heap       utf-8 bytes; identical values (titles, sources, urls) are stored once
+#
+# The file is memory-mapped, so get(idx) is a couple of array reads plus a
+# utf-8 decode of the bytes it returns - nothing is parsed up front.
+
+MAGIC = b"EKAMETA\x00"
+VERSION = 1
+STRING_FIELDS = ("title", "source", "url", "section", "text")
+PREVIEW_CHARS = 700
+_HEADER = struct.Struct("<8sIIQ")  # 24 bytes keeps the columns 8-byte aligned
+
+
+class MetaStore:
+    """Read-only, memory-mapped view over a columnar meta file."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._buf = np.memmap(self.path, dtype=np.uint8, mode="r")
+        magic, version, _, n = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a columnar meta file (version {VERSION})")
+        self._n = n
+        offset = _HEADER.size
+        self.chunk_ids = np.frombuffer(self._buf, dtype="<i8", count=n, offset=offset)
+        offset += 8 * n
+        self.positions = np.frombuffer(self._buf, dtype="<i8", count=n, offset=offset)
+        offset += 8 * n
+        self._starts: Dict[str, np.ndarray] = {}
+        self._lengths: Dict[str, np.ndarray] = {}
+        for field in STRING_FIELDS:
+            self._starts[field] = np.frombuffer(self._buf, dtype="<u8", count=n, offset=offset)
+            offset += 8 * n
+        for field in STRING_FIELDS:
+            self._lengths[field] = np.frombuffer(self._buf, dtype="<u4", count=n, offset=offset)
+            offset += 4 * n
+        self._heap_offset = offset
+        self._order: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def row_of(self, chunk_id: int) -> int | None:
+        """Row holding chunk_id (rows are written sorted by chunk_id)."""
+        if self._order is None:
+            self._order = chunk_id_order(self.chunk_ids)
+        return _lookup_row(self.chunk_ids, self._order, chunk_id)
+
+    def _string(self, field: str, idx: int) -> str:
+        start = self._heap_offset + int(self._starts[field][idx])
+        length = int(self._lengths[field][idx])
+        return bytes(self._buf[start : start + length]).decode("utf-8")
+
+    def get(self, idx: int) -> Dict:
+        if idx < 0 or idx >= self._n:
+            raise IndexError(idx)
+        meta: Dict = {field: self._string(field, idx) for field in STRING_FIELDS}
+        meta["position"] = int(self.positions[idx])
+        chunk_id = int(self.chunk_ids[idx])
+        meta["chunk_id"] = chunk_id if chunk_id >= 0 else None
+        return meta
+
+    __getitem__ = get
+
+    def __iter__(self):
+        for idx in range(self._n):
+            yield self.get(idx)
+
+
+class JsonlMetaStore:
+    """Legacy meta.jsonl loaded into a list of dicts (same interface as MetaStore)."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._metas: List[Dict] = []
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        self._metas.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        self.chunk_ids = np.asarray(
+            [m.get("chunk_id") if m.get("chunk_id") is not None else -1 for m in self._metas], dtype=np.int64
+        )
+        self._order: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._metas)
+
+    def row_of(self, chunk_id: int) -> int | None:
+        if self._order is None:
+            self._order = chunk_id_order(self.chunk_ids)
+        return _lookup_row(self.chunk_ids, self._order, chunk_id)
+
+    def get(self, idx: int) -> Dict:
+        return self._metas[idx]
+
+    __getitem__ = get
+
+    def __iter__(self):
+        return iter(self._metas)
+
+
+def chunk_id_order(chunk_ids: np.ndarray) -> np.ndarray:
+    """Sort order for looking up ids in chunk_ids with np.searchsorted.
+
+    Empty when chunk_ids is already sorted (no extra memory), else a stable
+    argsort. Shared by the meta stores and the vector file.
+    """
+    if len(chunk_ids) < 2 or bool(np.all(chunk_ids[1:] >= chunk_ids[:-1])):
+        return np.empty(0, dtype=np.int64)
+    return np.argsort(chunk_ids, kind="stable")
+
+
+def _lookup_row(chunk_ids: np.ndarray, order: np.ndarray, chunk_id: int) -> int | None:
+    if len(order):
+        pos = int(np.searchsorted(chunk_ids, chunk_id, side="right", sorter=order)) - 1
+        row = int(order[pos]) if pos >= 0 else -1
+    else:
+        pos = int(np.searchsorted(chunk_ids, chunk_id, side="right")) - 1
+        row = pos
+    # side="right" - 1 picks the last row for a duplicated id (the newest write)
+    if row >= 0 and int(chunk_ids[row]) == chunk_id:
+        return row
+    return None
+
+
+def open_meta_store(path: Path | str) -> MetaStore | JsonlMetaStore:
+    """Open a meta file, detecting columnar vs legacy JSONL by its magic bytes."""
+    path = Path(path)
+    with path.open("rb") as f:
+        head = f.read(len(MAGIC))
+    if head == MAGIC:
+        return MetaStore(path)
+    return JsonlMetaStore(path)
+
+
+def write_meta_store(path: Path | str, metas: Iterable[Dict]) -> int:
+    """Write metas to a columnar meta file atomically. Returns the row count.
+
+    The heap is streamed to a temp file; only the fixed-width columns are
+    held in memory.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunk_ids: List[int] = []
+    positions: List[int] = []
+    starts: Dict[str, List[int]] = {field: [] for field in STRING_FIELDS}
+    lengths: Dict[str, List[int]] = {field: [] for field in STRING_FIELDS}
+    interned: Dict[bytes, int] = {}
+    heap_size = 0
+
+    with tempfile.TemporaryFile(dir=path.parent) as heap:
+        for m in metas:
+            chunk_id = m.get("chunk_id")
+            chunk_ids.append(int(chunk_id) if chunk_id is not None else -1)
+            positions.append(int(m.get("position") or 0))
+            for field in STRING_FIELDS:
+                value = m.get(field) or ""
+                if field == "text":
+                    value = value[:PREVIEW_CHARS]
+                data = value.encode("utf-8")
+                # Per-document strings repeat for every chunk; store them once
+                start = interned.get(data) if field != "text" else None
+                if start is None:
+                    start = heap_size
+                    heap.write(data)
+                    heap_size += len(data)
+                    if field != "text":
+                        interned[data] = start
+                starts[field].append(start)
+                lengths[field].append(len(data))
+
+        n = len(chunk_ids)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as out:
+            out.write(_HEADER.pack(MAGIC, VERSION, 0, n))
+            out.write(np.asarray(chunk_ids, dtype="<i8").tobytes())
+            out.write(np.asarray(positions, dtype="<i8").tobytes())
+            for field in STRING_FIELDS:
+                out.write(np.asarray(starts[field], dtype="<u8").tobytes())
+            for field in STRING_FIELDS:
+                out.write(np.asarray(lengths[field], dtype="<u4").tobytes())
+            heap.seek(0)
+            while True:
+                block = heap.read(1 << 20)
+                if not block:
+                    break
+                out.write(block)
+        os.replace(tmp, path)
+    return n
+
+
+def convert_jsonl(src: Path | str, dst: Path | str) -> int:
+    """Convert a legacy meta.jsonl file to the columnar format."""
+    return write_meta_store(dst, JsonlMetaStore(src))
+
+
+def migrate_legacy_meta(path: Path | str) -> bool:
+    """Create a missing columnar meta file at path from the meta.jsonl next to it.
+
+    Indices built before the columnar format only have meta.jsonl; this
+    lets them load under the meta.bin default without a rebuild. Returns
+    True if it converted.
+    """
+    path = Path(path)
+    legacy = path.with_suffix(".jsonl")
+    if path.exists() or path.suffix == ".jsonl" or not legacy.exists():
+        return False
+    # Per-process name: several workers may start on the same legacy index
+    converted = path.with_name(f"{path.name}.{os.getpid()}.migrating")
+    n = convert_jsonl(legacy, converted)
+    os.replace(converted, path)
+    print(json.dumps({"message": "meta_migrated", "src": str(legacy), "dst": str(path), "rows": n}))
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert meta.jsonl to the columnar meta format")
+    parser.add_argument("--src", required=True)
+    parser.add_argument("--dst", required=True)
+    args = parser.parse_args()
+    n = convert_jsonl(args.src, args.dst)
+    print(json.dumps({"status": "ok", "rows": n, "meta_path": args.dst}))
+
+
+if __name__ == "__main__":
+    main()
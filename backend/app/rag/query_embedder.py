@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.ingest.embed import BGEEmbedder, get_embedder, normalize_query, query_embedding_cache
+
+
+# Micro-batched query embedding for the async API.
+#
+# Concurrent /query requests each need one query vector, and encoding them
+# one at a time leaves most of the CPU's matrix throughput unused. Pending
+# queries are encoded with one encode() call on a worker thread and each
+# caller gets its own row back. A batch goes out as soon as a worker is free
+# (after settings.query_batch_window_ms, 0 = the next loop tick) or when
+# settings.query_batch_max_size queries are waiting; while every worker is
+# busy, new queries collect into the next batch. So an idle server adds no
+# latency and a loaded one batches by itself. Identical pending queries
+# share a row, and vectors go through the same cache as encode_query().
+
+
+class QueryEmbeddingBatcher:
+    def __init__(
+        self,
+        window_ms: float | None = None,
+        max_batch: int | None = None,
+        embedder: BGEEmbedder | None = None,
+    ) -> None:
+        self.window_ms = settings.query_batch_window_ms if window_ms is None else window_ms
+        self.max_batch = max_batch or settings.query_batch_max_size
+        self._embedder = embedder
+        self._executor: ThreadPoolExecutor | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: Dict[str, asyncio.Future] = {}  # normalized query -> future for its vector
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set = set()  # running encodes (the loop only keeps weak references)
+        self._busy = 0  # encodes submitted to the worker threads
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "cache_hits": 0, "batches": 0, "batched_queries": 0, "max_batch": 0}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=settings.query_batch_workers, thread_name_prefix="eka-query-embed")
+        return self._executor
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Futures and timers belong to one event loop; start over if it changed (tests, reloads)
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = {}
+            self._timer = None
+
+    def _model_name(self) -> str:
+        # Names the shared embedder without loading it (get_embedder() may block on a cold load)
+        return self._embedder.model_name if self._embedder is not None else settings.embedding_model
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        # Runs on a worker thread: a cold model load blocks it, not the event loop
+        embedder = self._embedder or get_embedder()
+        return embedder.encode(texts)
+
+    async def embed(self, query: str) -> np.ndarray:
+        """The (1, dim) normalized vector for query, encoded together with concurrent queries."""
+        text = normalize_query(query)
+        key = (self._model_name(), text)
+        self.stats["queries"] += 1
+        vec = query_embedding_cache.get(key)
+        if vec is not None:
+            self.stats["cache_hits"] += 1
+            return vec
+
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+        future = self._pending.get(text)
+        if future is None:
+            future = loop.create_future()
+            self._pending[text] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None and self._busy < settings.query_batch_workers:
+                self._schedule(loop)
+            # else: a worker finishing its batch flushes what has collected
+        return await asyncio.shield(future)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self.window_ms > 0:
+            self._timer = loop.call_later(self.window_ms / 1000.0, self._flush)
+        else:
+            # Still gather queries that arrive in this loop iteration
+            self._timer = loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._busy += 1
+        task = asyncio.ensure_future(self._encode(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _encode(self, batch: Dict[str, asyncio.Future]) -> None:
+        model_name = self._model_name()
+        texts = list(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            vecs = await loop.run_in_executor(self._pool(), self._encode_texts, texts)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._busy -= 1
+            if self._pending and self._timer is None:
+                self._flush()
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["batched_queries"] += len(texts)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(texts))
+        for i, text in enumerate(texts):
+            vec = np.array(vecs[i : i + 1], dtype=np.float32)
+            vec.setflags(write=False)
+            query_embedding_cache.put((model_name, text), vec)
+            future = batch[text]
+            if not future.done():
+                future.set_result(vec)
+
+    def stats_snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            stats: Dict[str, float] = dict(self.stats)
+        stats["mean_batch"] = round(stats["batched_queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
+
+
+# Process-wide batcher used by /query
+query_embedder = QueryEmbeddingBatcher()
@@ -1,12 +1,32 @@
 from __future__ import annotations
 
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
-from .vector_store import FaissStore
+import numpy as np
+
+from .vector_store import FaissStore, get_store
+from .chunk_text import get_chunk_texts
 from .scoring import rerank
 from app.core.config import settings
+from app.ingest.embed import encode_query
 from app.core.deps import SessionLocal
-from app.db.models import Chunk
+from app.db.fts import search_fts
+
+
+logger = logging.getLogger(__name__)
+
+EXPANSION_MODES = ("titles", "vector")
+
+
+def configured_expansion_mode() -> str:
+    mode = settings.query_expansion_mode.strip().lower()
+    if mode not in EXPANSION_MODES:
+        raise ValueError(f"Unknown query_expansion_mode '{settings.query_expansion_mode}'. Expected one of: {', '.join(EXPANSION_MODES)}")
+    return mode
 
 
 def _expand_query_with_titles(store: FaissStore, query: str, hits: List[tuple[int, float]], num_titles: int = 3) -> str:
@@ -21,43 +41,140 @@ def _expand_query_with_titles(store: FaissStore, query: str, hits: List[tuple[in
     return query + " " + " ".join(set(titles))
 
 
-def retrieve(query: str, k: int = 20, k_final: int = 5) -> List[Dict]:
-    store = FaissStore()
-    hits = store.search(query, k)
+def _expand_query_vector(store: FaissStore, q: np.ndarray, hits: List[tuple[int, float]]) -> np.ndarray:
+    """Rocchio: alpha * q + beta * mean of the top hits' stored vectors, renormalized."""
+    ids = [idx for idx, _ in hits[: settings.rocchio_top_n]]
+    vecs, found = store.get_vectors(ids)
+    if not found.any():
+        return q
+    expanded = settings.rocchio_alpha * q.reshape(-1) + settings.rocchio_beta * vecs[found].mean(axis=0)
+    norm = np.linalg.norm(expanded)
+    if norm == 0:
+        return q
+    return (expanded / norm).astype(np.float32).reshape(1, -1)
+
+
+def _dense_search(
+    store: FaissStore,
+    query: str,
+    k: int,
+    nprobe: int | None,
+    ef_search: int | None,
+    query_vector: np.ndarray | None,
+) -> List[tuple[int, float]]:
+    hits = store.search(query, k, nprobe=nprobe, ef_search=ef_search, query_vector=query_vector)
     if settings.enable_query_expansion and hits:
-        expanded = _expand_query_with_titles(store, query, hits)
-        hits = store.search(expanded, k)
-    
-    # Batch fetch full text from database for better performance
+        if configured_expansion_mode() == "vector":
+            # Re-query in vector space: one more index probe, no model inference
+            expanded_vector = _expand_query_vector(store, query_vector, hits)
+            hits = store.search(query, k, nprobe=nprobe, ef_search=ef_search, query_vector=expanded_vector)
+        else:
+            expanded = _expand_query_with_titles(store, query, hits)
+            hits = store.search(expanded, k, nprobe=nprobe, ef_search=ef_search)
+    return hits
+
+
+_lexical_executor: ThreadPoolExecutor | None = None
+
+
+def _lexical_pool() -> ThreadPoolExecutor:
+    global _lexical_executor
+    if _lexical_executor is None:
+        _lexical_executor = ThreadPoolExecutor(
+            max_workers=settings.lexical_search_workers, thread_name_prefix="eka-lexical"
+        )
+    return _lexical_executor
+
+
+def _lexical_search(query: str, k: int) -> tuple[List[tuple[int, float]], float]:
+    t0 = time.perf_counter()
     db = SessionLocal()
+    try:
+        hits = search_fts(db, query, k)
+    finally:
+        db.close()
+    return hits, time.perf_counter() - t0
+
+
+def _fuse(store: FaissStore, q: np.ndarray, dense: List[tuple[int, float]], lexical: List[tuple[int, float]], k: int) -> List[tuple[int, float]]:
+    """Reciprocal-rank fusion of dense and BM25 hits, top k.
+
+    Hits keep their cosine similarity as score (the guardrails threshold on
+    it); lexical-only hits get theirs from the stored vectors, and are dropped
+    if the index has no vector for them (not published yet).
+    """
+    fused: Dict[int, float] = {}
+    for ranked in (dense, lexical):
+        for rank, (idx, _) in enumerate(ranked, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (settings.rrf_k + rank)
+    similarity = dict(dense)
+    lexical_only = [idx for idx, _ in lexical if idx not in similarity]
+    if lexical_only:
+        vecs, found = store.get_vectors(lexical_only)
+        dots = vecs @ q.reshape(-1)
+        for idx, ok, dot in zip(lexical_only, found, dots):
+            if ok:
+                similarity[idx] = float(dot)
+            else:
+                fused.pop(idx, None)
+    # Stable sort: ties keep dense order
+    ranked = sorted(fused, key=lambda idx: -fused[idx])[:k]
+    return [(idx, similarity[idx]) for idx in ranked]
+
+
+def retrieve(
+    query: str,
+    k: int = 20,
+    k_final: int = 5,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    query_vector: np.ndarray | None = None,
+) -> List[Dict]:
+    """Top chunks for query. query_vector is its embedding if already computed (see app.rag.query_embedder)."""
+    store = get_store()
+    # Hybrid needs chunk ids from the index; legacy row-numbered indices stay dense-only
+    hybrid = settings.retrieval_mode == "hybrid" and store.id_mapped
+    vector_expansion = settings.enable_query_expansion and configured_expansion_mode() == "vector"
+    if (hybrid or vector_expansion) and query_vector is None:
+        # Encode once here; the expanded search and the fusion reuse the vector
+        query_vector = encode_query(query, store.embedder)
+    t0 = time.perf_counter()
+    lexical_future = _lexical_pool().submit(_lexical_search, query, settings.lexical_top_k or k) if hybrid else None
+    hits = _dense_search(store, query, k, nprobe, ef_search, query_vector)
+    if lexical_future is not None:
+        dense_s = time.perf_counter() - t0
+        lexical_hits, lexical_s = lexical_future.result()
+        t1 = time.perf_counter()
+        dense_hits = hits
+        hits = _fuse(store, query_vector, dense_hits, lexical_hits, k)
+        fuse_s = time.perf_counter() - t1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                "message": "hybrid_retrieval",
+                "dense_ms": round(dense_s * 1000, 2),
+                "lexical_ms": round(lexical_s * 1000, 2),
+                "fusion_ms": round(fuse_s * 1000, 2),
+                "total_ms": round((time.perf_counter() - t0) * 1000, 2),
+                "dense_hits": len(dense_hits),
+                "lexical_hits": len(lexical_hits),
+                "overlap": len({idx for idx, _ in dense_hits} & {idx for idx, _ in lexical_hits}),
+            }))
     
-    # Collect all chunk IDs first
-    chunk_ids_to_fetch = []
+    # The reranker scores up to reranker_max_pairs candidates; otherwise only k_final are returned
+    if settings.enable_reranker:
+        candidates = hits[:max(settings.reranker_max_pairs, k_final)]
+    else:
+        candidates = hits[:k_final]
     meta_list = []
-    for rank, (idx, score) in enumerate(hits[:k_final], start=1):
+    for rank, (idx, score) in enumerate(candidates, start=1):
         meta = store.get_meta(idx)
-        chunk_id = meta.get("chunk_id")
-        if chunk_id:
-            chunk_ids_to_fetch.append(chunk_id)
-        meta_list.append((rank, idx, score, meta, chunk_id))
-    
-    # Batch fetch all chunks in one query
-    chunk_text_map = {}
-    if chunk_ids_to_fetch:
-        chunks = db.query(Chunk).filter(Chunk.id.in_(chunk_ids_to_fetch)).all()
-        chunk_text_map = {chunk.id: chunk.text for chunk in chunks if chunk.text}
+        meta_list.append((rank, idx, score, meta, meta.get("chunk_id")))
     
-    db.close()
+    # Full text from the chunk text cache; misses cost one DB round-trip for the whole request
+    chunk_text_map = get_chunk_texts(chunk_id for *_, chunk_id in meta_list if chunk_id)
     
-    # Optional reranker can be added later; for now take top k_final
     results: List[Dict] = []
     for rank, idx, score, meta, chunk_id in meta_list:
-        text = meta.get("text", "")
-        
-        # Use full text from database if available
-        if chunk_id and chunk_id in chunk_text_map:
-            text = chunk_text_map[chunk_id]
-        
         results.append({
             "rank": rank,
             "score": score,
@@ -68,50 +185,12 @@ def retrieve(query: str, k: int = 20, k_final: int = 5) -> List[Dict]:
             "position": meta.get("position", 0),
             "index": idx,
             "chunk_id": chunk_id,
-            "text": text,
+            # Metas only hold a preview; use the full text when the chunk still exists
+            "text": chunk_text_map.get(chunk_id, meta.get("text", "")),
         })
     
-    if settings.enable_reranker and len(hits) > 0:
-        # Batch fetch chunks for reranking
-        rerank_chunk_ids = []
-        rerank_meta_list = []
-        for rank, (idx, score) in enumerate(hits, start=1):
-            meta = store.get_meta(idx)
-            chunk_id = meta.get("chunk_id")
-            if chunk_id:
-                rerank_chunk_ids.append(chunk_id)
-            rerank_meta_list.append((rank, idx, score, meta, chunk_id))
-        
-        # Batch fetch all chunks for reranking
-        rerank_chunk_text_map = {}
-        if rerank_chunk_ids:
-            rerank_db = SessionLocal()
-            rerank_chunks = rerank_db.query(Chunk).filter(Chunk.id.in_(rerank_chunk_ids)).all()
-            rerank_chunk_text_map = {chunk.id: chunk.text for chunk in rerank_chunks if chunk.text}
-            rerank_db.close()
-        
-        # prepare pre-results from full k, then rerank and cut to k_final
-        pre: List[Dict] = []
-        for rank, idx, score, meta, chunk_id in rerank_meta_list:
-            text = meta.get("text", "")
-            
-            # Use full text from database if available
-            if chunk_id and chunk_id in rerank_chunk_text_map:
-                text = rerank_chunk_text_map[chunk_id]
-            
-            pre.append({
-                "rank": rank,
-                "score": score,
-                "title": meta.get("title", ""),
-                "url": meta.get("url", ""),
-                "source": meta.get("source", ""),
-                "section": meta.get("section", ""),
-                "position": meta.get("position", 0),
-                "index": idx,
-                "chunk_id": chunk_id,
-                "text": text,
-            })
-        results = rerank(query, pre, k_final)
+    if settings.enable_reranker and results:
+        results = rerank(query, results, k_final)
     
     return results
 
@@ -1,35 +1,95 @@
 from __future__ import annotations
 
-from typing import List, Dict
+import hashlib
+import zlib
+from typing import List, Dict, Tuple
 
 from sentence_transformers import CrossEncoder
 
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.ingest.embed import normalize_query
+from app.ingest.onnx_backend import load_model
 
 
 _cross_encoder: CrossEncoder | None = None
 
+# Cross-encoder scores keyed by (query hash, chunk_id, chunk text crc); the
+# crc keeps a score from outliving an edit of its chunk (SQLite reuses ids)
+rerank_score_cache: LRUCache[float] = LRUCache(settings.rerank_cache_size, settings.rerank_cache_ttl_seconds)
+
 
 def get_cross_encoder() -> CrossEncoder:
     global _cross_encoder
     if _cross_encoder is None:
-        _cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+        _cross_encoder = load_model(
+            CrossEncoder,
+            settings.reranker_model,
+            settings.reranker_backend,
+            settings.onnx_quantization,
+            max_length=settings.reranker_max_length,
+        )
     return _cross_encoder
 
 
+def _passage(r: Dict) -> str:
+    # Full chunk text when retrieve() fetched it; title + section otherwise
+    text = r.get('text') or ''
+    return text if text.strip() else r.get('title', '') + ' ' + r.get('section', '')
+
+
+def _cache_key(query_hash: str, r: Dict, passage: str) -> Tuple | None:
+    chunk_id = r.get('chunk_id')
+    if chunk_id is None:
+        return None
+    return (query_hash, int(chunk_id), zlib.crc32(passage.encode('utf-8')))
+
+
 def rerank(query: str, results: List[Dict], top_k: int) -> List[Dict]:
+    """Re-order results by cross-encoder score of (query, chunk text).
+
+    Only the first settings.reranker_max_pairs results are scored; pairs
+    scored before for the same query come from rerank_score_cache.
+    """
     if not results:
         return results
-    model = get_cross_encoder()
-    pairs = [(query, r.get('title', '') + ' ' + r.get('section', '')) for r in results]
-    scores = model.predict(pairs)
-    rescored = [({**r}, float(s)) for r, s in zip(results, scores)]
+    candidates = results[:settings.reranker_max_pairs]
+    query_hash = hashlib.sha1(f"{settings.reranker_model}\x00{normalize_query(query)}".encode('utf-8')).hexdigest()
+
+    scores: List[float | None] = []
+    keys: List[Tuple | None] = []
+    todo: List[int] = []
+    passages = [_passage(r) for r in candidates]
+    for i, (r, passage) in enumerate(zip(candidates, passages)):
+        key = _cache_key(query_hash, r, passage)
+        score = rerank_score_cache.get(key) if key is not None else None
+        keys.append(key)
+        scores.append(score)
+        if score is None:
+            todo.append(i)
+
+    if todo:
+        model = get_cross_encoder()
+        predicted = model.predict(
+            [(query, passages[i]) for i in todo],
+            batch_size=settings.reranker_batch_size,
+            show_progress_bar=False,
+        )
+        for i, s in zip(todo, predicted):
+            scores[i] = float(s)
+            if keys[i] is not None:
+                rerank_score_cache.put(keys[i], float(s))
+
+    rescored = [({**r}, float(s)) for r, s in zip(candidates, scores)]
     rescored.sort(key=lambda x: x[1], reverse=True)
     out = []
     for rank, (r, s) in enumerate(rescored[:top_k], start=1):
         r['score'] = float(s)
         r['rank'] = rank
         out.append(r)
+    # Past the cap: unscored results keep their retrieval order
+    for r in results[len(candidates):]:
+        if len(out) >= top_k:
+            break
+        out.append({**r, 'rank': len(out) + 1})
     return out
-
-
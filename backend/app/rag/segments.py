@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+
+# Delta segments (LSM-style) next to the base index.
+#
+# Small ingests are written as new, immutable segment files instead of
+# rewriting the base index. A manifest committed by atomic rename lists the
+# live segments and the tombstones (deleted/replaced chunk ids):
+#
+#   {
+#     "version": 1,
+#     "next_seq": 7,
+#     "base": {"index": [mtime_ns, size], "meta": [mtime_ns, size]},
+#     "segments": [{"seq": 5, "name": "seg-000005", "ntotal": 12}, ...],
+#     "tombstones": {"<chunk_id>": <seq>, ...}
+#   }
+#
+# The base has seq 0 and each segment the seq it was written with. A
+# tombstone (id, t) hides id in every source with seq < t, so a chunk
+# deleted and re-added (or updated) is only visible in its newest segment.
+# "base" records the stamps of the base files the manifest was written for,
+# letting readers detect a base rewritten under an older manifest.
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(index_path: Path) -> Path:
+    return index_path.with_name(index_path.name + ".manifest.json")
+
+
+def segments_dir(index_path: Path) -> Path:
+    return index_path.parent / "segments"
+
+
+def segment_paths(index_path: Path, name: str) -> Tuple[Path, Path]:
+    seg_dir = segments_dir(index_path)
+    return seg_dir / f"{name}.index", seg_dir / f"{name}.meta"
+
+
+def empty_manifest(next_seq: int = 1) -> Dict:
+    return {"version": MANIFEST_VERSION, "next_seq": next_seq, "base": None, "segments": [], "tombstones": {}}
+
+
+def read_manifest(index_path: Path) -> Dict | None:
+    """The manifest for index_path, or None for an index written before segments existed."""
+    path = manifest_path(index_path)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    if data.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}")
+    return data
+
+
+def write_manifest(index_path: Path, manifest: Dict) -> None:
+    """Commit a manifest atomically (temp file + rename)."""
+    path = manifest_path(index_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def tombstones(manifest: Dict | None) -> Dict[int, int]:
+    if not manifest:
+        return {}
+    return {int(k): int(v) for k, v in manifest.get("tombstones", {}).items()}
+
+
+def hidden_ids(tomb: Dict[int, int], seq: int) -> List[int]:
+    """Ids whose vectors in a source with this seq are deleted or superseded."""
+    return sorted(cid for cid, t in tomb.items() if t > seq)
+
+
+def segment_vectors(manifest: Dict | None) -> int:
+    if not manifest:
+        return 0
+    return sum(int(s.get("ntotal", 0)) for s in manifest.get("segments", []))
+
+
+def needs_compaction(manifest: Dict | None) -> bool:
+    if not manifest:
+        return False
+    return (
+        segment_vectors(manifest) >= settings.segment_compact_threshold
+        or len(manifest.get("segments", [])) >= settings.segment_max_count
+        or len(manifest.get("tombstones", {})) >= settings.segment_compact_threshold
+    )
+
+
+def remove_stale_segments(index_path: Path, manifest: Dict) -> None:
+    """Delete segment files the manifest no longer references."""
+    live = {s["name"] for s in manifest.get("segments", [])}
+    seg_dir = segments_dir(index_path)
+    if not seg_dir.exists():
+        return
+    for path in seg_dir.iterdir():
+        name = path.name.split(".", 1)[0]
+        if name.startswith("seg-") and name not in live:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import struct
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from .meta_store import chunk_id_order
+
+
+# Full-precision vectors next to a compressed base index.
+#
+# When the base index stores vectors as float16 / SQ8 / PQ codes, searches
+# take candidates from the codes and re-score them exactly against this
+# file. It is memory-mapped, so only the rows of re-scored candidates are
+# ever paged in; the resident set is the compressed index.
+#
+# Layout (little endian):
+#   header    MAGIC, uint32 version, uint32 dim, uint64 n
+#   vectors   float32[n, dim]
+#   ids       int64[n]  (chunk ids, any order)
+
+MAGIC = b"EKAVECS\x00"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQ")
+
+
+def vectors_path(index_path: Path) -> Path:
+    return index_path.with_name(index_path.name + ".vectors")
+
+
+class VectorFile:
+    """Read-only, memory-mapped chunk id -> float32 vector lookup."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._buf = np.memmap(self.path, dtype=np.uint8, mode="r")
+        magic, version, dim, n = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a vector file (version {VERSION})")
+        self.dim = dim
+        self._n = n
+        offset = _HEADER.size
+        self.vectors = np.frombuffer(self._buf, dtype="<f4", count=n * dim, offset=offset).reshape(n, dim)
+        offset += 4 * n * dim
+        self.ids = np.frombuffer(self._buf, dtype="<i8", count=n, offset=offset)
+        self._order: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def rows_of(self, ids: np.ndarray) -> np.ndarray:
+        """Row of each id, -1 where the file has no vector for it."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._n == 0 or len(ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        if self._order is None:
+            self._order = chunk_id_order(self.ids)
+        if len(self._order):
+            pos = np.clip(np.searchsorted(self.ids, ids, sorter=self._order), 0, self._n - 1)
+            rows = self._order[pos]
+        else:
+            rows = np.clip(np.searchsorted(self.ids, ids), 0, self._n - 1)
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def scores(self, ids: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Exact inner products of query with the stored vectors of ids (NaN where missing)."""
+        rows = self.rows_of(ids)
+        out = np.full(len(rows), np.nan, dtype=np.float32)
+        found = rows >= 0
+        if found.any():
+            # Sorted row order keeps page-cache reads sequential-ish
+            wanted = np.sort(rows[found])
+            dots = self.vectors[wanted] @ np.asarray(query, dtype=np.float32).reshape(-1)
+            out[found] = dots[np.searchsorted(wanted, rows[found])]
+        return out
+
+    def iter_blocks(self, block_rows: int = 65536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """(ids, vectors) in blocks, in file order."""
+        for start in range(0, self._n, block_rows):
+            yield self.ids[start : start + block_rows], self.vectors[start : start + block_rows]
+
+
+class VectorFileWriter:
+    """Streams (id, vector) rows into a vector file; close() commits it by atomic rename."""
+
+    def __init__(self, path: Path | str, dim: int) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._out = self._tmp.open("wb")
+        self._out.write(_HEADER.pack(MAGIC, VERSION, dim, 0))
+        self._ids: list[np.ndarray] = []
+        self.n = 0
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim or vectors.shape[0] != len(ids):
+            raise ValueError(f"Expected {len(ids)} x {self.dim} vectors, got {vectors.shape}")
+        self._out.write(vectors.tobytes())
+        self._ids.append(np.asarray(ids, dtype="<i8"))
+        self.n += len(ids)
+
+    def close(self) -> Path:
+        for ids in self._ids:
+            self._out.write(ids.tobytes())
+        self._out.seek(0)
+        self._out.write(_HEADER.pack(MAGIC, VERSION, self.dim, self.n))
+        self._out.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._out.close()
+        self._tmp.unlink(missing_ok=True)
@@ -1,50 +1,298 @@
 from __future__ import annotations
 
 import faiss  # type: ignore
+import heapq
 import json
+import threading
+import time
 from pathlib import Path
 from typing import List, Tuple, Dict
 
 import numpy as np
 
 from app.core.config import settings
-from app.ingest.embed import BGEEmbedder
+from app.ingest.embed import BGEEmbedder, encode_query, get_embedder
+from app.ingest.index_factory import enable_reconstruct, is_id_mapped, read_index, search_params
+from .meta_store import migrate_legacy_meta, open_meta_store
+from .vector_file import VectorFile, vectors_path
+from .segments import hidden_ids, manifest_path, read_manifest, segment_paths, tombstones
+
+
+def file_stamp(path: Path) -> Tuple[int, int] | None:
+    """Return (mtime_ns, size) for path, or None if it does not exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def store_stamp(index_path: Path, meta_path: Path) -> tuple:
+    """Version stamp of everything a store is loaded from (segments are immutable)."""
+    return (file_stamp(index_path), file_stamp(meta_path), file_stamp(manifest_path(index_path)))
+
+
+class _Source:
+    """One searchable part of the store: the base index (seq 0) or a delta segment."""
+
+    def __init__(self, seq: int, index: faiss.Index, metas, hidden: List[int], exact: VectorFile | None = None) -> None:
+        self.seq = seq
+        self.index = index
+        self.metas = metas
+        # Full-precision vectors when index holds compressed codes (candidates are re-scored)
+        self.exact = exact
+        # Excludes ids deleted/superseded by newer writes inside the FAISS search itself
+        self.selector = None
+        if hidden:
+            self._hidden = np.asarray(hidden, dtype=np.int64)
+            self._batch = faiss.IDSelectorBatch(self._hidden)
+            self.selector = faiss.IDSelectorNot(self._batch)
 
 
 class FaissStore:
-    def __init__(self, index_path: str | None = None, meta_path: str | None = None) -> None:
+    def __init__(
+        self,
+        index_path: str | None = None,
+        meta_path: str | None = None,
+        embedder: BGEEmbedder | None = None,
+    ) -> None:
         self.index_path = Path(index_path or settings.index_path)
         self.meta_path = Path(meta_path or settings.doc_meta_path)
         
+        migrate_legacy_meta(self.meta_path)
         # Check if index exists
         if not self.index_path.exists():
             raise FileNotFoundError(f"FAISS index not found at {self.index_path}. Please ingest documents first.")
         if not self.meta_path.exists():
             raise FileNotFoundError(f"Meta file not found at {self.meta_path}. Please ingest documents first.")
         
-        self.index = faiss.read_index(str(self.index_path))
+        # Version stamp of the files this store was loaded from
+        self.stamp = store_stamp(self.index_path, self.meta_path)
+        self.manifest = read_manifest(self.index_path)
+        self.index = read_index(self.index_path)
+        # IDMap indices return chunk ids; legacy ones return meta row numbers
+        self.id_mapped = is_id_mapped(self.index)
         
-        # Load metadata
-        meta_lines = self.meta_path.read_text(encoding="utf-8").strip().splitlines()
-        self.metas: List[Dict] = []
-        for line in meta_lines:
-            if line.strip():
-                try:
-                    self.metas.append(json.loads(line))
-                except json.JSONDecodeError:
-                    continue
+        # Columnar meta files are memory-mapped; legacy meta.jsonl is parsed
+        self.metas = open_meta_store(self.meta_path)
         
-        if not self.metas:
+        if len(self.metas) == 0:
             raise ValueError(f"No metadata found in {self.meta_path}")
         
-        self.embedder = BGEEmbedder(settings.embedding_model)
+        # The manifest must describe this exact base, else ingest replaced it mid-load
+        base = (self.manifest or {}).get("base")
+        if base is not None and (tuple(base["index"]), tuple(base["meta"])) != self.stamp[:2]:
+            raise ValueError("Base index changed while loading")
+        
+        exact = None
+        if base is not None and base.get("vectors") is not None:
+            exact_path = vectors_path(self.index_path)
+            if file_stamp(exact_path) != tuple(base["vectors"]):
+                raise ValueError("Base index changed while loading")
+            exact = VectorFile(exact_path)
+        
+        tomb = tombstones(self.manifest)
+        self.sources: List[_Source] = [_Source(0, self.index, self.metas, hidden_ids(tomb, 0), exact)]
+        for seg in (self.manifest or {}).get("segments", []):
+            seg_index_path, seg_meta_path = segment_paths(self.index_path, seg["name"])
+            self.sources.append(
+                _Source(seg["seq"], read_index(seg_index_path), open_meta_store(seg_meta_path), hidden_ids(tomb, seg["seq"]))
+            )
+        # Query expansion and fusion read stored vectors back (older IVF files lack the map)
+        for src in self.sources:
+            enable_reconstruct(src.index)
+        
+        self.embedder = embedder or get_embedder()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(src.index.ntotal for src in self.sources)
+
+    def search(
+        self,
+        query: str,
+        k: int = 20,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        query_vector: np.ndarray | None = None,
+    ) -> List[Tuple[int, float]]:
+        # query_vector: the query's (1, dim) embedding if the caller already has it
+        if query_vector is not None:
+            q = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        else:
+            q = encode_query(query, self.embedder)  # already normalized, cached per query
+        hits: List[Tuple[int, float]] = []
+        for src in self.sources:
+            rescore = src.exact is not None and settings.rescore_candidates > 1
+            # Compressed codes only pick candidates; over-fetch, then rank by exact scores
+            fetch = k * settings.rescore_candidates if rescore else k
+            # nprobe (IVF) / ef_search (HNSW) override the configured defaults for this call
+            params = search_params(src.index, nprobe, ef_search, src.selector)
+            if params is not None:
+                D, I = src.index.search(q, fetch, params=params)
+            else:
+                D, I = src.index.search(q, fetch)
+            found = I[0] != -1
+            ids, scores = I[0][found], D[0][found]
+            if rescore and len(ids):
+                exact = src.exact.scores(ids, q)
+                scores = np.where(np.isnan(exact), scores, exact)
+                top = np.argsort(-scores, kind="stable")[:k]
+                ids, scores = ids[top], scores[top]
+            hits.extend((int(idx), float(score)) for idx, score in zip(ids, scores))
+        if len(self.sources) > 1:
+            # Merge base + segment results into one top-k
+            hits = heapq.nlargest(k, hits, key=lambda h: h[1])
+        return hits
 
-    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
-        q = self.embedder.encode([query])  # already normalized
-        D, I = self.index.search(q, k)
-        return [(int(idx), float(score)) for idx, score in zip(I[0], D[0]) if idx != -1]
+    def _source_of(self, idx: int) -> _Source | None:
+        # Newest source wins: older copies of an id are superseded
+        for src in reversed(self.sources):
+            if src.metas.row_of(idx) is not None:
+                return src
+        return None
+
+    def get_vectors(self, ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Stored vectors for search hit ids as (vectors, found mask), without running the model.
+
+        Exact vectors come from the vector file of a compressed base or a
+        flat index; other indices decode their codes (approximate).
+        """
+        d = self.sources[0].index.d
+        out = np.zeros((len(ids), d), dtype=np.float32)
+        found = np.zeros(len(ids), dtype=bool)
+        for i, idx in enumerate(ids):
+            src = self._source_of(idx) if self.id_mapped else self.sources[0]
+            if src is None:
+                continue
+            if src.exact is not None:
+                row = src.exact.rows_of(np.asarray([idx]))[0]
+                if row >= 0:
+                    out[i] = src.exact.vectors[row]
+                    found[i] = True
+                    continue
+            try:
+                out[i] = src.index.reconstruct(int(idx))
+                found[i] = True
+            except RuntimeError:
+                pass
+        return out, found
 
     def get_meta(self, idx: int) -> Dict:
-        return self.metas[idx]
+        """Metadata for a search hit id (a chunk id for IDMap indices)."""
+        if not self.id_mapped:
+            return self.metas[idx]
+        src = self._source_of(idx)
+        if src is None:
+            return {}
+        return src.metas[src.metas.row_of(idx)]
+
+
+class StoreManager:
+    """Process-wide holder for a loaded FaissStore with hot reload.
+
+    The store is loaded once and shared by all requests. The index and meta
+    files are polled (mtime/size) at most every ``check_interval`` seconds;
+    when they change a fresh store is loaded in the calling thread while
+    other threads keep serving from the current one, then the reference is
+    swapped. Callers should grab the store once per request and use that
+    reference throughout.
+    """
+
+    def __init__(
+        self,
+        index_path: str | None = None,
+        meta_path: str | None = None,
+        check_interval: float | None = None,
+    ) -> None:
+        self.index_path = Path(index_path or settings.index_path)
+        self.meta_path = Path(meta_path or settings.doc_meta_path)
+        self.check_interval = settings.index_reload_interval_seconds if check_interval is None else check_interval
+        self._store: FaissStore | None = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _current_stamp(self) -> tuple:
+        return store_stamp(self.index_path, self.meta_path)
+
+    def _load(self) -> FaissStore | None:
+        before = self._current_stamp()
+        store = FaissStore(str(self.index_path), str(self.meta_path))
+        # Files changed while we were reading them (ingest mid-write) or the
+        # index and meta disagree: discard and try again on the next check.
+        if self._current_stamp() != before or store.index.ntotal != len(store.metas):
+            return None
+        store.stamp = before
+        return store
+
+    def _first_load(self) -> FaissStore:
+        # Retry briefly if we raced an ingest commit; there is no older store to fall back to
+        for _ in range(20):
+            try:
+                store = self._load()
+            except ValueError as e:
+                if "changed while loading" not in str(e):
+                    raise
+                store = None
+            if store is not None:
+                return store
+            time.sleep(0.05)
+        return FaissStore(str(self.index_path), str(self.meta_path))
+
+    def get(self) -> FaissStore:
+        store = self._store
+        if store is None:
+            # Nothing to serve yet: the first caller loads, the rest wait.
+            with self._reload_lock:
+                if self._store is None:
+                    self._store = self._first_load()
+                    self._last_check = time.monotonic()
+                return self._store
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return store
+        self._last_check = now
+        if self._current_stamp() == store.stamp:
+            return store
+
+        # Only one thread reloads; everyone else keeps the current store.
+        if not self._reload_lock.acquire(blocking=False):
+            return store
+        try:
+            if self._store is store:
+                try:
+                    fresh = self._load()
+                except (FileNotFoundError, ValueError, RuntimeError) as e:
+                    print(json.dumps({"warning": f"Index reload failed, keeping current store: {str(e)}"}))
+                    fresh = None
+                if fresh is not None:
+                    self._store = fresh
+                    print(json.dumps({"message": "index_reloaded", "vectors": fresh.index.ntotal}))
+            return self._store
+        finally:
+            self._reload_lock.release()
+
+    def invalidate(self) -> None:
+        """Force a stamp check on the next get()."""
+        self._last_check = 0.0
+
+
+_store_manager: StoreManager | None = None
+_store_manager_lock = threading.Lock()
+
+
+def get_store() -> FaissStore:
+    """Return the shared FaissStore for this process, reloading it if ingest changed the files."""
+    global _store_manager
+    if _store_manager is None:
+        with _store_manager_lock:
+            if _store_manager is None:
+                _store_manager = StoreManager()
+    return _store_manager.get()
 
 
+def invalidate_store() -> None:
+    """Make the next get_store() call check the index files immediately."""
+    if _store_manager is not None:
+        _store_manager.invalidate()
@@ -1,8 +1,57 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Add backend directory to Python path
 backend_dir = Path(__file__).parent.parent
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
+
+@pytest.fixture(autouse=True)
+def isolated_index(tmp_path, monkeypatch):
+    """Keep each test's index, meta store and ingest checkpoint under tmp_path, not backend/data."""
+    from app.core.config import settings
+    from app.rag import vector_store
+
+    index_dir = tmp_path / "indices"
+    monkeypatch.setattr(settings, "index_path", str(index_dir / "faiss.index"))
+    monkeypatch.setattr(settings, "doc_meta_path", str(index_dir / "meta.bin"))
+    # The process-wide store manager is bound to the paths it was created with
+    monkeypatch.setattr(vector_store, "_store_manager", None)
+    return index_dir
+
+
+@pytest.fixture(autouse=True)
+def isolated_db(tmp_path, monkeypatch):
+    """Point the engine and SessionLocal (sync and async) at a fresh SQLite file under tmp_path."""
+    from sqlalchemy import create_engine, event
+    from app.core import deps
+    from app.core.config import settings
+    from app.rag.chunk_text import invalidate_chunk_texts
+
+    path = tmp_path / "eka.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    event.listen(engine, "connect", deps.set_sqlite_pragma)
+    monkeypatch.setattr(settings, "db_url", f"sqlite:///{path}")
+    monkeypatch.setattr(deps, "engine", engine)
+    previous = deps.SessionLocal.kw["bind"]
+    deps.SessionLocal.configure(bind=engine)
+    async_engine = None
+    if deps.AsyncSessionLocal is not None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        previous_async = deps.AsyncSessionLocal.kw["bind"]
+        deps.AsyncSessionLocal.configure(bind=async_engine)
+    # Cached chunk texts belong to whichever database they were read from
+    invalidate_chunk_texts()
+    deps.init_db()
+    yield engine
+    deps.SessionLocal.configure(bind=previous)
+    if async_engine is not None:
+        deps.AsyncSessionLocal.configure(bind=previous_async)
+        async_engine.sync_engine.dispose()
+    invalidate_chunk_texts()
+    engine.dispose()
@@ -1,3 +1,5 @@
+import time
+
 from fastapi.testclient import TestClient
 from app.api.main import app
 from app.ingest.build_index import build
@@ -16,7 +18,15 @@ def test_ingest_and_query_and_feedback():
     build(["data/raw"], 256, 32)
     # ingest endpoint
     r = client.post("/ingest", json={"paths": ["data/raw"], "max_chunk_tokens": 256, "overlap": 32})
-    assert r.status_code == 200
+    assert r.status_code == 202
+    job_url = r.json()["status_url"]
+    for _ in range(200):
+        job = client.get(job_url).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "succeeded"
+    assert "load" in job["stages_ms"]
     # query endpoint
     q = client.post("/query", json={"query": "What is RAG?", "top_k": 10, "k_final": 3})
     assert q.status_code == 200
@@ -28,3 +38,100 @@ def test_ingest_and_query_and_feedback():
     assert fb.status_code == 200
 
 
+def test_health_reports_readiness(monkeypatch):
+    from app.ingest import embed
+    from app.ingest.embed import get_embedder, warmup_embedder
+    monkeypatch.setattr(embed, "_warmed", set())
+    get_embedder()
+    # Loaded, but the warmup encode hasn't run yet
+    assert client.get("/health").json().get("ready") is False
+    warmup_embedder()
+    r = client.get("/health")
+    assert r.json().get("ready") is True
+
+
+def test_delete_document_is_queued_as_a_job(tmp_path):
+    from app.core.deps import SessionLocal
+    from app.db.models import Chunk
+
+    (tmp_path / "to_delete.md").write_text("# To delete\n" + "short lived document " * 10)
+    chunk_ids = build([str(tmp_path)], 64, 8, skip_index=True)
+    db = SessionLocal()
+    try:
+        doc_id = db.get(Chunk, chunk_ids[0]).doc_id
+    finally:
+        db.close()
+
+    r = client.delete(f"/documents/{doc_id}")
+    assert r.status_code == 202
+    for _ in range(200):
+        job = client.get(r.json()["status_url"]).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "succeeded"
+    assert job["kind"] == "delete"
+    assert job["result"]["chunks_removed"] == len(chunk_ids)
+    assert client.delete(f"/documents/{doc_id}").status_code == 404
+
+
+def test_upload_streaming_limits(monkeypatch):
+    from app.api.uploads import upload_budget
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "upload_max_file_bytes", 64)
+    files = [
+        ("files", ("big.md", b"# Big\n" + b"x" * 500, "text/markdown")),
+        ("files", ("notes.txt", b"plain text", "text/plain")),
+    ]
+    r = client.post("/ingest/upload", files=files, data={"max_chunk_tokens": "128"})
+    assert r.status_code == 400
+    body = r.json()
+    assert body["status"] == "error"
+    assert {s["filename"]: s["reason"] for s in body["skipped"]} == {"big.md": "too_large", "notes.txt": "unsupported"}
+    assert upload_budget.used == 0
+
+    monkeypatch.setattr(upload_budget, "limit", 16)
+    r = client.post("/ingest/upload", files=[("files", ("a.md", b"# A\n" + b"y" * 100, "text/markdown"))])
+    assert r.status_code == 503
+    assert upload_budget.used == 0
+
+
+def test_concurrent_queries_do_not_block_each_other(monkeypatch):
+    import asyncio
+    import httpx
+    import numpy as np
+    import app.api.routes_query as routes_query
+    from app.core.deps import init_db
+
+    init_db()
+    delay = 0.3
+
+    async def embed(query):
+        return np.zeros((1, 8), dtype=np.float32)
+
+    def slow_retrieve(query, *args, **kwargs):
+        time.sleep(delay)  # blocking, like a FAISS search
+        return [{"rank": 1, "score": 0.9, "title": "t", "url": "", "source": "s", "section": "", "position": 0,
+                 "index": 1, "chunk_id": None, "text": "context"}]
+
+    async def slow_llm(prompt):
+        await asyncio.sleep(delay)
+        return {"answer": "ok", "citations": [], "confidence": 0.9,
+                "telemetry": {"latency_ms": 300, "tokens_prompt": 10, "tokens_completion": 2, "cost_usd": 0}}
+
+    monkeypatch.setattr(routes_query.query_embedder, "embed", embed)
+    monkeypatch.setattr(routes_query, "retrieve", slow_retrieve)
+    monkeypatch.setattr(routes_query, "call_gemini_json", slow_llm)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            t0 = time.perf_counter()
+            responses = await asyncio.gather(*(ac.post("/query", json={"query": f"question {i}"}) for i in range(4)))
+            return responses, time.perf_counter() - t0
+
+    responses, elapsed = asyncio.run(run())
+    assert [r.json()["answer"] for r in responses] == ["ok"] * 4
+    # Serially this takes 4 x (retrieve + LLM) = 2.4s
+    assert elapsed < 4 * 2 * delay / 2
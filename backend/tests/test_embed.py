@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.ingest.embed import get_embedder
+
+
+def test_length_bucketed_encode_keeps_input_order(monkeypatch, capsys):
+    embedder = get_embedder()
+    texts = ["short", "word " * 200, "a medium length sentence about indexes", "word " * 60, "x"]
+    monkeypatch.setattr(embedder, "batch_tokens", 256)
+
+    lengths = embedder.token_lengths(texts)
+    batches = embedder.plan_batches(lengths)
+    assert sorted(i for b in batches for i in b) == list(range(len(texts)))
+    assert all(len(b) == 1 or lengths[b[0]] * len(b) <= 256 for b in batches)
+
+    before = embedder.padding_stats()
+    vecs = embedder.encode(texts)
+    one_by_one = np.vstack([embedder.encode([t]) for t in texts])
+    assert np.allclose(vecs, one_by_one, atol=1e-5)
+
+    stats = embedder.padding_stats()
+    assert stats["batches"] - before["batches"] == len(batches)
+    assert stats["tokens"] - before["tokens"] == sum(lengths)
+    assert 0 < stats["padding_efficiency"] <= 1
+    # Stats are kept, not logged per call (/query encodes micro-batches)
+    assert "embed_batches" not in capsys.readouterr().out
+
+
+def test_onnx_backend_naming_and_validation():
+    import pytest
+
+    from app.ingest.onnx_backend import backend_tag, load_model, onnx_file_name
+
+    assert backend_tag("torch", "avx2") == "torch"
+    assert backend_tag("onnx", "none") == "onnx"
+    assert backend_tag("onnx", "avx512_vnni") == "onnx-qint8_avx512_vnni"
+    assert onnx_file_name("avx2") == "onnx/model_qint8_avx2.onnx"
+    with pytest.raises(ValueError):
+        backend_tag("onnx", "int4")
+    with pytest.raises(ValueError):
+        load_model(object, "model", backend="tensorrt")
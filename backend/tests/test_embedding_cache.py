@@ -0,0 +1,74 @@
+import uuid
+
+import numpy as np
+
+from app.core.deps import SessionLocal, init_db
+from app.db.models import EmbeddingCache
+from app.ingest.embedding_cache import cache_key, encode_with_cache, prune_embedding_cache
+
+
+class CountingEmbedder:
+    model_name = "counting"
+
+    def __init__(self):
+        # fresh fingerprint so vectors cached by earlier runs don't count as hits
+        self.fingerprint = f"counting|{uuid.uuid4().hex}"
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.asarray([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_only_cache_misses_are_encoded():
+    init_db()
+    embedder = CountingEmbedder()
+    first = encode_with_cache(["alpha cache test", "beta cache test", "alpha cache test"], embedder)
+    assert embedder.encoded == ["alpha cache test", "beta cache test"]
+    second = encode_with_cache(["beta cache test", "gamma cache test"], embedder)
+    assert embedder.encoded[2:] == ["gamma cache test"]
+    assert np.array_equal(second[0], first[1])
+    assert first.shape == (3, 2)
+
+
+def test_vectors_stored_by_a_concurrent_ingest_dont_drop_the_batch():
+    init_db()
+    embedder = CountingEmbedder()
+    encode = embedder.encode
+
+    def racing_encode(texts):
+        # Another ingest writes "shared" between our lookup and our insert
+        encode_with_cache(["shared"], other)
+        return encode(texts)
+
+    other = CountingEmbedder()
+    other.fingerprint = embedder.fingerprint
+    embedder.encode = racing_encode
+    encode_with_cache(["shared", "only mine"], embedder)
+    db = SessionLocal()
+    try:
+        keys = {key for (key,) in db.query(EmbeddingCache.key).all()}
+    finally:
+        db.close()
+    assert keys == {cache_key(embedder.fingerprint, "shared"), cache_key(embedder.fingerprint, "only mine")}
+
+
+def test_prune_drops_vectors_the_rebuild_did_not_use():
+    from datetime import datetime
+
+    init_db()
+    embedder = CountingEmbedder()
+    encode_with_cache(["kept text", "edited away"], embedder)
+    encode_with_cache(["kept text"], CountingEmbedder())  # an earlier model
+
+    # A rebuild looks up every live chunk, which marks its vector as used
+    started = datetime.utcnow()
+    encode_with_cache(["kept text"], embedder)
+    assert embedder.encoded == ["kept text", "edited away"]
+
+    assert prune_embedding_cache(started) == 2
+    db = SessionLocal()
+    try:
+        assert [key for (key,) in db.query(EmbeddingCache.key).all()] == [cache_key(embedder.fingerprint, "kept text")]
+    finally:
+        db.close()
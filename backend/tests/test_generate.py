@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core.config import settings
+from app.rag import generate
+from app.rag.generate import GeminiClient
+
+
+class StandIn:
+    """Local stand-in for the Gemini REST API: scripted status codes, delays and bookkeeping."""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)  # returned before answering 200
+        self.delay = delay
+        self.requests = []
+        self.ports = set()  # client ports seen (one per TCP connection)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stand_in.lock:
+                    stand_in.requests.append((self.path, self.headers.get("x-goog-api-key"), body))
+                    stand_in.ports.add(self.client_address[1])
+                    stand_in.in_flight += 1
+                    stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in.in_flight)
+                    status = stand_in.statuses.pop(0) if stand_in.statuses else 200
+                time.sleep(stand_in.delay)
+                payload = {"error": {"code": status}}
+                if status == 200:
+                    answer = {"answer": "RAG retrieves context first.", "citations": [], "confidence": 0.8}
+                    payload = {
+                        "candidates": [{"content": {"parts": [{"text": "```json\n" + json.dumps(answer) + "\n```"}]}}],
+                        "usageMetadata": {"promptTokenCount": 120, "candidatesTokenCount": 15},
+                    }
+                data = json.dumps(payload).encode()
+                with stand_in.lock:
+                    stand_in.in_flight -= 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_client_retries_and_reuses_connections(monkeypatch):
+    monkeypatch.setattr(settings, "gemini_backoff_base_seconds", 0.01)
+    stand_in = StandIn(statuses=[503, 429])
+
+    async def run():
+        client = GeminiClient("test-key", model="gemini pro", base_url=stand_in.url)
+        try:
+            first = await client.generate_json("What is RAG?")
+            others = [await client.generate_json("What is FAISS?") for _ in range(3)]
+            return client, first, others
+        finally:
+            await client.aclose()
+
+    try:
+        client, first, others = asyncio.run(run())
+    finally:
+        stand_in.close()
+    assert first["answer"] == "RAG retrieves context first."
+    assert first["telemetry"]["tokens_prompt"] == 120 and first["telemetry"]["tokens_completion"] == 15
+    assert all(o["confidence"] == 0.8 for o in others)
+    # Two retried failures, then four answers over one kept-alive connection
+    assert client.stats["retries"] == 2
+    assert len(stand_in.requests) == 6
+    assert len(stand_in.ports) == 1
+    path, key, body = stand_in.requests[0]
+    assert path == "/v1beta/models/gemini-1.5-pro:generateContent"
+    assert key == "test-key"
+    assert body["generationConfig"]["responseMimeType"] == "application/json"
+
+
+def test_client_caps_concurrency_and_enforces_the_deadline(monkeypatch):
+    stand_in = StandIn(delay=0.2)
+
+    async def run():
+        client = GeminiClient("test-key", base_url=stand_in.url, max_concurrency=2)
+        try:
+            answers = await asyncio.gather(*(client.generate_json(f"q{i}") for i in range(5)))
+            t0 = time.perf_counter()
+            try:
+                await client.generate_json("slow", timeout=0.05)
+                timed_out = False
+            except TimeoutError:
+                timed_out = True
+            return answers, timed_out, time.perf_counter() - t0
+        finally:
+            await client.aclose()
+
+    try:
+        answers, timed_out, elapsed = asyncio.run(run())
+    finally:
+        stand_in.close()
+    assert len(answers) == 5
+    assert stand_in.max_in_flight == 2
+    assert timed_out and elapsed < 0.2
+
+
+def test_call_gemini_json_uses_the_shared_client(monkeypatch):
+    stand_in = StandIn(statuses=[400])
+    monkeypatch.setattr(settings, "gemini_api_key", "test-key")
+    monkeypatch.setattr(settings, "gemini_base_url", stand_in.url)
+
+    async def run():
+        client = await generate.start_gemini_client()
+        try:
+            failed = await generate.call_gemini_json("bad request")
+            ok = await generate.call_gemini_json("What is RAG?")
+            return client, failed, ok, generate.get_gemini_client()
+        finally:
+            await generate.close_gemini_client()
+
+    try:
+        client, failed, ok, shared = asyncio.run(run())
+    finally:
+        stand_in.close()
+    # 400 is not retried and comes back as an answer, not an exception
+    assert failed["answer"].startswith("I'm not sure. Error: Gemini API returned 400")
+    assert ok["answer"] == "RAG retrieves context first."
+    assert shared is client and client.stats["calls"] == 2
@@ -0,0 +1,73 @@
+import faiss
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.ingest.index_factory import create_index, search_params
+
+
+def _vectors(n, dim=32):
+    x = np.random.default_rng(0).random((n, dim), dtype=np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+@pytest.mark.parametrize("vector_store", ["faiss", "hnsw", "ivf_flat", "ivf_pq"])
+def test_create_index_types(monkeypatch, vector_store):
+    monkeypatch.setattr(settings, "vector_store", vector_store)
+    monkeypatch.setattr(settings, "ivf_nlist", 8)
+    monkeypatch.setattr(settings, "pq_m", 8)
+    monkeypatch.setattr(settings, "pq_nbits", 6)
+    x = _vectors(2000)
+    index = create_index(x)
+    assert index.ntotal == 2000
+    params = search_params(index, nprobe=8, ef_search=128)
+    D, I = index.search(x[:5], 5, params=params) if params is not None else index.search(x[:5], 5)
+    # IVF-PQ is approximate; the others should find each query vector itself
+    if vector_store != "ivf_pq":
+        assert list(I[:, 0]) == [0, 1, 2, 3, 4]
+
+
+def test_ivf_falls_back_to_flat_for_small_corpus(monkeypatch):
+    monkeypatch.setattr(settings, "vector_store", "ivf_pq")
+    index = create_index(_vectors(10))
+    assert isinstance(index, faiss.IndexFlat)
+    assert search_params(index) is None
+
+
+def test_ondisk_ivf_mmap_roundtrip(monkeypatch, tmp_path):
+    from app.ingest.index_factory import prepare_for_update, read_index, write_index
+
+    monkeypatch.setattr(settings, "vector_store", "ivf_flat")
+    monkeypatch.setattr(settings, "ivf_nlist", 8)
+    monkeypatch.setattr(settings, "ivf_on_disk", True)
+    x = _vectors(1000)
+    path = tmp_path / "faiss.index"
+    write_index(create_index(x), path)
+    assert len(list(tmp_path.glob("faiss.index.*.ivfdata"))) == 1
+
+    live = read_index(path, mmap=True)
+    updated = read_index(path, mmap=False)
+    prepare_for_update(updated, path)
+    updated.add(x[:10])
+    write_index(updated, path)
+
+    # the live reader is untouched by the update; a fresh load sees it
+    assert live.ntotal == 1000
+    assert read_index(path, mmap=True).ntotal == 1010
+    assert len(list(tmp_path.glob("faiss.index.*.ivfdata"))) == 1
+
+
+def test_id_mapped_index_remove_and_replace():
+    from app.ingest.index_factory import is_id_mapped, remove_ids
+
+    x = _vectors(50)
+    ids = np.arange(50, dtype=np.int64) + 1000
+    index = create_index(x, ids)
+    assert is_id_mapped(index)
+    assert remove_ids(index, [1000, 1001])
+    assert index.ntotal == 48
+    index.add_with_ids(x[:1], np.asarray([1000], dtype=np.int64))
+    _, I = index.search(x[:2], 1)
+    assert I[0][0] == 1000
+    assert I[1][0] != 1001
@@ -0,0 +1,246 @@
+from pathlib import Path
+
+from app.core.deps import SessionLocal
+from app.db.crud import find_document
+from app.db.models import Chunk, Document
+from app.ingest.build_index import build
+
+
+def test_build_skips_unchanged_documents(tmp_path):
+    doc = tmp_path / "delta_guide.md"
+    doc.write_text("# Delta\nFirst version of the delta ingestion guide.")
+    first = build([str(tmp_path)], 256, 32, skip_index=True)
+    assert first
+
+    assert build([str(tmp_path)], 256, 32, skip_index=True) == []
+
+    doc.write_text("# Delta\nSecond version of the delta ingestion guide.")
+    third = build([str(tmp_path)], 256, 32, skip_index=True)
+    assert third
+
+    db = SessionLocal()
+    try:
+        row = find_document(db, source=str(doc), title="delta_guide")
+        assert row.revision == 2
+        chunk_ids = [c.id for c in db.query(Chunk).filter(Chunk.doc_id == row.id)]
+        assert sorted(chunk_ids) == sorted(third)
+    finally:
+        db.close()
+
+
+def test_parallel_parse_keeps_order_and_isolates_failures(tmp_path):
+    from app.ingest.parallel import iter_parsed
+
+    tasks = []
+    for i in range(4):
+        p = tmp_path / f"doc{i}.md"
+        p.write_text(f"# Doc {i}\n" + "word " * 40)
+        tasks.append((p, str(p), p.stem))
+    bad = tmp_path / "broken.html"
+    bad.write_text("")  # readability can't parse an empty document
+    tasks.insert(2, (bad, str(bad), bad.stem))
+
+    serial = list(iter_parsed(tasks, 16, 4, workers=1))
+    parallel = list(iter_parsed(tasks, 16, 4, workers=2, max_in_flight=2))
+    assert [t for t, _, _ in parallel] == tasks
+    assert parallel[2][1] is None and parallel[2][2]
+    assert [p["chunks"] for _, p, e in parallel if e is None] == [p["chunks"] for _, p, e in serial if e is None]
+
+
+def test_interrupted_build_resumes_from_checkpoint(tmp_path, monkeypatch):
+    import app.ingest.build_index as build_index
+    from app.core.config import settings
+    from app.ingest.index_factory import read_index
+    from app.rag.meta_store import open_meta_store
+
+    monkeypatch.setattr(settings, "index_path", str(tmp_path / "idx" / "faiss.index"))
+    monkeypatch.setattr(settings, "doc_meta_path", str(tmp_path / "idx" / "meta.bin"))
+    monkeypatch.setattr(settings, "ingest_commit_docs", 1)
+    monkeypatch.setattr(settings, "ingest_batch_chunks", 2)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(3):
+        (docs / f"resume_{i}.md").write_text(f"# Resume {i}\n" + "token " * 30)
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("interrupted")
+
+    real_rebuild = build_index.rebuild_from_database
+    monkeypatch.setattr(build_index, "rebuild_from_database", crash)
+    try:
+        build([str(docs)], 16, 4)
+    except RuntimeError:
+        pass
+    assert build_index.read_checkpoint()["rebuild"] is True
+
+    # Nothing changed on disk, but the index update is still owed
+    monkeypatch.setattr(build_index, "rebuild_from_database", real_rebuild)
+    assert build([str(docs)], 16, 4) == []
+    assert not build_index._checkpoint_path().exists()
+
+    db = SessionLocal()
+    try:
+        expected = [cid for (cid,) in db.query(Chunk.id).order_by(Chunk.id)]
+    finally:
+        db.close()
+    assert read_index(settings.index_path).ntotal == len(expected)
+    assert [m["chunk_id"] for m in open_meta_store(settings.doc_meta_path)] == expected
+
+
+def test_pipelined_build_writes_delta_segment(tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.ingest.pipeline import run_pipeline
+    from app.rag.segments import read_manifest
+    from app.rag.vector_store import StoreManager
+
+    monkeypatch.setattr(settings, "ingest_pipeline", True)
+    monkeypatch.setattr(settings, "ingest_commit_docs", 2)
+    monkeypatch.setattr(settings, "ingest_batch_chunks", 3)
+    monkeypatch.setattr(settings, "ingest_pipeline_queue_size", 1)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(5):
+        (docs / f"pipe_{i}.md").write_text(f"# Pipe {i}\n" + f"pipeline{i} " * 40)
+
+    # No base index yet: the first run builds it from the database
+    assert build([str(docs)], 16, 4) == []
+    assert StoreManager(settings.index_path, settings.doc_meta_path).get().ntotal > 0
+
+    (docs / "pipe_0.md").write_text("# Pipe 0\n" + "rewritten " * 40)
+    (docs / "pipe_5.md").write_text("# Pipe 5\n" + "added " * 40)
+    removed: list = []
+    stats = run_pipeline([str(docs)], 16, 4, removed_chunk_ids=removed)
+    assert stats["docs"] == 2 and stats["unchanged_docs"] == 4 and stats["chunks_removed"] > 0
+    assert len(removed) == stats["chunks_removed"]
+    assert set(stats["stages"]) == {"parse", "db", "embed", "index"}
+    assert stats["stages"]["embed"]["items"] == stats["chunks"]
+    assert stats["bottleneck"] in stats["stages"]
+
+    manifest = read_manifest(Path(settings.index_path))
+    assert [s["ntotal"] for s in manifest["segments"]] == [stats["chunks"]]
+
+    db = SessionLocal()
+    try:
+        new_ids = [
+            cid
+            for (cid,) in db.query(Chunk.id).join(Document).filter(Document.title.in_(["pipe_0", "pipe_5"]))
+        ]
+    finally:
+        db.close()
+    store = StoreManager(settings.index_path, settings.doc_meta_path).get()
+    assert new_ids and all(store.get_meta(cid)["chunk_id"] == cid for cid in new_ids)
+    assert store.search("added", k=1)[0][0] in new_ids
+
+    # skip_index keeps build()'s contract: DB only, new ids returned for the caller to index
+    (docs / "pipe_6.md").write_text("# Pipe 6\n" + "later " * 40)
+    added = build([str(docs)], 16, 4, skip_index=True)
+    assert added and read_manifest(Path(settings.index_path)) == manifest
+
+
+def test_pipeline_publishes_bounded_segments(tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.ingest.pipeline import run_pipeline
+    from app.rag.segments import read_manifest, tombstones
+    from app.rag.vector_store import StoreManager
+
+    monkeypatch.setattr(settings, "ingest_pipeline", True)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(4):
+        (docs / f"bounded_{i}.md").write_text(f"# Bounded {i}\n" + f"bounded{i} " * 40)
+    build([str(docs)], 16, 4)
+
+    # Every commit batch (2 documents) fills a segment: the run publishes as it goes
+    monkeypatch.setattr(settings, "ingest_commit_docs", 2)
+    monkeypatch.setattr(settings, "ingest_segment_vectors", 1)
+    for i in range(4):
+        (docs / f"bounded_{i}.md").write_text(f"# Bounded {i}\n" + f"rewritten{i} " * 40)
+    removed: list = []
+    stats = run_pipeline([str(docs)], 16, 4, removed_chunk_ids=removed)
+    manifest = read_manifest(Path(settings.index_path))
+    assert len(manifest["segments"]) == 2
+    assert sum(seg["ntotal"] for seg in manifest["segments"]) == stats["chunks"]
+    # Each segment carries the tombstones of the chunks its documents replaced
+    tomb = tombstones(manifest)
+    assert set(removed) <= set(tomb)
+    store = StoreManager(settings.index_path, settings.doc_meta_path).get()
+    hits = store.search("rewritten2", k=store.ntotal)
+    assert not set(removed) & {idx for idx, _ in hits}
+    assert len(hits) == stats["chunks"]
+
+
+def test_pipeline_db_stage_releases_the_write_lock_while_parsing_is_slow(tmp_path, monkeypatch, isolated_db):
+    import time
+    from sqlalchemy import create_engine, event
+    import app.ingest.pipeline as pipeline
+    from app.core import deps
+    from app.core.config import settings
+
+    # A short busy timeout turns a write lock held across a parse wait into "database is locked"
+    engine = create_engine(isolated_db.url, connect_args={"check_same_thread": False, "timeout": 0.2})
+    event.listen(engine, "connect", deps.set_sqlite_pragma)
+    deps.SessionLocal.configure(bind=engine)
+    parse = pipeline.iter_parsed
+
+    def slow_parse(*args, **kwargs):
+        # Docs 1-2 are committed and go on to be embedded while doc 3 waits for a slow doc 4
+        for i, item in enumerate(parse(*args, **kwargs)):
+            if i == 3:
+                time.sleep(1.0)
+            yield item
+
+    monkeypatch.setattr(pipeline, "iter_parsed", slow_parse)
+    monkeypatch.setattr(settings, "enable_embedding_cache", True)
+    monkeypatch.setattr(settings, "ingest_commit_docs", 2)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(5):
+        (docs / f"slow_{i}.md").write_text(f"# Slow {i}\n" + f"slowparse{i} " * 30)
+
+    stats = pipeline.run_pipeline([str(docs)], 16, 4)
+    assert stats["docs"] == 5 and stats["stages"]["embed"]["items"] == stats["chunks"]
+    engine.dispose()
+
+
+def test_delete_during_rebuild_stays_deleted(tmp_path, monkeypatch):
+    import app.ingest.build_index as build_index
+    from app.core.config import settings
+    from app.ingest.build_index import delete_document, rebuild_from_database
+    from app.rag.segments import read_manifest
+    from app.rag.vector_store import FaissStore
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(3):
+        (docs / f"rebuild_race_{i}.md").write_text(f"# Race {i}\n" + f"rebuild race document {i} " * 20)
+    build([str(docs)], 64, 8)
+    db = SessionLocal()
+    try:
+        doc = find_document(db, source=str(docs / "rebuild_race_1.md"), title="rebuild_race_1")
+        doc_id = doc.id
+        deleted = {cid for (cid,) in db.query(Chunk.id).filter(Chunk.doc_id == doc_id)}
+    finally:
+        db.close()
+
+    # The scan has already read the document when a DELETE commits
+    real_encode = build_index.encode_with_cache
+    calls = []
+
+    def encode_then_delete(texts, *args, **kwargs):
+        if not calls:
+            assert delete_document(doc_id) == len(deleted)
+        calls.append(len(texts))
+        return real_encode(texts, *args, **kwargs)
+
+    monkeypatch.setattr(settings, "ingest_batch_chunks", 1000)
+    monkeypatch.setattr(build_index, "encode_with_cache", encode_then_delete)
+    rebuild_from_database()
+
+    # The tombstones written after the scan started survive the new base
+    manifest = read_manifest(Path(settings.index_path))
+    assert deleted <= {int(cid) for cid in manifest["tombstones"]}
+    store = FaissStore()
+    hits = store.search("rebuild race document", store.ntotal)
+    ids = [idx for idx, _ in hits]
+    assert ids and not deleted & set(ids)
+    assert len(ids) == len(set(ids))
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from app.ingest.jobs import JobQueue, JobQueueFull, record_stage, report_progress
+
+
+def wait(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_reports_progress_and_stages():
+    queue = JobQueue(max_workers=1, max_pending=4, history=10)
+
+    def work(n):
+        t0 = time.perf_counter()
+        report_progress(docs_total=n)
+        for _ in range(n):
+            report_progress(docs_loaded=1)
+        record_stage("load", t0)
+        return {"done": n}
+
+    job = wait(queue.submit("ingest", work, 3))
+    data = job.to_dict()
+    assert data["status"] == "succeeded"
+    assert data["result"] == {"done": 3}
+    assert data["progress"]["docs_loaded"] == 3
+    assert "load" in data["stages_ms"]
+    assert queue.get(job.id) is job
+    # Outside a job the reporting helpers are no-ops
+    report_progress(docs_loaded=1)
+
+
+def test_failed_job_and_queue_limit():
+    queue = JobQueue(max_workers=1, max_pending=1, history=10)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    job = wait(queue.submit("rebuild", fail))
+    assert job.status == "failed"
+    assert job.error == "boom"
+
+    blocker = queue.submit("rebuild", time.sleep, 0.3)
+    with pytest.raises(JobQueueFull):
+        queue.submit("rebuild", time.sleep, 0)
+    wait(blocker)
+    assert blocker.status == "succeeded"
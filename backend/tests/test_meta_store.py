@@ -0,0 +1,53 @@
+import json
+
+from app.rag.meta_store import MetaStore, convert_jsonl, open_meta_store, write_meta_store
+
+
+def test_write_and_read_columnar(tmp_path):
+    metas = [
+        {"title": "Guide", "source": "a.md", "url": "", "section": "Intro", "position": 0, "chunk_id": 11, "text": "x" * 1000},
+        {"title": "Guide", "source": "a.md", "url": "", "section": "Setup ✓", "position": 1, "chunk_id": 12, "text": "second"},
+    ]
+    path = tmp_path / "meta.bin"
+    assert write_meta_store(path, metas) == 2
+    store = open_meta_store(path)
+    assert isinstance(store, MetaStore)
+    assert len(store) == 2
+    assert store.get(1) == metas[1]
+    assert len(store.get(0)["text"]) == 700
+    assert list(store.chunk_ids) == [11, 12]
+
+
+def test_convert_jsonl(tmp_path):
+    src = tmp_path / "meta.jsonl"
+    src.write_text("".join(json.dumps({"title": f"t{i}", "chunk_id": i, "position": i}) + "\n" for i in range(3)))
+    dst = tmp_path / "meta.bin"
+    assert convert_jsonl(src, dst) == 3
+    assert open_meta_store(dst).get(2)["title"] == "t2"
+
+
+def test_row_of_prefers_newest_duplicate(tmp_path):
+    path = tmp_path / "meta.bin"
+    write_meta_store(path, [{"chunk_id": 3, "title": "a"}, {"chunk_id": 5, "title": "old"}, {"chunk_id": 5, "title": "new"}])
+    store = open_meta_store(path)
+    assert store.get(store.row_of(5))["title"] == "new"
+    assert store.row_of(4) is None
+
+
+def test_store_migrates_legacy_jsonl_on_load(tmp_path):
+    import faiss
+    import numpy as np
+    from app.rag.vector_store import FaissStore
+
+    indices = tmp_path / "indices"
+    indices.mkdir()
+    index = faiss.IndexFlatIP(8)
+    index.add(np.random.rand(3, 8).astype("float32"))
+    faiss.write_index(index, str(indices / "faiss.index"))
+    (indices / "meta.jsonl").write_text("".join(json.dumps({"title": f"t{i}", "chunk_id": i}) + "\n" for i in range(3)))
+
+    # An index from before the columnar format only has meta.jsonl next to it
+    store = FaissStore(str(indices / "faiss.index"), str(indices / "meta.bin"), embedder=object())
+    assert isinstance(store.metas, MetaStore)
+    assert store.get_meta(2)["title"] == "t2"
+    assert sorted(p.name for p in indices.iterdir()) == ["faiss.index", "meta.bin", "meta.jsonl"]
@@ -0,0 +1,91 @@
+import asyncio
+import uuid
+
+import numpy as np
+import pytest
+
+from app.rag.query_embedder import QueryEmbeddingBatcher
+
+
+class RecordingEmbedder:
+    def __init__(self, fail=False):
+        # fresh name so the shared query cache never answers for it
+        self.model_name = f"recording-{uuid.uuid4()}"
+        self.calls = []
+        self.fail = fail
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return np.asarray([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_concurrent_queries_share_one_encode():
+    embedder = RecordingEmbedder()
+    batcher = QueryEmbeddingBatcher(window_ms=20, max_batch=64, embedder=embedder)
+    queries = [f"question {'x' * i}" for i in range(8)] + ["question  x"]  # last one normalizes to a duplicate
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(q) for q in queries))
+
+    vecs = asyncio.run(run())
+    assert len(embedder.calls) == 1 and len(embedder.calls[0]) == 8
+    for q, vec in zip(queries, vecs):
+        assert vec.shape == (1, 2) and vec[0, 0] == len(" ".join(q.split()))
+    assert np.array_equal(vecs[1], vecs[-1])
+
+    # Repeat queries come from the cache
+    asyncio.run(batcher.embed(queries[0]))
+    assert len(embedder.calls) == 1
+    assert batcher.stats_snapshot()["mean_batch"] == 8
+
+
+def test_max_batch_and_errors():
+    embedder = RecordingEmbedder()
+    batcher = QueryEmbeddingBatcher(window_ms=1000, max_batch=3, embedder=embedder)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(f"query {i}") for i in range(6)))
+
+    asyncio.run(run())  # full batches go out without waiting for the window
+    assert [len(c) for c in embedder.calls] == [3, 3]
+
+    failing = QueryEmbeddingBatcher(window_ms=1, embedder=RecordingEmbedder(fail=True))
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing.embed("anything at all"))
+
+
+def test_cold_model_load_does_not_block_the_event_loop(monkeypatch):
+    import time
+    from app.core.config import settings
+    from app.rag import query_embedder
+
+    embedder = RecordingEmbedder()
+    embedder.model_name = settings.embedding_model
+
+    def slow_get_embedder():
+        time.sleep(0.3)  # loading the model
+        return embedder
+
+    monkeypatch.setattr(query_embedder, "get_embedder", slow_get_embedder)
+    batcher = QueryEmbeddingBatcher(window_ms=1)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        vec = await batcher.embed(f"cold load {uuid.uuid4()}")
+        ticker.cancel()
+        return vec, ticks
+
+    vec, ticks = asyncio.run(run())
+    assert vec.shape == (1, 2) and len(embedder.calls) == 1
+    # The loop kept running while the worker thread loaded the model
+    assert ticks >= 10
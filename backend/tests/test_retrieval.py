@@ -8,3 +8,299 @@ def test_build_and_search():
     hits = store.search("What is RAG?", 10)
     assert len(hits) > 0
 
+
+def test_store_manager_hot_reload(tmp_path):
+    import json
+    import faiss
+    import numpy as np
+    from app.rag.vector_store import StoreManager
+
+    def write(n):
+        index = faiss.IndexFlatIP(8)
+        index.add(np.random.rand(n, 8).astype("float32"))
+        faiss.write_index(index, str(tmp_path / "faiss.index"))
+        (tmp_path / "meta.jsonl").write_text("".join(json.dumps({"chunk_id": i}) + "\n" for i in range(n)))
+
+    write(3)
+    manager = StoreManager(str(tmp_path / "faiss.index"), str(tmp_path / "meta.jsonl"), check_interval=0)
+    first = manager.get()
+    assert manager.get() is first
+    write(5)
+    second = manager.get()
+    assert second is not first
+    assert second.index.ntotal == 5
+    assert second.embedder is first.embedder
+
+
+def test_store_searches_segments_with_tombstones(tmp_path):
+    import uuid
+    import numpy as np
+    from app.ingest.index_factory import create_index, write_index
+    from app.rag.meta_store import write_meta_store
+    from app.rag.segments import empty_manifest, segment_paths, write_manifest
+    from app.rag.vector_store import file_stamp
+
+    rng = np.random.default_rng(0)
+    vecs = rng.random((6, 8), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    index_path, meta_path = tmp_path / "faiss.index", tmp_path / "meta.bin"
+
+    # Base: chunks 1-4; segment 1 replaces chunk 3, adds chunk 5 and deletes chunk 2
+    write_index(create_index(vecs[:4], np.arange(1, 5), index_type="flat"), index_path)
+    write_meta_store(meta_path, [{"chunk_id": i, "text": f"base {i}"} for i in range(1, 5)])
+    seg_index, seg_meta = segment_paths(index_path, "seg-000001")
+    write_index(create_index(vecs[4:], np.array([3, 5]), index_type="flat"), seg_index)
+    write_meta_store(seg_meta, [{"chunk_id": 3, "text": "segment 3"}, {"chunk_id": 5, "text": "segment 5"}])
+    manifest = empty_manifest(next_seq=2)
+    manifest["base"] = {"index": list(file_stamp(index_path)), "meta": list(file_stamp(meta_path))}
+    manifest["segments"] = [{"seq": 1, "name": "seg-000001", "ntotal": 2}]
+    manifest["tombstones"] = {"2": 1, "3": 1, "5": 1}
+    write_manifest(index_path, manifest)
+
+    class FixedEmbedder:
+        model_name = f"fixed-{uuid.uuid4()}"
+
+        def encode(self, texts):
+            return vecs[4:5].copy()
+
+    store = FaissStore(str(index_path), str(meta_path), embedder=FixedEmbedder())
+    hits = store.search("anything", 10)
+    ids = [idx for idx, _ in hits]
+    assert sorted(ids) == [1, 3, 4, 5]
+    assert ids[0] == 3
+    assert store.get_meta(3)["text"] == "segment 3"
+    assert store.get_meta(1)["text"] == "base 1"
+
+
+def test_vector_expansion_reads_stored_vectors_from_each_source(tmp_path):
+    import uuid
+    import numpy as np
+    from app.core.config import settings
+    from app.ingest.index_factory import create_index, write_index
+    from app.rag.meta_store import write_meta_store
+    from app.rag.retriever import _expand_query_vector
+    from app.rag.segments import empty_manifest, segment_paths, write_manifest
+    from app.rag.vector_store import file_stamp
+
+    rng = np.random.default_rng(1)
+    vecs = rng.random((5, 8), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    # Chunk 2 lives in the base and is replaced by segment 1; chunk 4 only exists in the segment
+    base = {1: vecs[0], 2: vecs[1], 3: vecs[2]}
+    segment = {2: vecs[3], 4: vecs[4]}
+    vector_of = {**base, **segment}
+    index_path, meta_path = tmp_path / "faiss.index", tmp_path / "meta.bin"
+    write_index(create_index(np.stack(list(base.values())), np.array(list(base)), index_type="flat"), index_path)
+    write_meta_store(meta_path, [{"chunk_id": i} for i in base])
+    seg_index, seg_meta = segment_paths(index_path, "seg-000001")
+    write_index(create_index(np.stack(list(segment.values())), np.array(list(segment)), index_type="flat"), seg_index)
+    write_meta_store(seg_meta, [{"chunk_id": i} for i in segment])
+    manifest = empty_manifest(next_seq=2)
+    manifest["base"] = {"index": list(file_stamp(index_path)), "meta": list(file_stamp(meta_path))}
+    manifest["segments"] = [{"seq": 1, "name": "seg-000001", "ntotal": 2}]
+    manifest["tombstones"] = {"2": 1, "4": 1}
+    write_manifest(index_path, manifest)
+
+    class FixedEmbedder:
+        model_name = f"fixed-{uuid.uuid4()}"
+
+        def encode(self, texts):
+            return vecs[:1].copy()
+
+    store = FaissStore(str(index_path), str(meta_path), embedder=FixedEmbedder())
+    # Stored vectors come back from the source that owns each id, with no model call
+    got, found = store.get_vectors([2, 4, 1, 99])
+    assert found.tolist() == [True, True, True, False]
+    for row, cid in zip(got, [2, 4, 1]):
+        assert np.allclose(row, vector_of[cid])
+
+    q = vecs[:1].copy()
+    hits = store.search("anything", 10)
+    expanded = _expand_query_vector(store, q, hits)
+    top = np.stack([vector_of[idx] for idx, _ in hits[: settings.rocchio_top_n]])
+    want = settings.rocchio_alpha * q[0] + settings.rocchio_beta * top.mean(axis=0)
+    assert expanded.shape == (1, 8)
+    assert np.allclose(expanded[0], want / np.linalg.norm(want), atol=1e-6)
+
+
+def test_unknown_expansion_mode_is_rejected(monkeypatch):
+    import pytest
+    from app.core.config import settings
+    from app.rag.retriever import configured_expansion_mode
+
+    monkeypatch.setattr(settings, "query_expansion_mode", " Vector ")
+    assert configured_expansion_mode() == "vector"
+    monkeypatch.setattr(settings, "query_expansion_mode", "vectors")
+    with pytest.raises(ValueError, match="query_expansion_mode"):
+        configured_expansion_mode()
+
+
+def test_ivf_base_reconstructs_stored_vectors(tmp_path, monkeypatch):
+    import uuid
+    import faiss
+    import numpy as np
+    from app.core.config import settings
+    from app.ingest.index_factory import create_index, remove_ids, write_index
+    from app.rag.meta_store import write_meta_store
+    from app.rag.retriever import _expand_query_vector, _fuse
+
+    monkeypatch.setattr(settings, "ivf_nlist", 4)
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((400, 8)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ids = np.arange(400) + 1000
+    by_id = dict(zip(ids.tolist(), vecs))
+    index_path, meta_path = tmp_path / "faiss.index", tmp_path / "meta.bin"
+    index = create_index(vecs, ids, index_type="ivf_flat")
+    assert faiss.try_extract_index_ivf(index) is not None
+    # IVF can't drop ids in place under an id map; compaction rebuilds instead
+    assert not remove_ids(index, [1000])
+    # Written as older builds did, without a direct map: loading adds one
+    faiss.write_index(index, str(index_path))
+    write_meta_store(meta_path, [{"chunk_id": i, "text": f"chunk {i}"} for i in ids.tolist()])
+
+    class FixedEmbedder:
+        model_name = f"fixed-{uuid.uuid4()}"
+
+        def encode(self, texts):
+            return vecs[:1].copy()
+
+    for _ in range(2):
+        store = FaissStore(str(index_path), str(meta_path), embedder=FixedEmbedder())
+        got, found = store.get_vectors([1005, 1300, 5])
+        assert found.tolist() == [True, True, False]
+        assert np.allclose(got[0], by_id[1005]) and np.allclose(got[1], by_id[1300])
+        # write_index saves the map, so the second load reads it from the file
+        write_index(store.index, index_path)
+
+    q = vecs[:1].copy()
+    hits = store.search("anything", 10)
+    expanded = _expand_query_vector(store, q, hits)
+    top = np.stack([by_id[idx] for idx, _ in hits[: settings.rocchio_top_n]])
+    want = settings.rocchio_alpha * q[0] + settings.rocchio_beta * top.mean(axis=0)
+    assert np.allclose(expanded[0], want / np.linalg.norm(want), atol=1e-6)
+
+    # A lexical-only hit keeps its place in the fusion, scored by cosine similarity
+    lexical_only = next(i for i in ids.tolist() if i not in dict(hits))
+    fused = dict(_fuse(store, q, hits[:2], [(lexical_only, 3.0)], k=3))
+    assert np.isclose(fused[lexical_only], float(by_id[lexical_only] @ q[0]), atol=1e-5)
+
+
+def test_compressed_base_is_rescored_from_exact_vectors(tmp_path, monkeypatch):
+    import faiss
+    import numpy as np
+    from pathlib import Path
+    from app.core.config import settings
+    from app.ingest.build_index import compact_segments, rebuild_from_database
+    from app.ingest.embed import encode_query
+    from app.ingest.index_factory import describe
+    from app.rag.vector_file import VectorFile, vectors_path
+    from app.rag.vector_store import StoreManager
+
+    monkeypatch.setattr(settings, "vector_codec", "sq8")
+    build(["data/raw"], max_chunk_tokens=256, overlap=32)
+    rebuild_from_database()
+
+    store = StoreManager(settings.index_path, settings.doc_meta_path, check_interval=0).get()
+    assert describe(store.index).endswith("SQ8")
+    exact = store.sources[0].exact
+    assert exact is not None and len(exact) == store.index.ntotal
+    hits = store.search("What is RAG?", 5)
+    q = encode_query("What is RAG?", store.embedder)
+    expected = exact.scores(np.asarray([idx for idx, _ in hits]), q)
+    assert np.allclose([score for _, score in hits], expected, atol=1e-5)
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+    # Compaction keeps the exact vectors of every live chunk
+    monkeypatch.setattr(settings, "ingest_pipeline", True)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "codec_extra.md").write_text("# Codec extra\n" + "compressed vectors rescoring " * 20)
+    build([str(docs)], max_chunk_tokens=64, overlap=8)
+    compact_segments()
+    store = StoreManager(settings.index_path, settings.doc_meta_path, check_interval=0).get()
+    live = set(faiss.vector_to_array(faiss.downcast_index(store.index).id_map).tolist())
+    assert set(VectorFile(vectors_path(Path(settings.index_path))).ids.tolist()) == live
+
+
+def test_hybrid_retrieval_finds_exact_identifiers(tmp_path, monkeypatch):
+    import app.rag.retriever as retriever
+    from app.core.config import settings
+    from app.core.deps import SessionLocal
+    from app.db.fts import search_fts
+    from app.db.models import Chunk
+    from app.ingest.build_index import delete_document
+    from app.rag.vector_store import StoreManager
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "sku_errors.md").write_text("# Error codes\nController fault QX-7731-B means the fan tray is unseated.")
+    for i in range(3):
+        (docs / f"filler_{i}.md").write_text(f"# Filler {i}\n" + "general notes about deployment and scaling " * 10)
+    build([str(docs)], max_chunk_tokens=64, overlap=8)
+
+    db = SessionLocal()
+    try:
+        # The FTS triggers indexed the new chunks as build() wrote them
+        lexical = search_fts(db, "what does QX-7731-B mean", 5)
+        target = db.get(Chunk, lexical[0][0])
+        assert "QX-7731-B" in target.text
+        doc_id = target.doc_id
+    finally:
+        db.close()
+
+    manager = StoreManager(settings.index_path, settings.doc_meta_path, check_interval=0)
+    monkeypatch.setattr(retriever, "get_store", manager.get)
+    monkeypatch.setattr(settings, "retrieval_mode", "hybrid")
+    results = retriever.retrieve("what does QX-7731-B mean", k=10, k_final=3)
+    assert target.id in [r["chunk_id"] for r in results]
+    assert all(-1.0 <= r["score"] <= 1.0 + 1e-5 for r in results)
+
+    delete_document(doc_id)
+    db = SessionLocal()
+    try:
+        assert all(cid != target.id for cid, _ in search_fts(db, "QX-7731-B", 5))
+    finally:
+        db.close()
+
+
+def test_chunk_texts_are_cached_until_ingest_rewrites_them(tmp_path, monkeypatch):
+    import app.rag.chunk_text as chunk_text
+    import app.rag.retriever as retriever
+    from app.core.config import settings
+    from app.core.deps import SessionLocal
+    from app.ingest.build_index import add_chunks_to_index
+    from app.rag.vector_store import StoreManager
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    doc = docs / "cached_runbook.md"
+    doc.write_text("# Runbook\nRestart the ingest worker before the nightly window.")
+    build([str(docs)], max_chunk_tokens=64, overlap=8)
+    manager = StoreManager(settings.index_path, settings.doc_meta_path, check_interval=0)
+    monkeypatch.setattr(retriever, "get_store", manager.get)
+    chunk_text.invalidate_chunk_texts()
+
+    first = retriever.retrieve("restart the ingest worker", k=5, k_final=1)
+    assert "nightly window" in first[0]["text"]
+
+    # Hot chunks are served without touching SQLite
+    def no_db():
+        raise AssertionError("chunk text should come from the cache")
+
+    monkeypatch.setattr(chunk_text, "SessionLocal", no_db)
+    assert retriever.retrieve("restart the ingest worker", k=5, k_final=1)[0]["text"] == first[0]["text"]
+    monkeypatch.setattr(chunk_text, "SessionLocal", SessionLocal)
+
+    # Rewriting the document invalidates its old chunk ids when the change is published
+    doc.write_text("# Runbook\nRestart the ingest worker after the morning window.")
+    removed: list = []
+    added = build([str(docs)], 64, 8, skip_index=True, removed_chunk_ids=removed)
+    db = SessionLocal()
+    try:
+        add_chunks_to_index(added, db, removed)
+    finally:
+        db.close()
+    assert all(chunk_text.chunk_text_cache.get(cid) is None for cid in removed)
+    second = retriever.retrieve("restart the ingest worker", k=5, k_final=1)
+    assert "morning window" in second[0]["text"]
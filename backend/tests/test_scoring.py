@@ -0,0 +1,44 @@
+import uuid
+
+import app.rag.scoring as scoring
+from app.core.config import settings
+
+
+class RecordingCrossEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=None):
+        self.calls.append((list(pairs), batch_size))
+        # Longer passages score higher
+        return [float(len(passage)) for _, passage in pairs]
+
+
+def _results(n):
+    return [
+        {"rank": i + 1, "score": 1.0 - i / 100, "chunk_id": 1000 + i, "title": f"t{i}", "section": "", "text": "x" * (i + 1)}
+        for i in range(n)
+    ]
+
+
+def test_rerank_scores_chunk_text_with_cache_and_cap(monkeypatch):
+    model = RecordingCrossEncoder()
+    monkeypatch.setattr(scoring, "_cross_encoder", model)
+    monkeypatch.setattr(settings, "reranker_max_pairs", 4)
+    monkeypatch.setattr(settings, "reranker_batch_size", 2)
+    query = f"rerank test {uuid.uuid4()}"
+
+    out = scoring.rerank(query, _results(6), top_k=5)
+    pairs, batch_size = model.calls[0]
+    assert batch_size == 2
+    assert [passage for _, passage in pairs] == ["x", "xx", "xxx", "xxxx"]  # chunk text, capped at 4
+    assert [r["chunk_id"] for r in out] == [1003, 1002, 1001, 1000, 1004]
+    assert [r["rank"] for r in out] == [1, 2, 3, 4, 5]
+
+    # Same query again (and a paged/overlapping one): cached pairs are not re-scored
+    scoring.rerank(query, _results(6), top_k=5)
+    assert len(model.calls) == 1
+    changed = _results(6)
+    changed[0]["text"] = "edited chunk text"
+    scoring.rerank(" ".join(query.split()) + " ", changed, top_k=3)
+    assert [passage for _, passage in model.calls[1][0]] == ["edited chunk text"]
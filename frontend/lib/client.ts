@@ -46,10 +46,36 @@ export function useQueryApi(options?: UseMutationOptions<QueryResponse, Error, Q
   });
 }
 
+export type IngestJob<T = any> = {
+  job_id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: { docs_total: number; docs_loaded: number; docs_unchanged: number; chunks_embedded: number; vectors_indexed: number };
+  stages_ms: Record<string, number>;
+  latency_ms: number | null;
+  result: T | null;
+  error: string | null;
+};
+
+type JobAccepted = { status: string; job_id: string; status_url: string };
+
+// Ingest endpoints queue a background job; poll it until it finishes and return its result
+export async function waitForJob<T>(jobId: string, intervalMs = 1000): Promise<T> {
+  for (;;) {
+    const job = await api<IngestJob<T>>(`/ingest/jobs/${jobId}`);
+    if (job.status === 'succeeded') return job.result as T;
+    if (job.status === 'failed') throw new Error(job.error || 'Ingest job failed');
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export function useIngest() {
   return useMutation<{ status: string }, Error, { paths: string[]; max_chunk_tokens?: number; overlap?: number }>({
     mutationKey: ['ingest'],
-    mutationFn: (body) => api('/ingest', { method: 'POST', body: JSON.stringify(body) }),
+    mutationFn: async (body) => {
+      const accepted = await api<JobAccepted>('/ingest', { method: 'POST', body: JSON.stringify(body) });
+      return waitForJob<{ status: string }>(accepted.job_id);
+    },
   });
 }
 
@@ -92,7 +118,8 @@ export function useIngestUpload() {
           const errorText = await res.text().catch(() => 'Unknown error');
           throw new Error(`HTTP ${res.status}: ${errorText}`);
         }
-        return res.json();
+        const accepted: JobAccepted = await res.json();
+        return waitForJob<IngestUploadResponse>(accepted.job_id);
       } catch (error) {
         if (error instanceof TypeError && error.message.includes('fetch')) {
           throw new Error(`Cannot connect to backend at ${API_BASE}/ingest/upload. Make sure the backend server is running on port 8000.`);